@@ -1,14 +1,30 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory, abort
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, abort, g
 import json
 import pandas as pd
 import numpy as np
 import logging
 from datetime import datetime
-import re
+from functools import partial
+from itertools import islice
 from werkzeug.utils import secure_filename
+import hmac
+import math
 import os
+import time
+
+import batch
+import encoding
+import export
+import metrics
+from dataset import DatasetHolder
+from features import COORDINATE_DECIMALS, METER_PROPERTIES, located_rows, meter_features, meter_info
+from pagination import PageRequest, feature_order
+from response_cache import top_queries
+from validation import ISSUES
 
 app = Flask(__name__)
+# orjson for jsonify when it is installed (see encoding.py)
+app.json = encoding.JSONProvider(app)
 
 def sanitize_for_json(value):
     """Convert NaN, None, and numpy types to JSON-safe values"""
@@ -33,78 +49,63 @@ def sanitize_dict_for_json(data):
     else:
         return sanitize_for_json(data)
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Setup logging; LOG_LEVEL=DEBUG brings back the per-request debug lines,
+# whose arguments are only formatted when that level is enabled
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 # ============ DATA LOADING AND PREPROCESSING ============
 
-# Load JSON files once at startup
-with open('data.json', 'r', encoding='utf-8') as file:
-    data = json.load(file)
-
-with open('trafostanica_data.json', 'r', encoding='utf-8') as file:
-    trafostanica_data = json.load(file)
-
-with open('rastavljac_data.json', 'r', encoding='utf-8') as f:
-    rastavljac_data = json.load(f)
-
-# Create dictionaries for quick lookup
-sifra_to_coordinates = {
-    feature['properties']['SIFRA']: feature['geometry']['coordinates']
-    for feature in data['features']
-    if 'geometry' in feature and 'coordinates' in feature['geometry']
-}
-
-# Read and process the Excel file
-df = pd.read_excel('EP_Eksport_Uredjaja.xlsx', sheet_name='Eksport_uredjaja', skiprows=6)
-df = df.rename(columns=lambda x: x.strip())
-df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-df = df[~(df.duplicated(subset='Šifra') & df['Naziv TS'].isnull())]
-df['Serijski'] = df['Serijski'].astype(int)
-df['Šifra'] = df['Šifra'].astype(int)
-df = df.drop_duplicates(subset=['Serijski', 'Šifra'])
-
-# Create optimized mappings
-serijski_broj_to_sifra = dict(zip(df['Serijski'], df['Šifra']))
-sifra_to_row = {row['Šifra']: row for _, row in df.iterrows()}
-
-# Customer search mapping
-kupac_to_info = (
-    df.groupby('Kupac')
-    .apply(lambda x: x[['Serijski', 'Adresa', 'Šifra']].to_dict('records'))
-    .reset_index(name='info')
-    .set_index('Kupac')['info']
-    .to_dict()
-)
-
-# Trafostanica mapping
-trafostanica_to_info = {
-    feature['properties']['NAZIV']: {
-        "coordinates": feature['geometry']['coordinates'],
-        "naziv": feature['properties']['NAZIV'],
-        "snaga": feature['properties']['SNAGA'],
-        "broj_transformatora": feature['properties']['BR_TRANSFORMATORA'],
-        "konfiguracija_SN_postrojenja": feature['properties']['CONF_SN_POST'],
-        "napojna_trafostanica": feature['properties']['NAPOJNA_TS'],
-        "naziv_SN_odlaza": feature['properties']['ODLAZ_SN_NAZIV'],
-        "tip_trafostanice": feature['properties']['TIP_TS'],
-        "poslovnica": feature['properties']['POSLOVNICA'],
-        "tip_kucista": feature['properties']['TS_GD'],
-        "tip_izolacije": feature['properties']['TS_SN_POST'],
-        "vlasnik": feature['properties']['VLASNIK'],
-        "godina_izgradnje": feature['properties']['GODINA_IZGRADNJE'],
-    }
-    for feature in trafostanica_data['features']
-    if 'geometry' in feature and 'coordinates' in feature['geometry']
-}
+# The compiled snapshot and every index built from it (see dataset.py); the
+# snapshot is rebuilt from the Excel and GeoJSON sources first if any changed
+datasets = DatasetHolder(app.json.dumps)
+
+# Pick up new exports without a restart; 0 disables the watcher.  When
+# gunicorn preloads the app the workers start it after forking instead
+WATCH_INTERVAL = float(os.environ.get('DATASET_WATCH_INTERVAL', '60'))
+if not os.environ.get('DATASET_PRELOADED'):
+    datasets.watch(WATCH_INTERVAL)
+
+# Every worker checks this often whether another one switched to a new
+# snapshot (e.g. after an admin reload) and follows; 0 disables it
+SYNC_INTERVAL = float(os.environ.get('DATASET_SYNC_INTERVAL', '1'))
+
+# Shared secret for the admin endpoints; they are disabled without one
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+@app.before_request
+def pin_dataset():
+    datasets.follow(SYNC_INTERVAL)
+    # A request keeps the dataset it started with, even across a reload
+    g.data = datasets.current
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies are still being produced here, so their time is the
+    # time to the first byte and their size is not known
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.started, route=route,
+                                    method=request.method, status=response.status_code)
+    if not response.is_streamed:
+        metrics.RESPONSE_BYTES.observe(response.content_length or 0, route=route)
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Registered last so it runs first: the metrics see the bytes sent
+    return encoding.gzip_response(request, response)
 
 # ============ UTILITY FUNCTIONS ============
 
 def find_coordinates_by_sifra(sifra):
-    return sifra_to_coordinates.get(sifra)
+    coordinates = g.data.sifra_to_coordinates.get(sifra)
+    metrics.lookup('sifra_coordinates', coordinates is not None)
+    return coordinates
 
 def find_sifra_by_serijski_broj(serijski_broj):
-    return serijski_broj_to_sifra.get(serijski_broj)
+    sifra = g.data.meter_store.sifra_for_serijski(serijski_broj)
+    metrics.lookup('serijski_sifra', sifra is not None)
+    return sifra
 
 def create_google_maps_url(coordinates):
     lon, lat = coordinates
@@ -126,26 +127,175 @@ def convert_to_native_types(value):
     return value
 
 def get_additional_info(sifra):
-    """Get additional info from DataFrame by sifra."""
-    row = sifra_to_row.get(sifra)
+    """Get additional info from the meter store by sifra."""
+    row = g.data.meter_store.row_for_sifra(sifra)
+    metrics.lookup('sifra_meter', row is not None)
     if row is None:
         return None
     
-    info = {
-        "Tip brojila": convert_to_native_types(row['Tip']),
-        "Godina proizvodnje": format_date(row['Proizvodnj']),
-        "Godina baždarenja": format_date(row['Baždarenje']),
-        "Datum montaže": format_date(row['Datum žc']),
-        "Serijski broj brojila": convert_to_native_types(row['Serijski']),
-        "Kupac": convert_to_native_types(row['Kupac']),
-        "Adresa": convert_to_native_types(row['Adresa']),
-        "Šifra mjernog mjesta": convert_to_native_types(row['Šifra']),
-        "Tarifna grupa": convert_to_native_types(row['T']),
-        "Angažovana snaga": convert_to_native_types(row['A.sn']),
-        "Naziv trafostanice": convert_to_native_types(row['Naziv TS'])
+    return meter_info(g.data.meter_store, [row])[0]
+
+# Properties of the trafostanica markers
+TRAFOSTANICA_PROPERTIES = ('naziv', 'snaga')
+
+def trafostanice_naziv(feature):
+    return feature['properties']['naziv']
+
+def trafostanice_markers():
+    """all_trafostanice_payload() and its order by naziv, built once per dataset."""
+    def build():
+        payload = all_trafostanice_payload()
+        return payload, feature_order(payload['features'], trafostanice_naziv)
+    return g.data.memo('trafostanice_markers', build)
+
+def all_trafostanice_payload():
+    """All trafostanica markers and their centroid; served from the response cache."""
+    features = []
+    for feature in g.data.trafostanica_data['features']:
+        if ('geometry' in feature and 
+            'coordinates' in feature['geometry'] and 
+            'properties' in feature):
+            
+            coords = [round(c, COORDINATE_DECIMALS) for c in feature['geometry']['coordinates']]
+            properties = feature['properties']
+            
+            # Sanitize as you build
+            features.append({
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': coords
+                },
+                'properties': {
+                    'naziv': sanitize_for_json(properties.get('NAZIV', 'N/A')),
+                    'snaga': sanitize_for_json(properties.get('SNAGA', 'N/A'))
+                }
+            })
+    
+    if features:
+        lats = [f['geometry']['coordinates'][1] for f in features]
+        lons = [f['geometry']['coordinates'][0] for f in features]
+        center = [sum(lats)/len(lats), sum(lons)/len(lons)]
+    else:
+        center = [43.343, 17.807]
+    
+    return {
+        "features": features,
+        "center": center,
+        "total": len(features)
     }
+
+def float_arg(name, default=None):
+    """A finite float request arg; KeyError if missing without a default,
+    ValueError if it is not a number or is nan or inf."""
+    value = float(request.args[name] if default is None else request.args.get(name, default))
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number")
+    return value
+
+def request_bbox():
+    """(west, south, east, north) from the request args, or None if not given."""
+    names = ('west', 'south', 'east', 'north')
+    if not any(name in request.args for name in names):
+        return None
+    return tuple(float_arg(name) for name in names)
+
+def quality_counts(rows):
+    """Data-quality issue counts of the meters behind a response (see validation.py)."""
+    return g.data.quality.counts(rows)
+
+def clustered_response(rows, not_found, quality):
+    """Clusters of the located rows for the zoom 'z' and optional bbox args.
+
+    Responses stay about as large as the viewport in cluster cells, however
+    many meters the group has.  quality are the issue counts of the group.
+    """
+    try:
+        zoom = int(request.args['z'])
+        bbox = request_bbox()
+    except (KeyError, ValueError):
+        return jsonify({"error": "Invalid z, west, south, east or north parameter"}), 400
+    
+    if not len(rows):
+        return jsonify({"error": not_found, "quality": quality}), 404
     
-    return info
+    clusters, features = g.data.meter_clusters.cluster(rows, zoom, bbox)
+    bounds = g.data.meter_clusters.bounds(rows)
+    return jsonify({
+        "clusters": clusters,
+        "features": features,
+        "bounds": bounds,
+        "center": [(bounds[0][0] + bounds[1][0]) / 2, (bounds[0][1] + bounds[1][1]) / 2],
+        "total": len(rows),
+        "quality": quality
+    })
+
+def meter_collection(rows):
+    """Map payload of the located meters among rows as JSON bytes, None if there are none."""
+    return encoding.feature_collection(g.data.meter_store, rows, METER_PROPERTIES,
+                                       {"quality": quality_counts(rows)})
+
+def compact_dumps(payload):
+    return app.json.dumps(payload, separators=(',', ':'))
+
+def page_request():
+    """PageRequest of the request args; raises ValueError for invalid ones."""
+    return PageRequest.from_args(request.args)
+
+def paged_meter_response(rows, page, not_found):
+    """One page, or a stream, of the located rows in Šifra order."""
+    store = g.data.meter_store
+    quality = quality_counts(rows)
+    rows = located_rows(store, rows)
+    if not len(rows):
+        return jsonify({"error": not_found, "quality": quality}), 404
+    
+    try:
+        properties = page.select(METER_PROPERTIES)
+        sifra = store.sifra[rows]
+        order = np.lexsort((rows, sifra))
+        rows, sifra = rows[order], sifra[order]
+        start, end, next_cursor = page.window(sifra, rows)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if page.format:
+        return page.stream(rows[start:end], partial(meter_features, store, properties=properties),
+                           compact_dumps)
+    
+    # Same center as the full response: the first meter in export order, rounded alike
+    first = np.round(store.coordinates[rows.min()], COORDINATE_DECIMALS).tolist()
+    return jsonify({
+        "features": meter_features(store, rows[start:end], properties),
+        "center": [first[1], first[0]],
+        "total": len(rows),
+        "quality": quality,
+        "next_cursor": next_cursor
+    })
+
+def paged_feature_response(features, key, page, extra, properties, ordering=None):
+    """One page, or a stream, of GeoJSON features ordered by key(feature).
+
+    properties are the names the layer has, the only ones fields= may ask for.
+    ordering is feature_order(features, key) when the caller keeps it.
+    """
+    try:
+        page.check_fields(properties)
+        keys, positions, order = ordering or feature_order(features, key)
+        start, end, next_cursor = page.window(keys, positions)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if page.format:
+        return page.stream(order[start:end], lambda chunk: [page.trim(features[i]) for i in chunk],
+                           compact_dumps)
+    
+    return jsonify({
+        **extra,
+        "features": [page.trim(features[i]) for i in order[start:end]],
+        "total": len(features),
+        "next_cursor": next_cursor
+    })
 
 # ============ ROUTES ============
 
@@ -156,7 +306,7 @@ def index():
 @app.route('/get_coordinates_by_sifra', methods=['POST'])
 def get_coordinates_by_sifra():
     sifra = request.form.get('sifra')
-    app.logger.debug(f"Received SIFRA: {sifra}")
+    app.logger.debug("Received SIFRA: %s", sifra)
     
     if not sifra:
         return jsonify({"error": "Šifra nije pronađena, provjerite tačnost unesenih podataka."}), 404
@@ -185,7 +335,7 @@ def get_coordinates_by_sifra():
 @app.route('/get_coordinates_by_serijski_broj', methods=['POST'])
 def get_coordinates_by_serijski_broj():
     serijski_broj = request.form.get('serijski_broj')
-    app.logger.debug(f"Received SERIJSKI_BROJ: {serijski_broj}")
+    app.logger.debug("Received SERIJSKI_BROJ: %s", serijski_broj)
     
     if not serijski_broj:
         return jsonify({"error": "Serijski broj nije pronađen, provjerite tačnost unesenih podataka."}), 404
@@ -220,15 +370,19 @@ def get_customer_suggestions():
     if len(kupac_input) < 3:
         return jsonify([])
 
-    pattern = re.compile(re.escape(kupac_input), re.IGNORECASE)
-    suggestions = []
+    data = g.data
 
-    for kupac, info_list in kupac_to_info.items():
-        if pattern.search(kupac):
-            for record in info_list:
-                suggestions.append(f"{kupac} ({record['Serijski']}, {record['Adresa']})")
+    def iter_suggestions():
+        # Customers containing the input, names starting with it first
+        for i in data.kupac_index.iter_matches(kupac_input, limit=10):
+            kupac = data.kupac_index.keys[i]
+            for row in data.kupac_to_rows[kupac]:
+                yield f"{kupac} ({data.meter_store.value('Serijski', row)}, {data.meter_store.value('Adresa', row)})"
     
-    return jsonify(suggestions[:10])
+    # The matches only depend on the normalized input
+    return data.response_cache.query_response(
+        ('customer_suggestions', data.kupac_index.normalize(kupac_input)),
+        lambda: list(islice(iter_suggestions(), 10)))
 
 
 
@@ -241,7 +395,7 @@ def get_coordinates_by_kupac():
     if not (kupac_input and serijski_input):
         return jsonify({"error": "Kupac ili serijski broj nije pronađen u bazi podataka."}), 404
     
-    if kupac_input not in kupac_to_info:
+    if kupac_input not in g.data.kupac_to_rows:
         return jsonify({"error": "Kupac nije pronađen u bazi podataka."}), 404
     
     try:
@@ -266,16 +420,12 @@ def get_coordinates_by_kupac():
 
 @app.route('/get_oh_values_by_oj/<oj_value>', methods=['GET'])
 def get_oh_values_by_oj(oj_value):
-    app.logger.debug(f"get_oh_values_by_oj called with oj_value: {oj_value}")
+    app.logger.debug("get_oh_values_by_oj called with oj_value: %s", oj_value)
     
     try:
-        if oj_value == "303":
-            filtered_df = df[df['OJ'].isin([3031, 3032])]
-        else:
-            filtered_df = df[df['OJ'] == int(oj_value)]
-        
-        unique_oh_values = sorted(filtered_df['OH'].unique().tolist())
-        return jsonify(unique_oh_values)
+        groups = g.data.meter_groups
+        return g.data.response_cache.query_response(
+            ('oh_values', groups.oj_key(oj_value)), lambda: groups.oh_values(oj_value))
     except Exception as e:
         app.logger.error(f"Error in get_oh_values_by_oj: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -288,49 +438,35 @@ def search_by_oj_oh():
     if not oj_value or not oh_value:
         return jsonify({"error": "Missing oj or oh parameter"}), 400
     
-    app.logger.debug(f"search_by_oj_oh: oj={oj_value}, oh={oh_value}")
+    app.logger.debug("search_by_oj_oh: oj=%s, oh=%s", oj_value, oh_value)
     
     try:
-        if oj_value == "303":
-            filtered_df = df[(df['OJ'].isin([3031, 3032])) & (df['OH'] == oh_value)]
-        else:
-            filtered_df = df[(df['OJ'] == int(oj_value)) & (df['OH'] == oh_value)]
-        
-        features = []
-        for _, row in filtered_df.iterrows():
-            sifra = row['Šifra']
-            coordinates = find_coordinates_by_sifra(sifra)
-            
-            if coordinates:
-                # Sanitize EACH value as you create the dictionary
-                features.append({
-                    'geometry': {
-                        'coordinates': coordinates,
-                        'type': 'Point'
-                    },
-                    'properties': {
-                        'IME_PREZIME': sanitize_for_json(row['Kupac']),
-                        'ADRESA_MM': sanitize_for_json(row['Adresa']),
-                        'SIFRA': sanitize_for_json(sifra),
-                        'SERIJSKI': sanitize_for_json(row['Serijski']),
-                        'TIP': sanitize_for_json(row['Tip']),
-                        'ROH': sanitize_for_json(row['ROH']),
-                        'ANG_SNAGA': sanitize_for_json(row['A.sn'])  # THIS was the problem
-                    },
-                    'type': 'Feature'
-                })
-        
-        if not features:
-            return jsonify({"error": "No features found for this combination"}), 404
-        
-        center = [features[0]['geometry']['coordinates'][1], features[0]['geometry']['coordinates'][0]]
-        
-        # Now you can just return directly, no need to sanitize again
-        return jsonify({
-            "features": features,
-            "center": center,
-            "total": len(features)
-        })
+        page = page_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        if page.active:
+            return paged_meter_response(
+                g.data.meter_groups.rows_for_oj_oh(oj_value, oh_value), page,
+                "No features found for this combination")
+        
+        groups = g.data.meter_groups
+        rows = groups.rows_for_oj_oh(oj_value, oh_value)
+        if 'z' in request.args:
+            return clustered_response(
+                g.data.meter_clusters.rows_for_oj_oh(oj_value, oh_value),
+                "No features found for this combination", quality_counts(rows))
+        
+        response = g.data.response_cache.query_response(
+            ('search_by_oj_oh', groups.oj_key(oj_value), oh_value), lambda: meter_collection(rows))
+        
+        if response is None:
+            # The group may exist with none of its meters located
+            return jsonify({"error": "No features found for this combination",
+                            "quality": quality_counts(rows)}), 404
+        
+        return response
     
     except Exception as e:
         app.logger.error(f"Error in search_by_oj_oh: {str(e)}")
@@ -340,10 +476,10 @@ def search_by_oj_oh():
 def get_trafostanica_data():
     trafostanica = request.json.get('trafostanica', '').strip()
     
-    if trafostanica not in trafostanica_to_info:
+    if trafostanica not in g.data.trafostanica_to_info:
         return jsonify({"error": "Trafostanica nije pronađena u bazi podataka."}), 404
     
-    info = trafostanica_to_info[trafostanica]
+    info = g.data.trafostanica_to_info[trafostanica]
     coordinates = info["coordinates"]
     
     return jsonify({
@@ -354,21 +490,15 @@ def get_trafostanica_data():
 @app.route('/get_trafostanica_suggestions', methods=['POST'])
 def get_trafostanica_suggestions():
     try:
-        user_input = request.form.get('input', '').strip().lower()
+        user_input = request.form.get('input', '').strip()
         
         if len(user_input) < 3:
             return jsonify({'suggestions': []})
         
-        pattern = re.compile(f'.*{re.escape(user_input)}.*', re.IGNORECASE)
-        matches = [
-            feature['properties']['NAZIV']
-            for feature in trafostanica_data['features']
-            if 'properties' in feature 
-            and 'NAZIV' in feature['properties']
-            and pattern.search(feature['properties']['NAZIV'])
-        ]
-        
-        return jsonify({'suggestions': matches[:10]})
+        index = g.data.trafostanica_index
+        return g.data.response_cache.query_response(
+            ('trafostanica_suggestions', index.normalize(user_input)),
+            lambda: {'suggestions': index.search(user_input, 10)})
     except Exception as e:
         app.logger.error(f"Error in get_trafostanica_suggestions: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -376,41 +506,19 @@ def get_trafostanica_suggestions():
 @app.route('/view_all_trafostanice', methods=['GET'])
 def view_all_trafostanice():
     try:
-        features = []
-        for feature in trafostanica_data['features']:
-            if ('geometry' in feature and 
-                'coordinates' in feature['geometry'] and 
-                'properties' in feature):
-                
-                coords = feature['geometry']['coordinates']
-                properties = feature['properties']
-                
-                # Sanitize as you build
-                features.append({
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'Point',
-                        'coordinates': coords
-                    },
-                    'properties': {
-                        'naziv': sanitize_for_json(properties.get('NAZIV', 'N/A')),
-                        'snaga': sanitize_for_json(properties.get('SNAGA', 'N/A'))
-                    }
-                })
-        
-        if features:
-            lats = [f['geometry']['coordinates'][1] for f in features]
-            lons = [f['geometry']['coordinates'][0] for f in features]
-            center = [sum(lats)/len(lats), sum(lons)/len(lons)]
-        else:
-            center = [43.343, 17.807]
-        
-        return jsonify({
-            "features": features,
-            "center": center,
-            "total": len(features)
-        })
+        page = page_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    try:
+        if page.active:
+            payload, ordering = trafostanice_markers()
+            return paged_feature_response(
+                payload['features'], trafostanice_naziv, page,
+                {"center": payload['center']}, TRAFOSTANICA_PROPERTIES, ordering)
+        
+        return g.data.response_cache.response('view_all_trafostanice',
+                                              lambda: trafostanice_markers()[0])
     except Exception as e:
         app.logger.error(f"Error generating trafostanica data: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -418,18 +526,18 @@ def view_all_trafostanice():
 @app.route('/get_ts_naziv_values', methods=['GET'])
 def get_ts_naziv_values():
     try:
-        search_term = request.args.get('search', '').lower()
+        search_term = request.args.get('search', '')
         
-        # Get unique TS names from DataFrame, not JSON
-        ts_naziv_values = df['Naziv TS'].dropna().unique().tolist()
+        # Unique TS names from the meter export (not JSON), already sorted
+        if not search_term:
+            return g.data.response_cache.response('ts_naziv_values', lambda: g.data.meter_groups.ts_names)
         
-        if search_term:
-            ts_naziv_values = [
-                ts for ts in ts_naziv_values 
-                if search_term in ts.lower()
-            ]
+        # All matching names, kept in alphabetical order
+        ts_naziv_values = [
+            g.data.ts_naziv_index.keys[i] for i in sorted(g.data.ts_naziv_index.iter_matches(search_term))
+        ]
         
-        return jsonify(sorted(ts_naziv_values))
+        return jsonify(ts_naziv_values)
     except Exception as e:
         app.logger.error(f"Error in get_ts_naziv_values: {str(e)}")
         return jsonify({"error": "An error occurred while processing TS_NAZIV values."}), 500
@@ -441,57 +549,42 @@ def filter_data_by_ts_naziv():
     if not ts_naziv:
         return jsonify({"error": "Missing ts_naziv parameter"}), 400
     
-    app.logger.debug(f"filter_data_by_ts_naziv called with ts_naziv: {ts_naziv}")
+    app.logger.debug("filter_data_by_ts_naziv called with ts_naziv: %s", ts_naziv)
     
     try:
-        # Filter DataFrame by exact match of Naziv TS
-        filtered_df = df[df['Naziv TS'] == ts_naziv]
-        app.logger.debug(f"Filtered DataFrame shape: {filtered_df.shape}")
-        
-        if filtered_df.empty:
-            # Try case-insensitive match as fallback
-            filtered_df = df[df['Naziv TS'].str.lower() == ts_naziv.lower()]
-            app.logger.debug(f"Case-insensitive match shape: {filtered_df.shape}")
-        
-        if filtered_df.empty:
+        page = page_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        if page.active:
+            return paged_meter_response(
+                g.data.meter_groups.rows_for_ts(ts_naziv), page,
+                "No coordinates found for meters in this TS")
+        
+        if 'z' in request.args:
+            return clustered_response(
+                g.data.meter_clusters.rows_for_ts(ts_naziv),
+                "No coordinates found for meters in this TS",
+                quality_counts(g.data.meter_groups.rows_for_ts(ts_naziv)))
+        
+        # Exact match of Naziv TS, case-insensitive match as fallback
+        groups = g.data.meter_groups
+        rows = groups.rows_for_ts(ts_naziv)
+        metrics.lookup('ts_naziv_rows', len(rows) > 0)
+        app.logger.debug("Filtered rows: %s", len(rows))
+        
+        if not len(rows):
             return jsonify({"error": "No features found for this TS_NAZIV"}), 404
         
-        features = []
-        for _, row in filtered_df.iterrows():
-            sifra = row['Šifra']
-            coordinates = find_coordinates_by_sifra(sifra)
-            
-            if coordinates:
-                # Sanitize EACH value as you create the dictionary
-                features.append({
-                    'geometry': {
-                        'coordinates': coordinates,
-                        'type': 'Point'
-                    },
-                    'properties': {
-                        'IME_PREZIME': sanitize_for_json(row['Kupac']),
-                        'ADRESA_MM': sanitize_for_json(row['Adresa']),
-                        'SIFRA': sanitize_for_json(sifra),
-                        'SERIJSKI': sanitize_for_json(row['Serijski']),
-                        'TIP': sanitize_for_json(row['Tip']),
-                        'ANG_SNAGA': sanitize_for_json(row['A.sn'])  # THIS was the problem
-                    },
-                    'type': 'Feature'
-                })
-        
-        if not features:
-            return jsonify({"error": "No coordinates found for meters in this TS"}), 404
+        response = g.data.response_cache.query_response(
+            ('filter_data_by_ts_naziv', groups.ts_key(ts_naziv)), lambda: meter_collection(rows))
         
-        center = [
-            features[0]['geometry']['coordinates'][1],
-            features[0]['geometry']['coordinates'][0]
-        ]
+        if response is None:
+            return jsonify({"error": "No coordinates found for meters in this TS",
+                            "quality": quality_counts(rows)}), 404
         
-        return jsonify({
-            "features": features,
-            "center": center,
-            "total": len(features)
-        })
+        return response
         
     except Exception as e:
         app.logger.error(f"Error in filter_data_by_ts_naziv: {str(e)}", exc_info=True)
@@ -500,64 +593,44 @@ def filter_data_by_ts_naziv():
 @app.route('/get_rastavljac_suggestions', methods=['POST'])
 def get_rastavljac_suggestions():
     try:
-        input_value = request.form.get('input', '').strip().lower()
+        input_value = request.form.get('input', '').strip()
         
         if len(input_value) < 3:
             return jsonify({"suggestions": []})
         
-        suggestions = set()
-        for feature in rastavljac_data.get('features', []):
-            props = feature.get('properties', {})
-            candidates = [
-                props.get('NTS_NAZIV'),
-                props.get('SIFRA'),
-                props.get('SNO_NAZIV'),
-                props.get('DSN_NAZIV')
-            ]
-            
-            for c in candidates:
-                if c and input_value in str(c).lower():
-                    suggestions.add(str(c))
-        
-        return jsonify({"suggestions": sorted(list(suggestions))[:10]})
+        index = g.data.rastavljac_index
+        return g.data.response_cache.query_response(
+            ('rastavljac_suggestions', index.name_index.normalize(input_value)),
+            lambda: {"suggestions": index.suggestions(input_value, 10)})
     except Exception as e:
         app.logger.error(f"Error in get_rastavljac_suggestions: {e}")
         return jsonify({"error": "Error fetching suggestions"}), 500
 
 @app.route('/get_rastavljac_data', methods=['POST'])
 def get_rastavljac_data():
+    # Paging arguments come in the query string, the query in the JSON body
+    try:
+        page = page_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     try:
         body = request.get_json(silent=True) or {}
         q = body.get('rastavljac', '').strip()
-        
-        if not q:
+        sno_naziv = body.get('sno_naziv', '').strip()
+        dsn = body.get('dsn', '').strip()
+        
+        if sno_naziv:
+            # Whole feeder in one lookup
+            features = g.data.rastavljac_index.group('SNO_NAZIV', sno_naziv)
+        elif dsn:
+            features = g.data.rastavljac_index.group('DSN', dsn)
+        elif q:
+            # Exact SIFRA / NTS_NAZIV match, else substring match
+            features = g.data.rastavljac_index.lookup(q)
+        else:
             return jsonify({"error": "Invalid rastavljač value"}), 400
         
-        q_lower = q.lower()
-        
-        # Exact matches
-        features = [
-            f for f in rastavljac_data.get('features', [])
-            if (str(f.get('properties', {}).get('SIFRA', '')) == q)
-            or (str(f.get('properties', {}).get('NTS_NAZIV', '')) == q)
-        ]
-        
-        # Fallback: substring match
-        if not features:
-            features = []
-            for f in rastavljac_data.get('features', []):
-                props = f.get('properties', {})
-                joined = " ".join([
-                    str(props.get('SIFRA', '')),
-                    str(props.get('NTS_NAZIV', '')),
-                    str(props.get('SNO_NAZIV', '')),
-                    str(props.get('DSN', '')),
-                    str(props.get('DSN_NAZIV', ''))
-                ]).lower()
-                
-                if q_lower in joined:
-                    features.append(f)
-        
         if not features:
             return jsonify({"error": "No features found for this rastavljač"}), 404
         
@@ -580,8 +653,7 @@ def get_rastavljac_data():
         
         first_props = features[0].get('properties', {})
         
-        return jsonify({
-            "features": features,
+        result = {
             "center": center,
             "google_maps_url": google_maps_url,
             "naziv": first_props.get('NTS_NAZIV') or first_props.get('SNO_NAZIV') or '',
@@ -591,11 +663,276 @@ def get_rastavljac_data():
             "sno_naziv": first_props.get('SNO_NAZIV'),
             "dsn": first_props.get('DSN'),
             "dsn_naziv": first_props.get('DSN_NAZIV'),
-        })
+        }
+        
+        if page.active:
+            return paged_feature_response(
+                features, lambda feature: (feature.get('properties') or {}).get('SIFRA'), page, result,
+                g.data.rastavljac_index.properties)
+        
+        return jsonify({"features": features, **result})
     except Exception as e:
         app.logger.error(f"Error in get_rastavljac_data: {e}")
         return jsonify({"error": "An error occurred while filtering rastavljač data."}), 500
 
+# ============ BATCH LOOKUP ============
+
+@app.route('/batch_lookup', methods=['POST'])
+def batch_lookup():
+    """Look up many Šifre or serijski brojevi in one request.
+    
+    Results are streamed as a JSON array, or as NDJSON with ?format=ndjson,
+    one item per input value in input order.
+    """
+    try:
+        kind, values = batch.parse_batch(request)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    store = g.data.meter_store
+    results = batch.iter_results(store, kind, values)
+    
+    if request.args.get('format') == 'ndjson':
+        return Response((compact_dumps(result) + '\n' for result in results),
+                        mimetype='application/x-ndjson')
+    
+    def generate():
+        yield '['
+        for i, result in enumerate(results):
+            yield (',' if i else '') + compact_dumps(result)
+        yield ']\n'
+    
+    return Response(generate(), mimetype='application/json')
+
+# ============ EXPORT ============
+
+@app.route('/export', methods=['GET'])
+def export_meters():
+    """Every column of the meters of a Naziv TS or (OJ, OH), streamed as a file."""
+    export_format = request.args.get('format', 'csv')
+    ts_naziv = request.args.get('ts_naziv')
+    oj_value = request.args.get('oj')
+    oh_value = request.args.get('oh')
+    
+    if export_format not in export.FORMATS:
+        return jsonify({"error": f"Unknown format: {export_format}"}), 400
+    if export_format not in export.available_formats():
+        return jsonify({"error": f"{export_format} export is not available on this server"}), 501
+    
+    try:
+        if ts_naziv:
+            rows, label = g.data.meter_groups.rows_for_ts(ts_naziv), ts_naziv
+        elif oj_value and oh_value:
+            rows, label = g.data.meter_groups.rows_for_oj_oh(oj_value, oh_value), f"{oj_value}_{oh_value}"
+        else:
+            return jsonify({"error": "Missing ts_naziv or oj and oh parameter"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if not len(rows):
+        return jsonify({"error": "No meters found for this filter"}), 404
+    
+    mimetype, extension = export.FORMATS[export_format]
+    filename = secure_filename(f"brojila_{label}.{extension}")
+    return Response(export.WRITERS[export_format](g.data.meter_store, rows), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# ============ SPATIAL QUERIES ============
+
+SPATIAL_LAYERS = ('meters', 'trafostanice', 'rastavljaci')
+MAX_BBOX_LIMIT = 5000
+MAX_NEAREST_K = 100
+MAX_RADIUS_M = 50000
+
+def requested_layers():
+    """Layers named in the comma-separated 'layers' argument, all by default."""
+    layers = request.args.get('layers')
+    if not layers:
+        return SPATIAL_LAYERS
+    layers = tuple(layer.strip() for layer in layers.split(','))
+    unknown = [layer for layer in layers if layer not in SPATIAL_LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown layer: {', '.join(unknown)}")
+    return layers
+
+@app.route('/spatial/bbox', methods=['GET'])
+def spatial_bbox():
+    try:
+        west, south, east, north = (
+            float_arg(name) for name in ('west', 'south', 'east', 'north')
+        )
+        limit = min(int(request.args.get('limit', 500)), MAX_BBOX_LIMIT)
+        layers = requested_layers()
+    except KeyError:
+        return jsonify({"error": "Missing west, south, east or north parameter"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = {}
+    for name in layers:
+        layer = g.data.spatial[name]
+        ids, total = layer.index.bbox(west, south, east, north, max(limit, 0))
+        result[name] = {
+            "features": layer.take(ids),
+            "total": total,
+            "truncated": total > len(ids),
+        }
+    return jsonify(result)
+
+@app.route('/spatial/nearest', methods=['GET'])
+def spatial_nearest():
+    try:
+        sifra = request.args.get('sifra')
+        if sifra:
+            # Around a meter, e.g. its nearest trafostanica
+            coordinates = find_coordinates_by_sifra(int(sifra))
+            if not coordinates:
+                return jsonify({"error": "Lokacija nije dostupna."}), 404
+            lon, lat = coordinates
+        else:
+            lon, lat = float_arg('lon'), float_arg('lat')
+        k = min(int(request.args.get('k', 5)), MAX_NEAREST_K)
+        radius = min(float_arg('radius', 1000), MAX_RADIUS_M)
+        layers = requested_layers()
+    except KeyError:
+        return jsonify({"error": "Missing sifra or lat and lon parameters"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = {"center": [lat, lon]}
+    for name in layers:
+        layer = g.data.spatial[name]
+        ids, distances = layer.index.nearest(lon, lat, max(k, 0), max(radius, 0))
+        result[name] = [
+            {**feature, "properties": {**feature.get('properties', {}), "distance_m": round(distance, 1)}}
+            for feature, distance in zip(layer.take(ids), distances.tolist())
+        ]
+    return jsonify(result)
+
+# ============ TOPOLOGY ============
+
+def outage_summary(topology, ts_ids):
+    """Affected TS with their meters, and the totals, of a set of TS nodes."""
+    _, meters, customers = topology.affected(ts_ids)
+    return {
+        "trafostanice": topology.describe(ts_ids),
+        "meters": meters,
+        "customers": customers,
+    }
+
+@app.route('/topology/downstream', methods=['GET'])
+def topology_downstream():
+    """TS and meters below an SN odlaz (?feeder=, optionally &napojna=) or a TS (?ts=)."""
+    topology = g.data.topology
+    feeder = request.args.get('feeder')
+    ts_naziv = request.args.get('ts')
+    if feeder:
+        feeders = topology.feeder_nodes(feeder, request.args.get('napojna'))
+        if not feeders:
+            return jsonify({"error": "SN odlaz nije pronađen."}), 404
+        ts_ids = topology.ts_downstream_of_feeders(feeders)
+        return jsonify({"feeders": topology.describe(feeders), **outage_summary(topology, ts_ids)})
+    if ts_naziv:
+        ts_ids = topology.ts_downstream_of_ts(ts_naziv)
+        if ts_ids is None:
+            return jsonify({"error": "Trafostanica nije pronađena."}), 404
+        return jsonify(outage_summary(topology, ts_ids))
+    return jsonify({"error": "Missing feeder or ts parameter"}), 400
+
+@app.route('/topology/fed_from', methods=['GET'])
+def topology_fed_from():
+    """TS supplied from a napojna TS; ?recursive=1 follows the TS it supplies too."""
+    napojna = request.args.get('napojna')
+    if not napojna:
+        return jsonify({"error": "Missing napojna parameter"}), 400
+    topology = g.data.topology
+    ts_ids = topology.ts_fed_from(napojna, recursive=request.args.get('recursive') == '1')
+    if ts_ids is None:
+        return jsonify({"error": "Trafostanica nije pronađena."}), 404
+    return jsonify(outage_summary(topology, ts_ids))
+
+@app.route('/topology/isolating', methods=['GET'])
+def topology_isolating():
+    """Rastavljači on the SN odlazi supplying a TS (?upstream=1 for the whole path)."""
+    ts_naziv = request.args.get('ts')
+    if not ts_naziv:
+        return jsonify({"error": "Missing ts parameter"}), 400
+    topology = g.data.topology
+    feeders, rastavljaci = topology.isolating_rastavljaci(ts_naziv, upstream=request.args.get('upstream') == '1')
+    if feeders is None:
+        return jsonify({"error": "Trafostanica nije pronađena."}), 404
+    return jsonify({"feeders": topology.describe(feeders), "rastavljaci": rastavljaci})
+
+OUTAGE_SELECTION = ('napojna', 'feeder', 'ts')
+
+def outage_selection():
+    """Selected names per kind, from repeated query args or a JSON body of lists."""
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise ValueError("Expected a JSON object with napojna, feeder or ts lists")
+        selection = {kind: body.get(kind) or [] for kind in OUTAGE_SELECTION}
+        if not all(isinstance(names, list) for names in selection.values()):
+            raise ValueError("napojna, feeder and ts must be lists")
+    else:
+        selection = {kind: request.args.getlist(kind) for kind in OUTAGE_SELECTION}
+    if not any(selection.values()):
+        raise ValueError("Select at least one napojna, feeder or ts")
+    return selection
+
+@app.route('/outage/impact', methods=['GET', 'POST'])
+def outage_impact():
+    """Affected meters, A.sn, tarifne grupe and SNAGA of a napojna/odlaz/TS selection."""
+    try:
+        selection = outage_selection()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rollup = g.data.outage_rollup
+    nodes, not_found = rollup.resolve(selection['napojna'], selection['feeder'], selection['ts'])
+    if not len(nodes):
+        return jsonify({"error": "Nijedan odabrani element mreže nije pronađen.", "not_found": not_found}), 404
+    return jsonify({**rollup.combine(nodes), "not_found": not_found})
+
+# ============ DATA QUALITY ============
+
+@app.route('/data_quality', methods=['GET'])
+def data_quality():
+    """Issue totals and details of the export, or the Šifre of one issue."""
+    quality = g.data.quality
+    issue = request.args.get('issue')
+    if issue is None:
+        return g.data.response_cache.response('data_quality', quality.report)
+    if issue not in ISSUES:
+        return jsonify({"error": f"Unknown issue, expected one of: {', '.join(ISSUES)}"}), 400
+    return g.data.response_cache.query_response(
+        ('data_quality', issue),
+        lambda: {"issue": issue, "sifre": g.data.meter_store.sifra[quality.rows(issue)].tolist()})
+
+# ============ ADMIN ============
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Process-local numbers; each gunicorn worker reports its own
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/dataset_version', methods=['GET'])
+def dataset_version():
+    # Workers switch to a new snapshot one after the other, see follow()
+    return jsonify({**g.data.info(), "reloads": datasets.reloads, "pid": os.getpid()})
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    token = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        abort(403)
+    
+    # Built in the background; requests keep using the current dataset
+    # meanwhile.  The other workers follow once this one has made the new
+    # snapshot current
+    datasets.reload_in_background(force=request.args.get('force') == '1')
+    return jsonify({"status": "reloading", "current": g.data.info(), "pid": os.getpid()}), 202
+
 # PDF Downloads
 PDF_FOLDER = os.path.join(app.static_folder, "pdfs")
 ALLOWED_PDFS = {
@@ -612,5 +949,37 @@ def download_pdf(filename):
         abort(404)
     return send_from_directory(directory=PDF_FOLDER, filename=filename_safe, as_attachment=True)
 
+# ============ RESPONSE CACHE WARM-UP ============
+
+# Access log of a previous run whose most frequent map queries are answered
+# into the response cache of every new dataset before it serves requests.
+# Under gunicorn's preload the master warms the first one for all workers
+WARM_LOG = os.environ.get('RESPONSE_CACHE_WARM_LOG')
+WARM_TOP = int(os.environ.get('RESPONSE_CACHE_WARM_TOP', '200'))
+WARM_PREFIXES = ('/search_by_oj_oh?', '/filter_data_by_ts_naziv?', '/get_oh_values_by_oj/',
+                 '/view_all_trafostanice', '/get_ts_naziv_values')
+
+def warm_response_cache(dataset):
+    try:
+        targets = top_queries(WARM_LOG, WARM_TOP, WARM_PREFIXES)
+    except OSError as e:
+        app.logger.warning("Response cache not warmed, cannot read %s: %s", WARM_LOG, e)
+        return
+    started = time.perf_counter()
+    for target in targets:
+        # The view alone, without the request hooks: it answers from the
+        # dataset being warmed and does not count as served traffic
+        with app.test_request_context(target):
+            if request.routing_exception is None:
+                g.data = dataset
+                app.dispatch_request()
+    app.logger.info("Response cache of %s warmed with %d queries in %.1fs (%d bytes)",
+                    dataset.version, len(targets), time.perf_counter() - started,
+                    dataset.response_cache.bytes)
+
+if WARM_LOG:
+    datasets.warmers.append(warm_response_cache)
+    datasets.warm(datasets.current)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
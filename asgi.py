@@ -0,0 +1,219 @@
+"""ASGI entry point serving app.py's routes from an event loop.
+
+Needs an ASGI server, which is not in requirements.txt since the sync
+gunicorn deployment does not use one:
+
+    uvicorn asgi:application --workers 4
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+
+Every request is still answered by the Flask views, so routes, responses
+and the pinned dataset are exactly those of app.py.  The difference is
+what waits: thousands of open connections cost an event loop a few
+coroutines, while the views run on a bounded thread pool of
+``ASGI_THREADS`` threads.  When more than ``ASGI_MAX_PENDING`` requests
+are waiting for it the server answers 503 with Retry-After instead of
+queueing without limit.
+
+Identical concurrent requests to the map and autocomplete endpoints (same
+path, query, body and the headers the response depends on) are coalesced:
+the first one runs the view, the rest wait for and share its response.
+During a storm, when many dispatchers open the same OH or TS, the features
+are built once.  Streamed responses (``format=...``, exports, batch
+lookups) are never coalesced and are sent chunk by chunk.
+
+The pool parallelizes the numpy work, which releases the GIL; Python-heavy
+feature building scales with server worker processes, which share the
+preloaded dataset as under the sync workers.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import metrics
+from app import app
+
+THREADS = int(os.environ.get('ASGI_THREADS', '8'))
+MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', '256'))
+
+# Read-only endpoints whose responses are worth sharing between identical requests
+COALESCED_PATHS = frozenset({
+    '/search_by_oj_oh',
+    '/filter_data_by_ts_naziv',
+    '/view_all_trafostanice',
+    '/get_ts_naziv_values',
+    '/get_oh_values_by_oj',
+    '/get_customer_suggestions',
+    '/get_trafostanica_suggestions',
+    '/get_rastavljac_suggestions',
+    '/get_rastavljac_data',
+    '/get_trafostanica_data',
+    '/spatial/bbox',
+    '/topology/downstream',
+    '/topology/fed_from',
+    '/outage/impact',
+})
+# Request headers that change the response of a coalesced endpoint
+VARY_HEADERS = (b'accept-encoding', b'if-none-match', b'content-type')
+
+_DONE = object()
+
+def wsgi_environ(scope, body):
+    """WSGI environ of an ASGI HTTP scope and its request body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+def call_wsgi(wsgi_app, environ):
+    """Run the app up to its response iterable; returns (status, headers, iterable)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                              for name, value in headers]
+
+    iterable = wsgi_app(environ, start_response)
+    return started['status'], started['headers'], iterable
+
+def buffered_wsgi(wsgi_app, environ):
+    """The whole response of the app as (status, headers, body)."""
+    status, headers, iterable = call_wsgi(wsgi_app, environ)
+    try:
+        body = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return status, headers, body
+
+class AsgiAdapter:
+    """ASGI application running a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, threads=THREADS, max_pending=MAX_PENDING):
+        self.wsgi_app = wsgi_app
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        self.pending = 0
+        self._inflight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """The request body, or None if the client went away."""
+        parts = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            parts.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(parts)
+
+    def coalesce_key(self, scope, body):
+        """Key shared by requests with the same response, or None."""
+        if scope['path'] not in COALESCED_PATHS:
+            return None
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        if 'format' in query:
+            return None
+        headers = dict(scope['headers'])
+        return (scope['method'], scope['path'], scope['query_string'], body,
+                tuple(headers.get(name) for name in VARY_HEADERS))
+
+    async def http(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        if self.pending >= self.max_pending:
+            await self.send_buffered(send, 503, [(b'content-type', b'application/json'),
+                                                 (b'retry-after', b'1')],
+                                     b'{"error": "Server is busy, try again"}\n')
+            return
+
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, body)
+        key = self.coalesce_key(scope, body)
+        self.pending += 1
+        try:
+            if key is not None:
+                task = self._inflight.get(key)
+                metrics.lookup('coalesced_requests', task is not None)
+                if task is None:
+                    task = loop.run_in_executor(self.executor, buffered_wsgi, self.wsgi_app, environ)
+                    self._inflight[key] = task
+                    task.add_done_callback(lambda _: self._inflight.pop(key, None))
+                # A client that goes away must not cancel the others' response
+                status, headers, content = await asyncio.shield(task)
+                await self.send_buffered(send, status, headers, content)
+                return
+
+            status, headers, iterable = await loop.run_in_executor(
+                self.executor, call_wsgi, self.wsgi_app, environ)
+        finally:
+            self.pending -= 1
+        await self.send_streamed(send, status, headers, iterable)
+
+    async def send_buffered(self, send, status, headers, body):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_streamed(self, send, status, headers, iterable):
+        """Send the response, producing each chunk of a generator on the pool."""
+        loop = asyncio.get_running_loop()
+        iterator = iter(iterable)
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, _DONE)
+                if chunk is _DONE:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+application = AsgiAdapter(app)
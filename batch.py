@@ -0,0 +1,110 @@
+"""Batch Šifra / serijski broj lookups for the billing and outage tools.
+
+The values are resolved a chunk at a time with vectorized binary searches
+against the meter store, and each result has the shape of the single
+lookup endpoints: ``additional_info`` plus ``url`` or ``message``, or an
+``error``.
+"""
+import csv
+import io
+import math
+
+import numpy as np
+
+from features import meter_info
+from meter_store import INT64_MAX
+from metrics import lookup
+
+MAX_BATCH_ITEMS = 50000
+BATCH_CHUNK = 1000
+KINDS = ('sifra', 'serijski')
+
+NOT_INTEGER = "Uneseni podatak nije tipa integer (mora sadržavati samo brojeve)."
+SIFRA_NOT_FOUND = "Šifra mjernog mjesta nije pronađena u bazi podataka."
+SERIJSKI_NOT_FOUND = "Serijski broj nije pronađen u bazi podataka."
+NO_LOCATION = "Lokacija nije dostupna."
+
+def parse_csv(text):
+    """Values of the first column; a first row that is not a number is a header."""
+    values = [row[0].strip() for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    if values and not values[0].isdigit():
+        values = values[1:]
+    return values
+
+def parse_batch(request):
+    """(kind, values) of a batch request; raises ValueError if it is malformed.
+
+    Accepts a JSON body {"type": "sifra" | "serijski", "values": [...]} or a
+    CSV upload in the 'file' form field with the type in 'type'.
+    """
+    if 'file' in request.files:
+        kind = request.form.get('type', 'sifra')
+        values = parse_csv(request.files['file'].read().decode('utf-8-sig'))
+    else:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get('values'), list):
+            raise ValueError("Expected a JSON object with a values list or a CSV file")
+        kind = body.get('type', 'sifra')
+        values = body['values']
+    if kind not in KINDS:
+        raise ValueError(f"type must be one of {', '.join(KINDS)}")
+    if len(values) > MAX_BATCH_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_ITEMS} values per batch")
+    return kind, values
+
+def _integers(values):
+    """int64 array of the values and a mask of those that are valid integers."""
+    keys = np.full(len(values), -1, dtype=np.int64)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        text = str(value).strip() if isinstance(value, (str, int)) and not isinstance(value, bool) else ''
+        # isdigit() alone also accepts '²' or '١٢', which int() may reject
+        if text.isascii() and text.isdigit():
+            valid[i] = True
+            number = int(text)
+            # Too large to be in the export, but still a number
+            keys[i] = number if number <= INT64_MAX else -1
+    return keys, valid
+
+def google_maps_url(lon, lat):
+    return f"https://www.google.com/maps?q={lat},{lon}"
+
+def lookup_chunk(store, kind, values):
+    """Results for one chunk of values, in input order."""
+    keys, valid = _integers(values)
+    if kind == 'serijski':
+        sifre = store.sifre_for_serijski(keys)
+        # Šifra 0 is not a meter, like in the single lookup
+        found = valid & (sifre > 0)
+        not_found = SERIJSKI_NOT_FOUND
+    else:
+        sifre, found, not_found = keys, valid, SIFRA_NOT_FOUND
+
+    rows = np.where(found, store.rows_for_sifre(np.where(found, sifre, -1)), -1)
+    located = rows >= 0
+    hits = int(located.sum())
+    lookup('batch_' + kind, True, hits)
+    lookup('batch_' + kind, False, int(valid.sum()) - hits)
+    info = iter(meter_info(store, rows[located]))
+    coordinates = iter(store.coordinates[rows[located]].tolist())
+
+    results = []
+    for value, is_valid, row in zip(values, valid.tolist(), rows.tolist()):
+        if not is_valid:
+            results.append({"input": value, "error": NOT_INTEGER})
+        elif row < 0:
+            results.append({"input": value, "error": not_found})
+        else:
+            result = {"input": value, "additional_info": next(info)}
+            lon, lat = next(coordinates)
+            if not math.isnan(lon):
+                result["url"] = google_maps_url(lon, lat)
+            else:
+                result["message"] = NO_LOCATION
+            results.append(result)
+    return results
+
+def iter_results(store, kind, values):
+    """Results for all values, produced a chunk at a time."""
+    for start in range(0, len(values), BATCH_CHUNK):
+        yield from lookup_chunk(store, kind, values[start:start + BATCH_CHUNK])
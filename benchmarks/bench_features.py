@@ -0,0 +1,79 @@
+"""Micro-benchmark of the map feature builders.
+
+Compares the batched builder in features.py with the per-row ``iterrows``
+path it replaced, on the largest (OJ, OH) area and the largest trafostanica.
+Run it from the directory holding the data files, like app.py:
+
+    python benchmarks/bench_features.py [--repeat 5]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from features import meter_features
+
+def legacy_features(df, sifra_to_coordinates, mask):
+    """The previous implementation: boolean mask, then one dict per row."""
+    features = []
+    for _, row in df[mask].iterrows():
+        sifra = row['Šifra']
+        coordinates = sifra_to_coordinates.get(sifra)
+        if coordinates:
+            features.append({
+                'geometry': {'coordinates': coordinates, 'type': 'Point'},
+                'properties': {
+                    'IME_PREZIME': app.sanitize_for_json(row['Kupac']),
+                    'ADRESA_MM': app.sanitize_for_json(row['Adresa']),
+                    'SIFRA': app.sanitize_for_json(sifra),
+                    'SERIJSKI': app.sanitize_for_json(row['Serijski']),
+                    'TIP': app.sanitize_for_json(row['Tip']),
+                    'ROH': app.sanitize_for_json(row['ROH']),
+                    'ANG_SNAGA': app.sanitize_for_json(row['A.sn']),
+                },
+                'type': 'Feature',
+            })
+    return features
+
+def best_of(repeat, fn, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    data = app.datasets.current
+    df = data.snapshot.to_dataframe()
+    sifra_to_coordinates = dict(zip(
+        data.snapshot.array('points_sifra').tolist(),
+        data.snapshot.array('points_coordinates').tolist(),
+    ))
+    groups = data.meter_groups
+    oj, oh = max(groups.by_oj_oh, key=lambda key: len(groups.by_oj_oh[key]))
+    ts = max(groups.by_ts, key=lambda key: len(groups.by_ts[key]))
+    oj_mask = df['OJ'].isin([3031, 3032]) if oj == '303' else df['OJ'] == oj
+    cases = [
+        (f'search_by_oj_oh {oj}/{oh}', oj_mask & (df['OH'] == oh),
+         lambda: meter_features(data.meter_store, groups.rows_for_oj_oh(str(oj), oh))),
+        (f'filter_data_by_ts_naziv {ts}', df['Naziv TS'] == ts,
+         lambda: meter_features(data.meter_store, groups.rows_for_ts(ts))),
+    ]
+
+    print(f"{len(df)} meters, {len(sifra_to_coordinates)} points, best of {args.repeat}")
+    for name, mask, batched in cases:
+        legacy_time, legacy = best_of(args.repeat, legacy_features, df, sifra_to_coordinates, mask)
+        batched_time, result = best_of(args.repeat, batched)
+        assert legacy == result, f"{name}: outputs differ"
+        print(f"{name}: {len(result)} features, iterrows {legacy_time * 1000:.1f} ms, "
+              f"batched {batched_time * 1000:.1f} ms ({legacy_time / batched_time:.0f}x)")
@@ -0,0 +1,64 @@
+"""Latency of the grid index against a linear scan on random points.
+
+Runs on synthetic points over the service area, so no data files are
+needed:
+
+    python benchmarks/bench_spatial.py [--points 200000] [--queries 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial import GridIndex, haversine_m
+
+def linear_bbox(points, west, south, east, north, limit):
+    inside = np.flatnonzero((points[:, 0] >= west) & (points[:, 0] <= east)
+                            & (points[:, 1] >= south) & (points[:, 1] <= north))
+    return inside[:limit]
+
+def linear_nearest(points, lon, lat, k, radius_m):
+    distances = haversine_m(lon, lat, points[:, 0], points[:, 1])
+    order = np.argsort(distances, kind='stable')[:k]
+    return order[distances[order] <= radius_m]
+
+def latencies(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(*query)
+        timings.append(time.perf_counter() - started)
+    return np.array(timings) * 1000
+
+def report(label, timings):
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f"{label:>24}: p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # Roughly the Herzegovina-Neretva canton, clustered around a few towns
+    towns = rng.uniform((17.3, 43.0), (18.3, 43.8), size=(40, 2))
+    points = towns[rng.integers(len(towns), size=args.points)] + rng.normal(0, 0.02, (args.points, 2))
+
+    started = time.perf_counter()
+    index = GridIndex(points)
+    print(f"{args.points} points, index built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    centers = points[rng.integers(len(points), size=args.queries)]
+    boxes = [(lon - 0.02, lat - 0.01, lon + 0.02, lat + 0.01, 500) for lon, lat in centers]
+    nearest = [(lon, lat, 5, 1000.0) for lon, lat in centers]
+
+    report('bbox grid', latencies(index.bbox, boxes))
+    report('bbox linear scan', latencies(lambda *q: linear_bbox(points, *q), boxes))
+    report('nearest grid', latencies(index.nearest, nearest))
+    report('nearest linear scan', latencies(lambda *q: linear_nearest(points, *q), nearest))
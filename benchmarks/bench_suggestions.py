@@ -0,0 +1,75 @@
+"""Latency of the customer autocomplete lookup.
+
+Times the trigram/prefix index behind /get_customer_suggestions against the
+regex scan over every customer it replaced, on substrings sampled from the
+loaded customer names.  Run it from the directory holding the data files:
+
+    python benchmarks/bench_suggestions.py [--queries 2000]
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+from itertools import islice
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+data = app.datasets.current
+
+def indexed(query):
+    suggestions = []
+    for i in data.kupac_index.iter_matches(query, limit=10):
+        kupac = data.kupac_index.keys[i]
+        for row in islice(data.kupac_to_rows[kupac], 10 - len(suggestions)):
+            suggestions.append(f"{kupac} ({data.meter_store.value('Serijski', row)}, "
+                               f"{data.meter_store.value('Adresa', row)})")
+        if len(suggestions) == 10:
+            break
+    return suggestions
+
+def regex_scan(query):
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    suggestions = []
+    for kupac, rows in data.kupac_to_rows.items():
+        if pattern.search(kupac):
+            for row in rows:
+                suggestions.append(f"{kupac} ({data.meter_store.value('Serijski', row)}, "
+                                   f"{data.meter_store.value('Adresa', row)})")
+    return suggestions[:10]
+
+def latencies(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - started)
+    return np.array(timings) * 1000
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    names = list(data.kupac_to_rows)
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(names)
+        length = rng.randint(3, 8)
+        start = rng.randint(0, max(0, len(name) - length))
+        queries.append(name[start:start + length])
+
+    print(f"{len(names)} customers, {len(queries)} queries")
+    for label, fn in (('trigram index', indexed), ('regex scan', regex_scan)):
+        ms = latencies(fn, queries)
+        print(f"{label:>13}: p50 {np.percentile(ms, 50):.3f} ms, "
+              f"p95 {np.percentile(ms, 95):.3f} ms, p99 {np.percentile(ms, 99):.3f} ms")
@@ -0,0 +1,418 @@
+"""Benchmark and load-test suite for every app.py endpoint.
+
+Runs three stages against one data directory and writes the results as
+JSON, so two runs (say, before and after a change) can be compared:
+
+cold start
+    app.py imported in a fresh interpreter, once compiling the snapshot
+    from the sources and once loading the existing snapshot: wall time and
+    peak RSS of the process.
+routes
+    every endpoint called ``--repeat`` times through the Flask test client,
+    with arguments picked from the loaded data (the largest OJ/OH area and
+    TS, a located Šifra, ...): latency percentiles and response size.
+load
+    the app served by gunicorn (or the werkzeug server when gunicorn is not
+    installed) and ``--concurrency`` clients sending a weighted mix of the
+    map and lookup requests for ``--duration`` seconds: throughput and
+    p50/p95/p99 latency, overall and per endpoint.
+
+Without ``--data`` the sources are generated by synthetic.py at ``--scale``
+(1 is the size of the current exports; 10 and 100 are the growth cases)
+and cached under ``--workdir``.  Examples::
+
+    python benchmarks/bench_suite.py --scale 10 --output after.json --compare before.json
+    python benchmarks/bench_suite.py --data . --skip load
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import snapshot
+import synthetic
+
+STAGES = ('cold_start', 'routes', 'load')
+# Requests the load profile mixes, with their weights: mostly the map and
+# lookup traffic of the front-end, now and then a bulk request
+LOAD_MIX = {
+    'get_coordinates_by_sifra': 10,
+    'get_coordinates_by_serijski_broj': 5,
+    'get_customer_suggestions': 10,
+    'get_trafostanica_suggestions': 5,
+    'get_rastavljac_suggestions': 5,
+    'get_ts_naziv_values_search': 5,
+    'get_oh_values_by_oj': 3,
+    'search_by_oj_oh': 3,
+    'search_by_oj_oh_clustered': 6,
+    'filter_data_by_ts_naziv': 4,
+    'filter_data_by_ts_naziv_clustered': 6,
+    'view_all_trafostanice': 3,
+    'get_trafostanica_data': 5,
+    'spatial_bbox': 5,
+    'spatial_nearest': 5,
+    'outage_impact': 2,
+    'batch_lookup': 1,
+}
+
+def percentiles(timings):
+    timings = np.asarray(timings) * 1000
+    if not len(timings):
+        return {}
+    return {
+        'count': len(timings),
+        'mean_ms': round(float(timings.mean()), 3),
+        'min_ms': round(float(timings.min()), 3),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+        'max_ms': round(float(timings.max()), 3),
+    }
+
+# ============ DATA ============
+
+def prepare_data(args):
+    """Directory holding the sources, generated first unless --data is given."""
+    if args.data:
+        return os.path.abspath(args.data)
+    directory = os.path.join(args.workdir, f'scale-{args.scale:g}-seed-{args.seed}')
+    stamp = os.path.join(directory, '.generated')
+    if not os.path.exists(stamp):
+        shutil.rmtree(directory, ignore_errors=True)
+        print(f"Generating scale {args.scale:g} data in {directory}", file=sys.stderr)
+        synthetic.generate(directory, args.scale, args.seed)
+        open(stamp, 'w').close()
+    return directory
+
+def request_cases(data):
+    """name -> (method, path, options for the test client) with arguments from data."""
+    store = data.meter_store
+    groups = data.meter_groups
+    located = np.flatnonzero(~np.isnan(store.coordinates[:, 0]))
+    row = int(located[len(located) // 2])
+    sifra = int(store.sifra[row])
+    serijski = int(store.value('Serijski', row))
+    kupac = store.value('Kupac', row)
+    oj, oh = max(groups.by_oj_oh, key=lambda key: len(groups.by_oj_oh[key]))
+    ts = max(groups.by_ts, key=lambda key: len(groups.by_ts[key]))
+    trafostanica = next(iter(data.trafostanica_to_info))
+    rastavljac = data.rastavljac_data['features'][0]['properties']
+    lon, lat = store.coordinates[row].tolist()
+    supplied = next(feature['properties'] for feature in data.trafostanica_data['features']
+                    if feature['properties'].get('NAPOJNA_TS'))
+    napojna, feeder = supplied['NAPOJNA_TS'], supplied['ODLAZ_SN_NAZIV']
+    bbox = {'west': lon - 0.05, 'south': lat - 0.05, 'east': lon + 0.05, 'north': lat + 0.05}
+    sifre = [str(value) for value in store.sifra[located[:1000]].tolist()]
+
+    return {
+        'index': ('GET', '/', {}),
+        'get_coordinates_by_sifra': ('POST', '/get_coordinates_by_sifra', {'data': {'sifra': sifra}}),
+        'get_coordinates_by_serijski_broj': ('POST', '/get_coordinates_by_serijski_broj',
+                                             {'data': {'serijski_broj': serijski}}),
+        'get_customer_suggestions': ('POST', '/get_customer_suggestions', {'data': {'input': kupac[:4]}}),
+        'get_coordinates_by_kupac': ('POST', '/get_coordinates_by_kupac',
+                                     {'data': {'kupac': kupac, 'serijski': serijski}}),
+        'get_oh_values_by_oj': ('GET', f'/get_oh_values_by_oj/{oj}', {}),
+        'search_by_oj_oh': ('GET', '/search_by_oj_oh', {'query_string': {'oj': oj, 'oh': oh}}),
+        'search_by_oj_oh_clustered': ('GET', '/search_by_oj_oh', {'query_string': {'oj': oj, 'oh': oh, 'z': 10}}),
+        'search_by_oj_oh_page': ('GET', '/search_by_oj_oh', {'query_string': {'oj': oj, 'oh': oh, 'limit': 500}}),
+        'get_trafostanica_data': ('POST', '/get_trafostanica_data', {'json': {'trafostanica': trafostanica}}),
+        'get_trafostanica_suggestions': ('POST', '/get_trafostanica_suggestions',
+                                         {'data': {'input': trafostanica[-8:-3]}}),
+        'view_all_trafostanice': ('GET', '/view_all_trafostanice', {}),
+        'get_ts_naziv_values': ('GET', '/get_ts_naziv_values', {}),
+        'get_ts_naziv_values_search': ('GET', '/get_ts_naziv_values', {'query_string': {'search': ts[-8:-3]}}),
+        'filter_data_by_ts_naziv': ('GET', '/filter_data_by_ts_naziv', {'query_string': {'ts_naziv': ts}}),
+        'filter_data_by_ts_naziv_clustered': ('GET', '/filter_data_by_ts_naziv',
+                                              {'query_string': {'ts_naziv': ts, 'z': 12}}),
+        'get_rastavljac_suggestions': ('POST', '/get_rastavljac_suggestions',
+                                       {'data': {'input': rastavljac['SNO_NAZIV'][-6:]}}),
+        'get_rastavljac_data': ('POST', '/get_rastavljac_data', {'json': {'rastavljac': rastavljac['SIFRA']}}),
+        'get_rastavljac_data_feeder': ('POST', '/get_rastavljac_data', {'json': {'sno_naziv': rastavljac['SNO_NAZIV']}}),
+        'batch_lookup': ('POST', '/batch_lookup', {'json': {'type': 'sifra', 'values': sifre}}),
+        'export_csv': ('GET', '/export', {'query_string': {'format': 'csv', 'ts_naziv': ts}}),
+        'export_geojson': ('GET', '/export', {'query_string': {'format': 'geojson', 'ts_naziv': ts}}),
+        'spatial_bbox': ('GET', '/spatial/bbox', {'query_string': bbox}),
+        'spatial_nearest': ('GET', '/spatial/nearest', {'query_string': {'lon': lon, 'lat': lat, 'k': 10}}),
+        'topology_downstream': ('GET', '/topology/downstream', {'query_string': {'feeder': feeder}}),
+        'topology_fed_from': ('GET', '/topology/fed_from', {'query_string': {'napojna': napojna, 'recursive': 1}}),
+        'topology_isolating': ('GET', '/topology/isolating', {'query_string': {'ts': ts}}),
+        'outage_impact': ('GET', '/outage/impact', {'query_string': {'napojna': napojna, 'ts': ts}}),
+        'metrics': ('GET', '/metrics', {}),
+        'dataset_version': ('GET', '/dataset_version', {}),
+    }
+
+# ============ COLD START ============
+
+def peak_rss_mib():
+    """High-water RSS of this process in MiB."""
+    # ru_maxrss carries over the parent's peak through fork, VmHWM does not
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+def cold_start_child():
+    """Import app.py in this interpreter and print its load time and peak RSS."""
+    started = time.perf_counter()
+    import app
+    elapsed = time.perf_counter() - started
+    peak = peak_rss_mib()
+    print(json.dumps({'seconds': round(elapsed, 3), 'peak_rss_mib': round(peak, 1),
+                      'meters': len(app.datasets.current.meter_store)}))
+
+def run_cold_start(directory):
+    env = dict(os.environ, DATASET_WATCH_INTERVAL='0', LOG_LEVEL='WARNING')
+    results = {}
+    has_workbook = os.path.exists(os.path.join(directory, snapshot.SOURCE_FILES['excel']))
+    for name in ('build', 'load'):
+        if name == 'build':
+            if not has_workbook:
+                # Too large for a workbook; the snapshot was compiled directly
+                continue
+            shutil.rmtree(os.path.join(directory, snapshot.SNAPSHOT_DIR), ignore_errors=True)
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--cold-start-child'],
+                                cwd=directory, env=env, check=True, capture_output=True, text=True)
+        results[name] = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"cold start ({name}): {results[name]['seconds']:.2f}s, "
+              f"peak RSS {results[name]['peak_rss_mib']:.0f} MiB", file=sys.stderr)
+    return results
+
+# ============ ROUTES ============
+
+def run_routes(directory, repeat):
+    os.environ.setdefault('DATASET_WATCH_INTERVAL', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.chdir(directory)
+    import app
+
+    client = app.app.test_client()
+    cases = request_cases(app.datasets.current)
+    results = {}
+    for name, (method, path, options) in cases.items():
+        timings = []
+        size = status = None
+        for i in range(repeat + 2):
+            started = time.perf_counter()
+            response = client.open(path, method=method, **options)
+            body = response.get_data()
+            # The first two calls warm caches and are not counted
+            if i >= 2:
+                timings.append(time.perf_counter() - started)
+            size, status = len(body), response.status_code
+        results[name] = {'status': status, 'bytes': size, **percentiles(timings)}
+        if timings:
+                print(f"{name}: {status}, {size} B, p50 {results[name]['p50_ms']:.2f} ms, "
+                  f"p99 {results[name]['p99_ms']:.2f} ms", file=sys.stderr)
+    return results, cases
+
+# ============ LOAD ============
+
+def start_server(directory, port, workers):
+    env = dict(os.environ, DATASET_WATCH_INTERVAL='0', LOG_LEVEL='WARNING', WEB_CONCURRENCY=str(workers),
+               GUNICORN_BIND=f'127.0.0.1:{port}', PYTHONPATH=ROOT)
+    try:
+        import gunicorn  # noqa: F401
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                   '--chdir', directory, '--pythonpath', ROOT, '--log-level', 'warning', 'app:app']
+    except ImportError:
+        command = [sys.executable, '-c', 'import app; from werkzeug.serving import run_simple; '
+                   f'run_simple("127.0.0.1", {port}, app.app, threaded=True)']
+    return subprocess.Popen(command, cwd=directory, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def http_request(host, port, method, path, options, timeout=60):
+    """Send one request the way the test client options describe it; returns the status."""
+    headers = {}
+    body = None
+    if 'query_string' in options:
+        path += '?' + urllib.parse.urlencode(options['query_string'])
+    if 'data' in options:
+        body = urllib.parse.urlencode(options['data'])
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    elif 'json' in options:
+        body = json.dumps(options['json'])
+        headers['Content-Type'] = 'application/json'
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+def wait_for_server(host, port, server, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            if http_request(host, port, 'GET', '/dataset_version', {}, timeout=5) == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("The server did not start")
+
+def run_load(directory, cases, args):
+    host, port = '127.0.0.1', args.port
+    server = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        server = start_server(directory, port, args.workers)
+    try:
+        wait_for_server(host, port, server)
+        names = [name for name in LOAD_MIX if name in cases]
+        weights = [LOAD_MIX[name] for name in names]
+        timings = {name: [] for name in names}
+        errors = []
+        deadline = time.perf_counter() + args.duration
+
+        def client(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                method, path, options = cases[name]
+                started = time.perf_counter()
+                try:
+                    status = http_request(host, port, method, path, options)
+                except OSError as e:
+                    errors.append(f'{name}: {e}')
+                    continue
+                elapsed = time.perf_counter() - started
+                if status >= 500:
+                    errors.append(f'{name}: HTTP {status}')
+                timings[name].append(elapsed)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(args.seed + i,)) for i in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    everything = [timing for values in timings.values() for timing in values]
+    result = {
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(everything),
+        'errors': len(errors),
+        'requests_per_s': round(len(everything) / elapsed, 1),
+        'latency': percentiles(everything),
+        'routes': {name: percentiles(values) for name, values in timings.items() if values},
+    }
+    print(f"load: {result['requests_per_s']} req/s at concurrency {args.concurrency}, "
+          f"p50 {result['latency'].get('p50_ms')} ms, p95 {result['latency'].get('p95_ms')} ms, "
+          f"p99 {result['latency'].get('p99_ms')} ms, {len(errors)} errors", file=sys.stderr)
+    return result
+
+# ============ REPORT ============
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Print the p50 of each route and the load latencies against a baseline run."""
+    def ratio(new, old):
+        return f"{new / old:.2f}x" if new and old else '-'
+
+    print(f"{'route':40} {'base p50':>10} {'p50':>10} {'ratio':>8}")
+    for name, route in results.get('routes', {}).items():
+        old = baseline.get('routes', {}).get(name, {}).get('p50_ms')
+        print(f"{name:40} {old if old is not None else '-':>10} {route['p50_ms']:>10} "
+              f"{ratio(route['p50_ms'], old):>8}")
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        new = results.get('load', {}).get('latency', {}).get(key)
+        old = baseline.get('load', {}).get('latency', {}).get(key)
+        if new is not None:
+            print(f"{'load ' + key:40} {old if old is not None else '-':>10} {new:>10} {ratio(new, old):>8}")
+    for name, cold in results.get('cold_start', {}).items():
+        old = baseline.get('cold_start', {}).get(name, {}).get('seconds')
+        print(f"{'cold start ' + name + ' s':40} {old if old is not None else '-':>10} "
+              f"{cold['seconds']:>10} {ratio(cold['seconds'], old):>8}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', help="directory with the real sources instead of synthetic ones")
+    parser.add_argument('--scale', type=float, default=1.0, help="synthetic data scale, 1 = current exports")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'bench-suite'))
+    parser.add_argument('--repeat', type=int, default=20, help="calls per route")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers for the load stage")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--url', help="load an already running server instead of starting one")
+    parser.add_argument('--skip', action='append', default=[], choices=STAGES)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="results JSON of an earlier run to compare against")
+    parser.add_argument('--cold-start-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        cold_start_child()
+        sys.exit(0)
+
+    directory = prepare_data(args)
+    results = {'meta': {
+        'revision': git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'data': directory,
+        'scale': None if args.data else args.scale,
+        'seed': None if args.data else args.seed,
+    }}
+    if 'cold_start' not in args.skip:
+        results['cold_start'] = run_cold_start(directory)
+    # The route stage loads the data in-process; the load stage needs its cases
+    if 'routes' not in args.skip or 'load' not in args.skip:
+        routes, cases = run_routes(directory, args.repeat if 'routes' not in args.skip else 0)
+        if 'routes' not in args.skip:
+            results['routes'] = routes
+        if 'load' not in args.skip:
+            results['load'] = run_load(directory, cases, args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare(results, json.load(file))
+    elif not args.output:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
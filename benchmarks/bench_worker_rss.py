@@ -0,0 +1,162 @@
+"""Per-worker memory of the app under gunicorn, with and without preloading.
+
+Starts gunicorn with gunicorn.conf.py twice, PRELOAD_APP=0 and =1, warms
+every worker with a round of lookups and reads /proc/<pid>/smaps_rollup of
+each worker.  RSS counts shared pages in every process; USS (private pages)
+is what each additional worker really costs, PSS splits the shared pages
+between the processes mapping them.  Linux only.  Run it from the directory
+holding the data files, like app.py:
+
+    python benchmarks/bench_worker_rss.py [--workers 4]
+
+A third, preloaded run measures the workers again after a data update: it
+serves a scratch copy of the data directory, changes rastavljac_data.json
+there, reloads through /admin/reload and waits until every worker has
+followed.  Preloading only shares what the master loaded before the fork;
+the reloaded snapshot's arrays are file mappings and stay shared, but the
+indexes each worker builds from them are its own.
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WARMUP = [
+    ('GET', '/view_all_trafostanice', None),
+    ('GET', '/get_ts_naziv_values', None),
+    ('GET', '/get_ts_naziv_values?search=ts', None),
+    ('GET', '/get_oh_values_by_oj/303', None),
+    ('POST', '/get_customer_suggestions', {'input': 'ana'}),
+    ('POST', '/get_trafostanica_suggestions', {'input': 'polje'}),
+    ('POST', '/get_rastavljac_suggestions', {'input': 'sno'}),
+]
+
+def smaps_rollup(pid):
+    """Rss, Pss and private (USS) sizes of a process in MiB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss': fields['Rss'],
+        'pss': fields['Pss'],
+        'uss': fields['Private_Clean'] + fields['Private_Dirty'],
+    }
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return [int(child) for child in file.read().split()]
+
+ADMIN_TOKEN = 'bench-worker-rss'
+
+def request(base, method, path, form, headers=None):
+    data = urllib.parse.urlencode(form).encode() if form else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base + path, data, headers or {},
+                                                           method=method)) as response:
+            return response.read()
+    except urllib.error.HTTPError:
+        return None
+
+def scratch_copy(directory):
+    """A directory serving the same data: the sources linked, the snapshot copied."""
+    for name in os.listdir(os.getcwd()):
+        source = os.path.join(os.getcwd(), name)
+        if name == 'snapshot':
+            shutil.copytree(source, os.path.join(directory, name), symlinks=True)
+        elif name.endswith(('.json', '.xlsx')):
+            os.symlink(source, os.path.join(directory, name))
+
+def update_data(directory):
+    """Give rastavljac_data.json new contents, and with them a new snapshot."""
+    path = os.path.join(directory, 'rastavljac_data.json')
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    data['bench_reload'] = time.time()
+    os.unlink(path)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+
+def reload_all(base, workers, timeout):
+    """Reload the dataset and wait until every worker serves the new one."""
+    before = json.loads(request(base, 'GET', '/dataset_version', None))['version']
+    request(base, 'POST', '/admin/reload', None, {'X-Admin-Token': ADMIN_TOKEN})
+    followed = set()
+    deadline = time.time() + timeout
+    while len(followed) < workers:
+        info = json.loads(request(base, 'GET', '/dataset_version', None))
+        if info['version'] != before:
+            followed.add(info['pid'])
+        if time.time() > deadline:
+            raise RuntimeError("not every worker reloaded")
+        time.sleep(0.05)
+
+def measure(preload, workers, port, reload=False, timeout=600):
+    env = dict(os.environ, PRELOAD_APP='1' if preload else '0', DATASET_WATCH_INTERVAL='0',
+               WEB_CONCURRENCY=str(workers), GUNICORN_BIND=f'127.0.0.1:{port}',
+               ADMIN_TOKEN=ADMIN_TOKEN)
+    directory = tempfile.mkdtemp(prefix='bench-rss-') if reload else os.getcwd()
+    if reload:
+        scratch_copy(directory)
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--chdir', directory, '--pythonpath', ROOT, '--log-level', 'warning', 'app:app'],
+        env=env,
+    )
+    base = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                request(base, 'GET', '/dataset_version', None)
+                if len(children(master.pid)) == workers:
+                    break
+            except OSError:
+                pass
+            if time.time() > deadline or master.poll() is not None:
+                raise RuntimeError("gunicorn did not start")
+            time.sleep(0.5)
+        # Enough rounds that every worker serves each endpoint
+        for _ in range(workers * 4):
+            for method, path, form in WARMUP:
+                request(base, method, path, form)
+        if reload:
+            update_data(directory)
+            reload_all(base, workers, timeout)
+            for _ in range(workers * 4):
+                for method, path, form in WARMUP:
+                    request(base, method, path, form)
+        time.sleep(1)
+        return smaps_rollup(master.pid), [smaps_rollup(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+        if reload:
+            shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    for label, preload, reload in (('per-worker load', False, False), ('preloaded', True, False),
+                                   ('preloaded, after a reload', True, True)):
+        master, workers = measure(preload, args.workers, args.port, reload)
+        mean = {key: sum(worker[key] for worker in workers) / len(workers) for key in master}
+        total = master['pss'] + sum(worker['pss'] for worker in workers)
+        print(f"{label}: {len(workers)} workers, per worker RSS {mean['rss']:.1f} MiB, "
+              f"USS {mean['uss']:.1f} MiB, PSS {mean['pss']:.1f} MiB; "
+              f"master RSS {master['rss']:.1f} MiB; total PSS {total:.1f} MiB")
@@ -0,0 +1,207 @@
+"""Synthetic data sources shaped like the production exports, at any scale.
+
+Writes the four files app.py reads (EP_Eksport_Uredjaja.xlsx, data.json,
+trafostanica_data.json and rastavljac_data.json) into a directory. At
+scale 1 they match the size of the current exports: about 20 000 meters,
+765 trafostanice on 80 SN odlazi of 19 napojne TS, and 660 rastavljači.
+Every count grows linearly with the scale. The values are drawn with a
+fixed seed, so one scale and seed always give the same files. That way
+benchmark runs on different commits measure the same data.
+
+Meters are scattered around their TS, so the map, cluster and spatial
+endpoints see realistic density. Above the row limit of a workbook sheet
+(about 50x) no workbook is written. build_snapshot() then compiles the
+snapshot from the DataFrame directly. It also does so with --snapshot:
+
+    python benchmarks/synthetic.py OUT_DIR [--scale 10] [--seed 0] [--snapshot]
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot
+
+EXCEL_MAX_ROWS = 1048576 - 8
+METERS = 20000
+TRAFOSTANICE = 765
+NAPOJNE = 19
+FEEDERS = 80
+RASTAVLJACI = 660
+CUSTOMERS = 8600
+STREETS = 200
+LOCATED = 0.9
+# Service area, west, south, east, north
+AREA = (17.5, 43.0, 18.5, 44.0)
+
+FIRST_NAMES = ['Ana', 'Emir', 'Ljiljana', 'Mirza', 'Ivana', 'Adnan', 'Marija', 'Haris', 'Selma',
+               'Josip', 'Amra', 'Nikola', 'Lejla', 'Dario', 'Edina', 'Tarik', 'Mirela', 'Kenan']
+LAST_NAMES = ['Marić', 'Zec', 'Hodžić', 'Kovačević', 'Čolak', 'Šarić', 'Begić', 'Đukić', 'Pehar',
+              'Ćorić', 'Mehmedović', 'Jurić', 'Ljubić', 'Delić', 'Bošnjak', 'Rajić', 'Tabaković']
+METER_TYPES = ['ME162', 'AM550', 'MT174', None]
+TARIFFS = [1, 2, 3, 'K']
+POWERS = [3.45, 6.9, 11.04, 17.25, None]
+OJ_VALUES = [301, 302, 3031, 3032, 304]
+OH_VALUES = ['OH Mostar', 'OH Sjever', 'OH Jug', 'Konjic-1', 'Jablanica']
+ROH_VALUES = ['A1', 'B2', None]
+POSLOVNICE = ['MOSTAR', 'KONJIC', 'JABLANICA']
+
+def scaled(count, scale):
+    return max(1, int(round(count * scale)))
+
+def point_feature(lon, lat, properties):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': properties}
+
+def random_points(rng, count):
+    west, south, east, north = AREA
+    return np.column_stack([rng.uniform(west, east, count), rng.uniform(south, north, count)])
+
+def network(rng, scale):
+    """Trafostanica and rastavljač features of a random supply tree."""
+    napojne = scaled(NAPOJNE, scale)
+    feeders = max(napojne, scaled(FEEDERS, scale))
+    count = max(napojne + feeders, scaled(TRAFOSTANICE, scale))
+
+    napojna_names = [f'TS 110/35/10 kV NAPOJNA {i} (N{i})' for i in range(napojne)]
+    # Every napojna has at least one odlaz
+    feeder_napojna = np.concatenate([np.arange(napojne), rng.integers(0, napojne, feeders - napojne)])
+    feeder_names = [f'SNO 10 kV ODLAZ {i}' for i in range(feeders)]
+    # The napojne are trafostanice themselves: napojna i is on the first
+    # odlaz of napojna i - 1, the first one is fed from the transmission grid
+    ts_feeder = np.concatenate([np.arange(-1, napojne - 1), np.arange(feeders),
+                                rng.integers(0, feeders, count - napojne - feeders)])
+    coordinates = random_points(rng, count)
+
+    trafostanice = []
+    for i in range(count):
+        feeder = ts_feeder[i]
+        name = napojna_names[i] if i < napojne else f'TS 10/0,4 kV SINTETIČKA {i} ({1000 + i})'
+        trafostanice.append(point_feature(*coordinates[i].tolist(), {
+            'NAZIV': name,
+            'SIFRA': str(1000 + i),
+            'SNAGA': int(rng.choice([100, 250, 400, 630, 1000])),
+            'BR_TRANSFORMATORA': int(rng.integers(1, 3)),
+            'CONF_SN_POST': '2V + 1T',
+            'NAPOJNA_TS': napojna_names[feeder_napojna[feeder]] if feeder >= 0 else None,
+            'ODLAZ_SN_NAZIV': feeder_names[feeder] if feeder >= 0 else None,
+            'ODLAZ_SN_SIFRA': f'O{feeder}' if feeder >= 0 else None,
+            'TIP_TS': 'Primarna TS' if i < napojne else 'Distributivna TS',
+            'POSLOVNICA': POSLOVNICE[i % len(POSLOVNICE)],
+            'TS_GD': 'zidano kućiste',
+            'TS_SN_POST': 'zrakom izolovano',
+            'VLASNIK': 'ED Mostar',
+            'GODINA_IZGRADNJE': int(rng.integers(1960, 2023)),
+        }))
+
+    rastavljaci = []
+    on_feeder = rng.integers(0, feeders, scaled(RASTAVLJACI, scale))
+    for i, (feeder, (lon, lat)) in enumerate(zip(on_feeder.tolist(), random_points(rng, len(on_feeder)).tolist())):
+        line = f'DV 10(20) kV ODLAZ {feeder} (DIONICA {i % 5 + 1})'
+        rastavljaci.append(point_feature(lon, lat, {
+            'PJ': POSLOVNICE[i % len(POSLOVNICE)],
+            'VRSTA_UPRAVLJANJA': 'LINIJSKI RASTAVLJAČ',
+            'SIFRA': f'R{i}',
+            'NTS_NAZIV': napojna_names[feeder_napojna[feeder]],
+            'SNO_NAZIV': feeder_names[feeder],
+            'DSN': f'{5000000 + i} {line}',
+            'DSN_NAZIV': line,
+        }))
+    return trafostanice, rastavljaci
+
+def _dates(rng, count, start='2005-01-01', end='2023-01-01'):
+    start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    days = (end - start).astype(np.int64)
+    return pd.to_datetime(start + rng.integers(0, days, count).astype('timedelta64[D]'))
+
+def meter_export(rng, scale, trafostanice):
+    """The export sheet as a DataFrame, column names as in the workbook."""
+    count = scaled(METERS, scale)
+    sifre = 1000000 + rng.choice(10 * count, count, replace=False)
+    serijski = 50000000 + rng.choice(10 * count, count, replace=False)
+
+    customers = scaled(CUSTOMERS, scale)
+    customer = rng.integers(0, customers, count)
+    first = np.array(FIRST_NAMES, dtype=object)[customer % len(FIRST_NAMES)]
+    last = np.array(LAST_NAMES, dtype=object)[(customer // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    suffix = customer // (len(FIRST_NAMES) * len(LAST_NAMES))
+    kupac = [f'{l} {f}' + (f' {n}' if n else '') for l, f, n in zip(last, first, suffix.tolist())]
+
+    ts = rng.integers(0, len(trafostanice), count)
+    return pd.DataFrame({
+        ' Šifra ': sifre,
+        'Serijski': serijski,
+        'Tip': rng.choice(np.array(METER_TYPES, dtype=object), count),
+        'Proizvodnj': _dates(rng, count),
+        'Baždarenje': _dates(rng, count),
+        'Datum žc': _dates(rng, count),
+        'Kupac': kupac,
+        'Adresa': [f'Ulica {n}' for n in rng.integers(1, scaled(STREETS, scale) + 1, count).tolist()],
+        'T': rng.choice(np.array(TARIFFS, dtype=object), count),
+        'A.sn': rng.choice(np.array(POWERS, dtype=object), count).astype(float),
+        'Naziv TS': [trafostanice[i]['properties']['NAZIV'] for i in ts.tolist()],
+        'OJ': rng.choice(OJ_VALUES, count),
+        'OH': rng.choice(np.array(OH_VALUES, dtype=object), count),
+        'ROH': rng.choice(np.array(ROH_VALUES, dtype=object), count),
+    }), ts
+
+def meter_points(rng, df, ts, trafostanice):
+    """data.json: most meters located within a few km of their TS."""
+    located = rng.random(len(df)) < LOCATED
+    centers = np.array([trafostanice[i]['geometry']['coordinates'] for i in ts[located].tolist()])
+    coordinates = centers + rng.normal(0, 0.01, centers.shape)
+    return {'type': 'FeatureCollection', 'features': [
+        point_feature(lon, lat, {'SIFRA': sifra})
+        for sifra, (lon, lat) in zip(df[' Šifra '].to_numpy()[located].tolist(), coordinates.tolist())
+    ]}
+
+def write_workbook(path, df):
+    """Write the sheet with the five title rows and blank row of the real export."""
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        pd.DataFrame({'title': ['x'] * 5}).to_excel(
+            writer, sheet_name='Eksport_uredjaja', index=False, header=False)
+        df.to_excel(writer, sheet_name='Eksport_uredjaja', index=False, startrow=6)
+
+def _write_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(payload, file, ensure_ascii=False)
+
+def generate(directory, scale=1.0, seed=0, build=False):
+    """Write the sources into directory and return the meter export DataFrame.
+
+    The workbook is skipped when the export does not fit in one sheet; with
+    ``build``, or in that case, the snapshot is compiled right away.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    sources = {name: os.path.join(directory, path) for name, path in snapshot.SOURCE_FILES.items()}
+
+    trafostanice, rastavljaci = network(rng, scale)
+    df, ts = meter_export(rng, scale, trafostanice)
+    _write_json(sources['trafostanice'], {'type': 'FeatureCollection', 'features': trafostanice})
+    _write_json(sources['rastavljaci'], {'type': 'FeatureCollection', 'features': rastavljaci})
+    _write_json(sources['points'], meter_points(rng, df, ts, trafostanice))
+
+    fits = len(df) <= EXCEL_MAX_ROWS
+    if fits:
+        write_workbook(sources['excel'], df)
+    if build or not fits:
+        snapshot.build_snapshot(os.path.join(directory, snapshot.SNAPSHOT_DIR), sources,
+                                meter_export=None if fits else df)
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--snapshot', action='store_true', help="compile the snapshot as well")
+    args = parser.parse_args()
+
+    df = generate(args.directory, args.scale, args.seed, args.snapshot)
+    print(f"{args.directory}: {len(df)} meters at scale {args.scale:g}")
@@ -0,0 +1,130 @@
+"""Server-side clustering of the meter map layers by zoom level.
+
+Every located meter gets a Morton code of its Web Mercator position: the
+bits of its x and y cell at ``MAX_CLUSTER_ZOOM`` interleaved.  The cluster
+cell of a point at a coarser zoom is a prefix of that code, so once the
+rows of a group are sorted by code, the clusters of every zoom level are
+runs of equal ``code >> shift``.  Sorting each (OJ, OH) and Naziv TS group
+once at load time therefore precomputes its whole cluster pyramid, and a
+request only aggregates the runs inside its viewport.  The number of
+clusters returned is bounded by the screen area in cells, not by the
+number of meters.
+"""
+import numpy as np
+
+from features import located_rows, meter_features
+
+# Cluster cells are CELL_PX screen pixels wide at every zoom
+CELL_PX = 64
+TILE_PX = 256
+# Above this zoom every meter is returned as its own feature
+MAX_CLUSTER_ZOOM = 18
+# Cells per axis at zoom z are 2 ** (z + CELL_SHIFT)
+CELL_SHIFT = int(np.log2(TILE_PX // CELL_PX))
+MAX_LEVEL = MAX_CLUSTER_ZOOM + CELL_SHIFT
+MAX_LATITUDE = 85.05112878
+
+def _spread_bits(values):
+    """Insert a zero bit after each of the low 32 bits of values."""
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+def mercator_cells(coordinates, level=MAX_LEVEL):
+    """Web Mercator cell x, y of [lon, lat] rows at a level (cells per axis 2**level)."""
+    lon = np.asarray(coordinates[:, 0], dtype=np.float64)
+    lat = np.clip(np.asarray(coordinates[:, 1], dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    size = 2 ** level
+    x = (lon + 180) / 360 * size
+    y = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / np.pi) / 2 * size
+    return (np.clip(x, 0, size - 1).astype(np.int64),
+            np.clip(y, 0, size - 1).astype(np.int64))
+
+def morton_codes(coordinates):
+    """Morton code of each [lon, lat] row at MAX_LEVEL, -1 where not located."""
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    codes = np.full(len(coordinates), -1, dtype=np.int64)
+    located = ~np.isnan(coordinates).any(axis=1)
+    x, y = mercator_cells(coordinates[located])
+    codes[located] = (_spread_bits(x) | (_spread_bits(y) << np.uint64(1))).astype(np.int64)
+    return codes
+
+class ClusterIndex:
+    """Meter rows of each (OJ, OH) and Naziv TS group, sorted by Morton code."""
+
+    def __init__(self, store, groups):
+        self.store = store
+        self.groups = groups
+        self.codes = morton_codes(store.coordinates)
+        self.by_oj_oh = {key: self.ordered(rows) for key, rows in groups.by_oj_oh.items()}
+        self.by_ts = {ts: self.ordered(rows) for ts, rows in groups.by_ts.items()}
+
+    def ordered(self, rows):
+        """Located rows sorted by Morton code."""
+        rows = located_rows(self.store, rows)
+        return rows[np.argsort(self.codes[rows], kind='stable')]
+
+    def rows_for_oj_oh(self, oj_value, oh_value):
+        rows = self.by_oj_oh.get((self.groups.oj_key(oj_value), oh_value))
+        return rows if rows is not None else self.ordered(self.groups.rows_for_oj_oh(oj_value, oh_value))
+
+    def rows_for_ts(self, ts_naziv):
+        rows = self.by_ts.get(ts_naziv)
+        # The case-insensitive fallback is rare enough to sort per request
+        return rows if rows is not None else self.ordered(self.groups.rows_for_ts(ts_naziv))
+
+    def bounds(self, rows):
+        """[[south, west], [north, east]] of the rows, or None if there are none."""
+        if not len(rows):
+            return None
+        coordinates = self.store.coordinates[rows]
+        (west, south), (east, north) = coordinates.min(axis=0), coordinates.max(axis=0)
+        return [[float(south), float(west)], [float(north), float(east)]]
+
+    def cluster(self, rows, zoom, bbox=None):
+        """Clusters and single meter features of code-sorted rows at a zoom.
+
+        ``bbox`` (west, south, east, north) limits the result to a viewport.
+        Cells holding one meter, and every meter above MAX_CLUSTER_ZOOM, come
+        back as regular meter features.
+        """
+        coordinates = self.store.coordinates[rows]
+        if bbox is not None:
+            west, south, east, north = bbox
+            inside = ((coordinates[:, 0] >= west) & (coordinates[:, 0] <= east)
+                      & (coordinates[:, 1] >= south) & (coordinates[:, 1] <= north))
+            rows, coordinates = rows[inside], coordinates[inside]
+        if zoom > MAX_CLUSTER_ZOOM or not len(rows):
+            return [], meter_features(self.store, rows)
+
+        shift = np.int64(2 * (MAX_LEVEL - max(zoom, 0) - CELL_SHIFT))
+        keys = self.codes[rows] >> shift
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        counts = np.diff(np.append(starts, len(rows)))
+
+        singles = counts == 1
+        features = meter_features(self.store, np.sort(rows[starts[singles]]))
+
+        if singles.all():
+            return [], features
+        # reduceat runs each segment up to the next start, so it needs the
+        # starts of every run; the singles are dropped from its results
+        lon, lat = coordinates[:, 0], coordinates[:, 1]
+        clustered = ~singles
+        counts = counts[clustered]
+        centers = np.column_stack([np.add.reduceat(lon, starts), np.add.reduceat(lat, starts)])[clustered]
+        centers /= counts[:, None]
+        boxes = np.column_stack([np.minimum.reduceat(lon, starts), np.minimum.reduceat(lat, starts),
+                                 np.maximum.reduceat(lon, starts), np.maximum.reduceat(lat, starts)])[clustered]
+        clusters = [
+            {
+                'geometry': {'coordinates': center, 'type': 'Point'},
+                'properties': {'cluster': True, 'count': count, 'bbox': box},
+                'type': 'Feature',
+            }
+            for center, count, box in zip(centers.tolist(), counts.tolist(), boxes.tolist())
+        ]
+        return clusters, features
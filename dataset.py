@@ -0,0 +1,288 @@
+"""The loaded data and every index derived from it, as one swappable object.
+
+A ``Dataset`` is built completely from one snapshot before anything sees
+it, and never changed afterwards.  ``DatasetHolder`` publishes the current
+one with a single attribute assignment, so a reload (from the file watcher
+or the admin endpoint) swaps everything at once.  Requests pin the dataset
+they started with, and an old dataset is freed, its arrays unmapped, when
+the last request using it finishes.
+
+A reload passes the dataset it replaces, and the objects built only from
+sources or keys that did not change (the GeoJSON layers and their indexes,
+the name search indexes) are taken over from it rather than rebuilt; they
+are never mutated, so both datasets can share them.
+"""
+import logging
+import threading
+import time
+
+import snapshot
+from clusters import ClusterIndex
+from metrics import DATA_QUALITY_METERS, DATASET_PHASE_SECONDS, DATASET_RELOADS, phase
+from meter_store import GroupIndex, MeterStore, PointLookup
+from outages import OutageRollup
+from response_cache import ResponseCache
+from search_index import RastavljacIndex, SubstringIndex
+from spatial import FeatureLayer, MeterLayer
+from topology import Topology
+from validation import DataQuality
+
+logger = logging.getLogger(__name__)
+
+def trafostanica_info(feature):
+    """Popup data of one trafostanica feature."""
+    properties = feature['properties']
+    return {
+        "coordinates": feature['geometry']['coordinates'],
+        "naziv": properties['NAZIV'],
+        "snaga": properties['SNAGA'],
+        "broj_transformatora": properties['BR_TRANSFORMATORA'],
+        "konfiguracija_SN_postrojenja": properties['CONF_SN_POST'],
+        "napojna_trafostanica": properties['NAPOJNA_TS'],
+        "naziv_SN_odlaza": properties['ODLAZ_SN_NAZIV'],
+        "tip_trafostanice": properties['TIP_TS'],
+        "poslovnica": properties['POSLOVNICA'],
+        "tip_kucista": properties['TS_GD'],
+        "tip_izolacije": properties['TS_SN_POST'],
+        "vlasnik": properties['VLASNIK'],
+        "godina_izgradnje": properties['GODINA_IZGRADNJE'],
+    }
+
+class Dataset:
+    """Everything the endpoints read, built from one snapshot."""
+
+    def __init__(self, data_snapshot, dumps, previous=None):
+        started = time.perf_counter()
+        self.snapshot = data_snapshot
+        self.version = data_snapshot.build_id
+        self.built_at = data_snapshot.manifest.get('built_at')
+        self.changes = data_snapshot.manifest.get('changes')
+        # The previous dataset's layers, if their sources are unchanged
+        layers = previous if previous is not None and all(
+            _same_source(previous.snapshot, data_snapshot, name)
+            for name in ('trafostanice', 'rastavljaci')) else None
+
+        with phase(DATASET_PHASE_SECONDS, 'geojson'):
+            if layers is not None:
+                self.trafostanica_data = layers.trafostanica_data
+                self.rastavljac_data = layers.rastavljac_data
+            else:
+                self.trafostanica_data = data_snapshot.geojson('trafostanice')
+                self.rastavljac_data = data_snapshot.geojson('rastavljaci')
+
+        with phase(DATASET_PHASE_SECONDS, 'meter_store'):
+            # data.json coordinates by SIFRA
+            self.sifra_to_coordinates = PointLookup.from_snapshot(data_snapshot)
+
+            # Meter export, already cleaned and deduplicated by the snapshot build
+            self.meter_store = MeterStore.from_snapshot(data_snapshot)
+
+        with phase(DATASET_PHASE_SECONDS, 'group_indexes'):
+            # Customer search mapping: rows of each customer, keys in sorted order
+            self.kupac_to_rows = self.meter_store.groups('Kupac')
+
+            # Row positions by OJ, (OJ, OH) and Naziv TS for the map endpoints
+            self.meter_groups = GroupIndex(self.meter_store)
+
+        with phase(DATASET_PHASE_SECONDS, 'cluster_index'):
+            # The same groups sorted by Morton code, for server-side clustering
+            self.meter_clusters = ClusterIndex(self.meter_store, self.meter_groups)
+
+        with phase(DATASET_PHASE_SECONDS, 'search_indexes'):
+            # Autocomplete indexes over diacritic-insensitive, normalized names
+            self.kupac_index = _same_keys(previous and previous.kupac_index, self.kupac_to_rows)
+            self.ts_naziv_index = _same_keys(previous and previous.ts_naziv_index,
+                                             self.meter_groups.ts_names)
+            if layers is not None:
+                self.trafostanica_index = layers.trafostanica_index
+                self.rastavljac_index = layers.rastavljac_index
+                self.trafostanica_to_info = layers.trafostanica_to_info
+            else:
+                self.trafostanica_index = SubstringIndex(
+                    feature['properties']['NAZIV']
+                    for feature in self.trafostanica_data['features']
+                    if isinstance(feature.get('properties', {}).get('NAZIV'), str)
+                )
+                self.rastavljac_index = RastavljacIndex(self.rastavljac_data.get('features', []))
+
+                # Trafostanica mapping
+                self.trafostanica_to_info = {
+                    feature['properties']['NAZIV']: trafostanica_info(feature)
+                    for feature in self.trafostanica_data['features']
+                    if 'geometry' in feature and 'coordinates' in feature['geometry']
+                }
+
+        with phase(DATASET_PHASE_SECONDS, 'spatial_indexes'):
+            # Grid indexes for the viewport and nearest-neighbour endpoints
+            self.spatial = {'meters': MeterLayer(self.meter_store)}
+            if layers is not None:
+                self.spatial['trafostanice'] = layers.spatial['trafostanice']
+                self.spatial['rastavljaci'] = layers.spatial['rastavljaci']
+            else:
+                self.spatial['trafostanice'] = FeatureLayer(self.trafostanica_data['features'])
+                self.spatial['rastavljaci'] = FeatureLayer(self.rastavljac_data.get('features', []))
+
+        with phase(DATASET_PHASE_SECONDS, 'topology'):
+            # Supply graph napojna TS -> SN odlaz -> TS -> meters, for outages
+            self.topology = Topology(
+                self.trafostanica_data['features'],
+                self.rastavljac_data.get('features', []),
+                self.meter_store,
+                self.meter_groups,
+            )
+            # Meter, A.sn, tarifna grupa and SNAGA totals rolled up along it
+            self.outage_rollup = OutageRollup(self.topology, self.meter_store,
+                                              self.trafostanica_data['features'])
+
+        with phase(DATASET_PHASE_SECONDS, 'validation'):
+            # Unlocated meters, orphan TS names, shared Serijski and outliers
+            self.quality = DataQuality(self.meter_store, self.meter_groups, self.trafostanica_to_info)
+
+        # Encoded bodies of the responses that only change with the data and
+        # of repeated queries; they go away together with the dataset
+        self.response_cache = ResponseCache(dumps, self.version)
+        # Payloads built on first use, see memo()
+        self._memos = {}
+
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - started
+        DATASET_PHASE_SECONDS.set(round(self.load_seconds, 6), phase='total')
+
+    def memo(self, name, build):
+        """build() once per dataset.  Requests racing on the first call may
+        each build it; the first result is kept."""
+        value = self._memos.get(name)
+        if value is None:
+            value = self._memos.setdefault(name, build())
+        return value
+
+    def publish_metrics(self):
+        for issue, meters in self.quality.totals.items():
+            DATA_QUALITY_METERS.set(meters, issue=issue)
+
+    def info(self):
+        """Version and timing of this dataset, for monitoring."""
+        return {
+            "version": self.version,
+            "built_at": self.built_at,
+            "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.loaded_at)),
+            "load_seconds": round(self.load_seconds, 3),
+            "meters": len(self.meter_store),
+            "data_quality": self.quality.totals,
+            "response_cache": self.response_cache.stats(),
+            "changes": self.changes,
+        }
+
+def _same_source(old_snapshot, new_snapshot, name):
+    old = old_snapshot.manifest['sources'].get(name)
+    new = new_snapshot.manifest['sources'].get(name)
+    return old is not None and new is not None and old['sha256'] == new['sha256']
+
+def _same_keys(index, keys):
+    """index if it was built over exactly these keys, else a new SubstringIndex."""
+    keys = list(keys)
+    if index is not None and index.keys == keys:
+        return index
+    return SubstringIndex(keys)
+
+class DatasetHolder:
+    """The current dataset, and the reload that replaces it."""
+
+    def __init__(self, dumps, root=snapshot.SNAPSHOT_DIR, sources=snapshot.SOURCE_FILES):
+        self.dumps = dumps
+        self.root = root
+        self.sources = sources
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._next_follow = 0.0
+        self.reloads = 0
+        # Called with each new dataset before it is swapped in, e.g. to warm its caches
+        self.warmers = []
+        self.current = Dataset(snapshot.ensure_snapshot(root, sources), dumps)
+        self.current.publish_metrics()
+
+    def is_stale(self):
+        """Whether a newer snapshot exists or a source changed since the current one."""
+        on_disk = snapshot.read_current(self.root)
+        if on_disk is None or on_disk.build_id != self.current.version:
+            return True
+        return not on_disk.is_fresh(self.sources)
+
+    def reload(self, force=False):
+        """Rebuild the snapshot if needed, load it and swap it in.
+
+        Requests keep being served from the current dataset until the new
+        one is complete.  Returns True when the dataset was replaced.
+        """
+        with self._reload_lock:
+            data_snapshot = snapshot.ensure_snapshot(self.root, self.sources, force=force)
+            if data_snapshot.build_id == self.current.version and not force:
+                return False
+            dataset = Dataset(data_snapshot, self.dumps, previous=self.current)
+            self.warm(dataset)
+            previous, self.current = self.current, dataset
+            dataset.publish_metrics()
+            self.reloads += 1
+        logger.info("Dataset %s replaced by %s (loaded in %.1fs)",
+                    previous.version, dataset.version, dataset.load_seconds)
+        return True
+
+    def warm(self, dataset):
+        for warmer in self.warmers:
+            try:
+                warmer(dataset)
+            except Exception:
+                # A cold cache is slower, not wrong
+                logger.exception("Warming dataset %s failed", dataset.version)
+
+    def follow(self, interval):
+        """Reload when another process made a different snapshot current.
+
+        Called on every request, it reads CURRENT at most once per interval
+        seconds, so a reload done by one worker (an admin reload, or its
+        watcher) reaches the other workers sharing the snapshot directory
+        within about interval seconds plus the load time.
+        """
+        now = time.monotonic()
+        if interval <= 0 or now < self._next_follow:
+            return
+        self._next_follow = now + interval
+        build_id = snapshot.read_current_id(self.root)
+        if build_id is not None and build_id != self.current.version and not self._reload_lock.locked():
+            logger.info("Snapshot %s was made current elsewhere, reloading", build_id)
+            self.reload_in_background()
+
+    def reload_in_background(self, force=False):
+        thread = threading.Thread(target=self._reload_logged, args=(force,),
+                                  name='dataset-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def _reload_logged(self, force=False):
+        try:
+            replaced = self.reload(force)
+        except Exception:
+            DATASET_RELOADS.inc(result='failed')
+            # A broken export must not take down a worker with good data
+            logger.exception("Dataset reload failed, keeping %s", self.current.version)
+        else:
+            DATASET_RELOADS.inc(result='replaced' if replaced else 'unchanged')
+
+    def watch(self, interval):
+        """Poll the sources every interval seconds and reload when they change."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    stale = self.is_stale()
+                except OSError:
+                    logger.exception("Checking the data sources failed")
+                    continue
+                if stale:
+                    self._reload_logged()
+
+        self._watcher = threading.Thread(target=run, name='dataset-watcher', daemon=True)
+        self._watcher.start()
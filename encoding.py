@@ -0,0 +1,175 @@
+"""JSON encoding of the large responses, and gzip for everything else.
+
+Meter layers used to be built as one dict per feature and then walked
+again by ``jsonify``; for a whole OJ that encode cost as much as the query.
+``feature_collection`` writes the FeatureCollection text straight from
+the store columns instead.  Each property is turned into JSON fragments for
+all rows at once (category columns encode each distinct value once and
+index the result by code), and the fragments of all features are joined
+in one go.  The output equals what ``jsonify`` makes of
+``meter_features``: sorted keys, 'N/A' for missing values and no whitespace.
+
+``JSONProvider`` gives every other ``jsonify`` the faster orjson encoder
+when it is installed, with the same output as Flask's provider except that
+text is sent as UTF-8 rather than ``\\u`` escapes.  ``JSON_BACKEND=json``
+keeps the standard library.
+
+Coordinates are rounded to ``COORDINATE_DECIMALS`` places (6 is about
+10 cm, data.json carries 13) before they are written.  Responses that are
+not pre-compressed by the response cache are gzipped by ``gzip_response``
+when the client accepts it.
+"""
+import gzip
+import json
+import os
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+from features import COORDINATE_DECIMALS, MISSING, json_values, located_rows
+
+try:
+    import orjson
+except ImportError:  # optional, json is the fallback
+    orjson = None
+
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'orjson' if orjson is not None else 'json')
+# Smaller bodies are not worth a gzip member header and the CPU
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+GZIP_MIMETYPES = frozenset({'application/json', 'application/geo+json', 'text/csv', 'text/plain'})
+
+# ============ JSON BACKEND ============
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with orjson where it can."""
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        # orjson only writes compact JSON, pretty-printing stays with json
+        if JSON_BACKEND == 'orjson' and kwargs.get('indent') is None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=(
+                    orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                    | orjson.OPT_PASSTHROUGH_DATACLASS)).decode('utf-8')
+            except TypeError:
+                # e.g. integers beyond 64 bits, which json handles
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if JSON_BACKEND == 'orjson' and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+def dumps(value):
+    """Compact JSON text of value, as in the responses."""
+    if JSON_BACKEND == 'orjson':
+        try:
+            return orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+def _number_texts(values):
+    """JSON text of each number in a list, from one encode of the whole list."""
+    if JSON_BACKEND == 'orjson':
+        text = orjson.dumps(values).decode('ascii')
+    else:
+        text = json.dumps(values, separators=(',', ':'))
+    # Numbers have no commas, so the list splits back into its items
+    return text[1:-1].split(',') if values else []
+
+# ============ FEATURE COLLECTIONS ============
+
+def json_fragments(column, rows):
+    """JSON text of a store column's value for each of rows, 'N/A' if missing."""
+    raw = np.asarray(column.array[rows])
+    if column.kind == 'category':
+        # Only the codes present are encoded, code -1 is a missing value
+        codes, inverse = np.unique(raw, return_inverse=True)
+        table = np.array([dumps(column.table[code]) if code >= 0 else dumps(MISSING)
+                          for code in codes.tolist()], dtype=object)
+        return table[inverse].tolist()
+    if column.kind == 'numeric' and raw.dtype.kind in 'iu':
+        return _number_texts(raw.tolist())
+    if column.kind == 'numeric' and raw.dtype.kind == 'f':
+        isnan = np.isnan(raw)
+        fragments = np.array(_number_texts(raw.tolist()), dtype=object)
+        fragments[isnan] = dumps(MISSING)
+        return fragments.tolist()
+    # Dates and anything else: encode each distinct value once
+    encoded = {}
+    return [encoded[value] if value in encoded else encoded.setdefault(value, dumps(value))
+            for value in json_values(column, rows)]
+
+def rounded_coordinates(store, rows):
+    """Longitude, latitude, longitude, ... of rows at COORDINATE_DECIMALS places, as JSON fragments."""
+    coordinates = np.round(store.coordinates[rows], COORDINATE_DECIMALS)
+    return _number_texts(coordinates.ravel().tolist())
+
+def feature_template(names):
+    """Text of one point feature around its values: the pieces that go before
+    the longitude, the latitude and each property in turn, and the end."""
+    pieces = ['{"geometry":{"coordinates":[', ',', '],"type":"Point"},"properties":{']
+    for i, name in enumerate(names):
+        pieces[-1] += ',' * (i > 0) + dumps(name) + ':'
+        pieces.append('')
+    pieces[-1] += '},"type":"Feature"}'
+    return pieces
+
+def join_rows(pieces, columns):
+    """Rows of pieces interleaved with the column values, separated by commas.
+
+    One grid of all the strings and a single join, rather than a format
+    call per row.
+    """
+    grid = np.empty((len(columns[0]), len(pieces) + len(columns)), dtype=object)
+    grid[:, 0::2] = pieces[:-1] + [pieces[-1] + ',']
+    for i, column in enumerate(columns):
+        grid[:, 2 * i + 1] = column
+    return ''.join(grid.ravel().tolist())[:-1]
+
+def feature_collection(store, rows, properties, extra=None):
+    """JSON bytes of the map payload of the located meters among rows.
+
+    The payload is ``{"center": [lat, lon], "features": [...], "total": n}``
+    with the features of ``meter_features`` in row order, the center being
+    the first one, plus the members of ``extra``; None when none of the
+    rows is located.
+    """
+    rows = located_rows(store, rows)
+    if not len(rows):
+        return None
+    coordinates = rounded_coordinates(store, rows)
+    lons, lats = coordinates[0::2], coordinates[1::2]
+    names = sorted(properties)
+    columns = [json_fragments(store.columns[properties[name]], rows) for name in names]
+    features = join_rows(feature_template(names), [lons, lats] + columns)
+    members = {'total': len(rows), **(extra or {})}
+    rest = ''.join(f',{dumps(name)}:{dumps(members[name])}' for name in sorted(members))
+    return f'{{"center":[{lats[0]},{lons[0]}],"features":[{features}]{rest}}}\n'.encode('utf-8')
+
+# ============ COMPRESSION ============
+
+def gzip_response(request, response):
+    """Gzip a buffered response in place if the client accepts it."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in GZIP_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] <= 0:
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    # A strong validator of the plain body would be wrong for the gzipped one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag + '-gz')
+    return response
@@ -0,0 +1,137 @@
+"""Streaming export of a filtered meter set as CSV, GeoJSON or Parquet.
+
+Rows are read from the store columns ``EXPORT_CHUNK`` at a time and each
+chunk is encoded and handed to the response before the next one is read,
+so the memory used does not grow with the size of the export.  Every
+column of the cleaned export is included, dates formatted like
+``format_date`` (dd.mm.yyyy), plus the coordinates from data.json.
+"""
+import csv
+import io
+import json
+import math
+
+from features import json_values
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_CHUNK = 2000
+FORMATS = {
+    # Werkzeug adds the charset to text/* mimetypes
+    'csv': ('text/csv', 'csv'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+COORDINATE_COLUMNS = ('lon', 'lat')
+
+def export_columns(store):
+    return list(store.columns) + list(COORDINATE_COLUMNS)
+
+def iter_chunks(store, rows, chunk_size=EXPORT_CHUNK):
+    """{column: values} per chunk of rows, missing values None."""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        values = {name: json_values(column, chunk, None) for name, column in store.columns.items()}
+        for i, name in enumerate(COORDINATE_COLUMNS):
+            values[name] = _floats(store.coordinates[chunk, i])
+        yield values
+
+def _floats(array):
+    return [None if math.isnan(value) else value for value in array.tolist()]
+
+def iter_csv(store, rows):
+    # The BOM makes Excel read the file as UTF-8
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(export_columns(store))
+    for values in iter_chunks(store, rows):
+        writer.writerows(zip(*values.values()))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def iter_geojson(store, rows):
+    yield '{"type":"FeatureCollection","features":['
+    first = True
+    for values in iter_chunks(store, rows):
+        names = list(values)
+        features = []
+        for record in zip(*values.values()):
+            properties = dict(zip(names, record))
+            lon, lat = properties.pop('lon'), properties.pop('lat')
+            geometry = None if lon is None else {'type': 'Point', 'coordinates': [lon, lat]}
+            features.append(json.dumps({'type': 'Feature', 'geometry': geometry, 'properties': properties},
+                                       ensure_ascii=False, separators=(',', ':')))
+        if features:
+            yield ('' if first else ',') + ','.join(features)
+            first = False
+    yield ']}\n'
+
+class _Drain(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+def parquet_schema(store):
+    fields = []
+    for name, column in store.columns.items():
+        dtype = column.array.dtype.kind
+        if column.kind == 'numeric' and dtype == 'b':
+            fields.append(pa.field(name, pa.bool_()))
+        elif column.kind == 'numeric' and dtype in 'iu':
+            fields.append(pa.field(name, pa.int64()))
+        elif column.kind == 'numeric':
+            fields.append(pa.field(name, pa.float64()))
+        elif column.kind == 'category' and column.table and all(
+                isinstance(value, bool) for value in column.table):
+            fields.append(pa.field(name, pa.bool_()))
+        else:
+            # Dates stay dd.mm.yyyy text, like the other formats, and
+            # mixed tables (e.g. T holds 1, 2, 3 and 'K') become text
+            fields.append(pa.field(name, pa.string()))
+    fields += [pa.field(name, pa.float64()) for name in COORDINATE_COLUMNS]
+    return pa.schema(fields)
+
+def _text(values):
+    return [value if value is None or isinstance(value, str) else str(value) for value in values]
+
+def iter_parquet(store, rows):
+    """One row group per chunk, written out as soon as it is encoded."""
+    sink = _Drain()
+    schema = parquet_schema(store)
+    text = [field.name for field in schema if field.type == pa.string()]
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for values in iter_chunks(store, rows):
+            for name in text:
+                values[name] = _text(values[name])
+            writer.write_table(pa.Table.from_pydict(values, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+WRITERS = {'csv': iter_csv, 'geojson': iter_geojson, 'parquet': iter_parquet}
+
+def available_formats():
+    return [name for name in FORMATS if name != 'parquet' or pq is not None]
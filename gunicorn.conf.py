@@ -0,0 +1,44 @@
+"""gunicorn settings: load the dataset once in the master, share it with the workers.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+With ``preload_app`` the master imports app.py, so the snapshot arrays are
+mapped and the indexes built before forking, and every worker starts with
+the same pages.  The meter columns are read-only file mappings, shared
+through the page cache no matter what; the Python objects (indexes, GeoJSON)
+stay shared copy-on-write as long as nothing writes to them.  The
+collector would, by touching every tracked object on its first full
+collection in each worker, so they are frozen out of it before the fork.
+
+Only what the master loaded is shared.  A reload happens in each worker
+after the fork: the new snapshot's columns are again file mappings and
+shared, GeoJSON layers and name indexes of unchanged sources are reused,
+but the indexes rebuilt from the new data are private to every worker
+until the next restart.  benchmarks/bench_worker_rss.py measures it.
+
+PRELOAD_APP=0 restores the old behaviour of every worker loading its own
+copy.
+"""
+import gc
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = os.environ.get('PRELOAD_APP', '1') != '0'
+
+if preload_app:
+    # The master must not run the source watcher: threads do not survive
+    # the fork, and each worker starts its own in post_fork below
+    os.environ['DATASET_PRELOADED'] = '1'
+
+def when_ready(server):
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+
+def post_fork(server, worker):
+    app = sys.modules.get('app')
+    if app is not None:
+        app.datasets.watch(app.WATCH_INTERVAL)
@@ -0,0 +1,450 @@
+"""Incremental ingestion of a new meter export against the current snapshot.
+
+The monthly ``EP_Eksport_Uredjaja.xlsx`` changes a small share of its
+meters, but a full snapshot build parses every cell of it with pandas.
+Here the sheet is streamed from the workbook zip as raw row XML instead.
+Every data row is hashed with its cell references reduced to column letters
+and its shared strings resolved, so a row hashes the same wherever it sits
+in the sheet.  The snapshot keeps the hash of each export row it was built
+from, so only rows with an unknown hash are parsed into values; the rest
+take their values from the current snapshot.  The file is still read end to
+end, but unchanged rows cost a regex match and a hash instead of cell
+conversion, type inference and encoding.
+
+``ExportDelta`` matches the new rows with the snapshot, applies the export's
+deduplication to the keys, and reports the meters inserted, updated and
+deleted by (Šifra, Serijski).  ``snapshot.update_snapshot`` writes the new
+snapshot from it.  Anything a row-level update cannot reproduce exactly, a
+different column layout or a column whose type would change, raises
+``DeltaUnsupported`` and the snapshot is rebuilt in full.
+
+Run against the snapshot in the working directory, optionally checking the
+result against a full build::
+
+    python ingest.py [--root snapshot] [--verify]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import posixpath
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_ISO8601, from_excel
+
+logger = logging.getLogger(__name__)
+
+SHEET = 'Eksport_uredjaja'
+# Title rows above the header, as pd.read_excel(skiprows=6) skips them
+SKIP_ROWS = 6
+KEY_COLUMNS = ('Šifra', 'Serijski')
+# Strings pd.read_excel reads as missing values (its default na_values)
+NA_STRINGS = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+})
+CHUNK_SIZE = 1 << 20
+REPORT_EXAMPLES = 20
+
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_ROW = re.compile(rb'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_ROW_NUMBER = re.compile(rb'<row\b[^>]*?\sr="(\d+)"')
+_ROW_START = re.compile(rb'<row\b[^>]*>')
+_ROW_ELEMENT = b'<row xmlns="' + _MAIN_NS[1:-1].encode('ascii') + b'">'
+_CELL_REF = re.compile(rb'(<c\b[^>]*?\sr="[A-Z]+)\d+"')
+_SHARED_VALUE = re.compile(rb'(<c\b[^>]*?\st="s"[^>]*>)<v>(\d+)</v>')
+
+class DeltaUnsupported(Exception):
+    """The new export cannot be applied row by row; rebuild the snapshot."""
+
+# ============ WORKBOOK STREAMING ============
+
+def _text(element):
+    """Plain text of a shared or inline string: its runs without phonetics."""
+    parts = [element.findtext(_MAIN_NS + 't') or '']
+    parts += [run.findtext(_MAIN_NS + 't') or '' for run in element.findall(_MAIN_NS + 'r')]
+    return ''.join(parts)
+
+class Workbook:
+    """Just enough of an xlsx package to stream one sheet's rows."""
+
+    def __init__(self, path, sheet=SHEET):
+        self.zip = zipfile.ZipFile(path)
+        workbook = ET.fromstring(self.zip.read('xl/workbook.xml'))
+        properties = workbook.find(_MAIN_NS + 'workbookPr')
+        date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        targets = {}
+        relations = ET.fromstring(self.zip.read('xl/_rels/workbook.xml.rels'))
+        for relation in relations.iter(_PACKAGE_REL_NS + 'Relationship'):
+            target = relation.get('Target')
+            target = target.lstrip('/') if target.startswith('/') else posixpath.join('xl', target)
+            targets[relation.get('Id')] = target
+            if relation.get('Type', '').endswith('/sharedStrings'):
+                self.shared_strings_path = target
+        for element in workbook.iter(_MAIN_NS + 'sheet'):
+            if element.get('name') == sheet:
+                self.sheet_path = targets[element.get(_REL_NS + 'id')]
+                break
+        else:
+            raise KeyError(f"Worksheet {sheet} does not exist.")
+
+        self.shared_strings = self._read_shared_strings()
+        self.styles_sha256, self.date_styles = self._read_styles()
+
+    def _read_shared_strings(self):
+        path = getattr(self, 'shared_strings_path', None)
+        if path is None or path not in self.zip.namelist():
+            return []
+        strings = []
+        with self.zip.open(path) as file:
+            for _, element in ET.iterparse(file):
+                if element.tag == _MAIN_NS + 'si':
+                    strings.append(_text(element))
+                    element.clear()
+        return strings
+
+    def _read_styles(self):
+        """Checksum of the styles part and the cell style ids formatted as dates."""
+        if 'xl/styles.xml' not in self.zip.namelist():
+            return None, frozenset()
+        raw = self.zip.read('xl/styles.xml')
+        styles = ET.fromstring(raw)
+        formats = dict(BUILTIN_FORMATS)
+        for number_format in styles.iter(_MAIN_NS + 'numFmt'):
+            formats[int(number_format.get('numFmtId'))] = number_format.get('formatCode')
+        cell_formats = styles.find(_MAIN_NS + 'cellXfs')
+        date_styles = set()
+        for style_id, xf in enumerate(cell_formats if cell_formats is not None else ()):
+            code = formats.get(int(xf.get('numFmtId', 0)))
+            if code is not None and is_date_format(code):
+                date_styles.add(style_id)
+        return hashlib.sha256(raw).hexdigest(), frozenset(date_styles)
+
+    def iter_rows(self):
+        """(row number, raw row XML) of every row element, in sheet order."""
+        with self.zip.open(self.sheet_path) as file:
+            pending = b''
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                pending += chunk
+                end = 0
+                for match in _ROW.finditer(pending):
+                    row = match.group()
+                    number = _ROW_NUMBER.match(row)
+                    yield (int(number.group(1)) if number else None), row
+                    end = match.end()
+                pending = pending[end:]
+
+    def row_hash(self, row):
+        """Position-independent digest of a raw row, as an unsigned 64-bit int."""
+        body = _CELL_REF.sub(rb'\1"', _ROW_START.sub(b'', row, count=1))
+        digest = hashlib.blake2b(digest_size=8)
+        if self.shared_strings:
+            indexes = _SHARED_VALUE.findall(body)
+            body = _SHARED_VALUE.sub(rb'\1', body)
+            digest.update('\0'.join(self.shared_strings[int(i)] for _, i in indexes).encode('utf-8'))
+        digest.update(body)
+        return int.from_bytes(digest.digest(), 'little')
+
+    def parse_row(self, row):
+        """Cell values of a raw row by column position, as pd.read_excel sees them.
+
+        Missing values, error cells and the strings pandas reads as missing
+        are None; integral numbers are ints and date-formatted ones datetimes.
+        """
+        start = _ROW_START.match(row).group()
+        if start.endswith(b'/>'):
+            return []
+        # The row's own attributes may use prefixes declared on the worksheet
+        element = ET.fromstring(_ROW_ELEMENT + row[len(start):])
+        values = {}
+        column = -1
+        for cell in element.iter(_MAIN_NS + 'c'):
+            reference = cell.get('r')
+            if reference:
+                column = column_index_from_string(reference.rstrip('0123456789')) - 1
+            else:
+                column += 1
+            values[column] = self._cell_value(cell)
+        width = max(values, default=-1) + 1
+        return [values.get(i) for i in range(width)]
+
+    def _cell_value(self, cell):
+        kind = cell.get('t', 'n')
+        if kind == 'inlineStr':
+            inline = cell.find(_MAIN_NS + 'is')
+            value = _text(inline) if inline is not None else None
+        else:
+            value = cell.findtext(_MAIN_NS + 'v') or None
+            if value is None or kind == 'e':
+                return None
+            if kind == 'n':
+                value = float(value) if any(c in value for c in '.Ee') else int(value)
+                if int(cell.get('s', 0)) in self.date_styles:
+                    return from_excel(value, self.epoch)
+                return int(value) if float(value).is_integer() else value
+            if kind == 's':
+                value = self.shared_strings[int(value)]
+            elif kind == 'b':
+                return bool(int(value))
+            elif kind == 'd':
+                return from_ISO8601(value)
+        if value is None or value in NA_STRINGS:
+            return None
+        return value
+
+class ExportRows:
+    """The header and the data rows of the export sheet, hashed.
+
+    Raw XML is kept only for the rows ``keep(hash)`` asks for, the ones that
+    will have to be parsed.
+    """
+
+    def __init__(self, path, keep=lambda row_hash: False, sheet=SHEET, skip_rows=SKIP_ROWS):
+        self.workbook = Workbook(path, sheet)
+        self.header = None
+        hashes = []
+        self.raw = {}
+        number = 0
+        for row_number, row in self.workbook.iter_rows():
+            number = row_number or number + 1
+            if self.header is None:
+                if number <= skip_rows:
+                    continue
+                self.header = self._names(self.workbook.parse_row(row))
+                continue
+            row_hash = self.workbook.row_hash(row)
+            if keep(row_hash):
+                self.raw[len(hashes)] = row
+            hashes.append(row_hash)
+        if self.header is None:
+            raise DeltaUnsupported("the export sheet has no header row")
+        self.hashes = np.array(hashes, dtype=np.uint64)
+        # Columns kept by the snapshot build, by position in the sheet
+        self.columns = {i: name for i, name in enumerate(self.header)
+                        if not name.startswith('Unnamed')}
+
+    @staticmethod
+    def _names(values):
+        # pandas names a blank header cell "Unnamed: <position>"
+        return [str(value).strip() if value is not None else f'Unnamed: {i}'
+                for i, value in enumerate(values)]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def values(self, position):
+        """Values of a kept data row by column name."""
+        values = self.workbook.parse_row(self.raw[position])
+        return {name: values[i] if i < len(values) else None for i, name in self.columns.items()}
+
+def drop_duplicate_meters(df):
+    """Drop repeated meters from the export, keeping its positions as the index.
+
+    A repeated Šifra without a Naziv TS goes first, then every repeated
+    (Serijski, Šifra) pair after its first row.
+    """
+    df = df[~(df.duplicated(subset='Šifra') & df['Naziv TS'].isnull())]
+    df['Serijski'] = df['Serijski'].astype(int)
+    df['Šifra'] = df['Šifra'].astype(int)
+    return df.drop_duplicates(subset=['Serijski', 'Šifra'])
+
+# ============ DELTA ============
+
+class ExportState:
+    """What a snapshot remembers of the export rows it was built from.
+
+    Per export data row: its hash, its snapshot row (-1 if it was dropped as
+    a duplicate), and the Šifra, Serijski and missing Naziv TS that the
+    deduplication looks at.
+    """
+
+    ARRAYS = ('hash', 'row', 'sifra', 'serijski', 'naziv_missing')
+
+    def __init__(self, arrays, columns, styles_sha256):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.columns = columns
+        self.styles_sha256 = styles_sha256
+
+    @classmethod
+    def from_export(cls, rows, raw_df, positions):
+        """State of a full build: the hashed rows, the DataFrame pd.read_excel
+        made of them and the positions the deduplication kept."""
+        row = np.full(len(raw_df), -1, dtype=np.int64)
+        row[np.asarray(positions)] = np.arange(len(positions))
+        return cls({
+            'hash': rows.hashes,
+            'row': row,
+            'sifra': pd.to_numeric(raw_df['Šifra'], errors='coerce').to_numpy(np.float64),
+            'serijski': pd.to_numeric(raw_df['Serijski'], errors='coerce').to_numpy(np.float64),
+            'naziv_missing': raw_df['Naziv TS'].isnull().to_numpy(),
+        }, list(rows.columns.values()), rows.workbook.styles_sha256)
+
+class ExportDelta:
+    """Rows of a new export matched against the snapshot built from the last one."""
+
+    def __init__(self, state, path, store_columns, base=None):
+        started = time.perf_counter()
+        self.base = base
+        # Last export row of each hash, preferring one the snapshot kept
+        source_by_hash = {}
+        kept = (state.row >= 0).tolist()
+        for source, row_hash in enumerate(state.hash.tolist()):
+            previous = source_by_hash.get(row_hash)
+            if previous is None or kept[source] or not kept[previous]:
+                source_by_hash[row_hash] = source
+
+        # Rows to parse: new ones and those the last build dropped as duplicates
+        def keep(row_hash):
+            source = source_by_hash.get(row_hash)
+            return source is None or not kept[source]
+
+        rows = ExportRows(path, keep)
+        if rows.workbook.styles_sha256 != state.styles_sha256:
+            raise DeltaUnsupported("the workbook's cell styles changed")
+        if list(rows.columns.values()) != state.columns:
+            raise DeltaUnsupported("the export's columns changed")
+        if list(store_columns) != state.columns:
+            raise DeltaUnsupported("the snapshot's columns differ from its export")
+        self.rows = rows
+
+        source = np.array([source_by_hash.get(row_hash, -1) for row_hash in rows.hashes.tolist()],
+                          dtype=np.int64)
+        parsed = {position: rows.values(position) for position in np.flatnonzero(source < 0).tolist()}
+        self.parsed_rows = len(parsed)
+        # pd.read_excel drops blank rows at the end of the sheet
+        end = len(rows)
+        while end - 1 in parsed and all(value is None for value in parsed[end - 1].values()):
+            del parsed[end - 1]
+            end -= 1
+        rows.hashes, source = rows.hashes[:end], source[:end]
+
+        sifra = np.where(source >= 0, state.sifra[source], np.nan)
+        serijski = np.where(source >= 0, state.serijski[source], np.nan)
+        naziv_missing = np.where(source >= 0, state.naziv_missing[source], False)
+        for position, values in parsed.items():
+            sifra[position] = _key_number(values['Šifra'])
+            serijski[position] = _key_number(values['Serijski'])
+            naziv_missing[position] = values['Naziv TS'] is None
+
+        keys = pd.DataFrame({'Šifra': sifra, 'Serijski': serijski,
+                             'Naziv TS': np.where(naziv_missing, None, '')})
+        try:
+            positions = drop_duplicate_meters(keys).index.to_numpy()
+        except (TypeError, ValueError) as e:
+            raise DeltaUnsupported(f"invalid Šifra or Serijski: {e}") from e
+
+        # Snapshot row each new row copies, -1 where its values are parsed
+        old_rows = np.where(source[positions] >= 0, state.row[np.maximum(source[positions], 0)], -1)
+        for position in positions[old_rows < 0].tolist():
+            if position not in parsed:
+                parsed[position] = rows.values(position)
+        self.positions = positions
+        self.old_rows = old_rows
+        self.values = [parsed[position] for position in positions[old_rows < 0].tolist()]
+
+        self.sifra = sifra[positions].astype(np.int64)
+        self.serijski = serijski[positions].astype(np.int64)
+        self.state = ExportState({
+            'hash': rows.hashes,
+            'row': _new_rows(len(rows), positions),
+            'sifra': sifra,
+            'serijski': serijski,
+            'naziv_missing': naziv_missing,
+        }, state.columns, state.styles_sha256)
+        self.seconds = time.perf_counter() - started
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def changed(self):
+        """Positions in the new snapshot of the rows whose values are new."""
+        return np.flatnonzero(self.old_rows < 0)
+
+    def report(self, old_store):
+        """Meters inserted, updated and deleted, by (Šifra, Serijski)."""
+        changed = self.changed
+        new_keys = {(int(s), int(k)): i for s, k, i in
+                    zip(self.sifra[changed].tolist(), self.serijski[changed].tolist(), changed.tolist())}
+        referenced = np.zeros(len(old_store), dtype=bool)
+        referenced[self.old_rows[self.old_rows >= 0]] = True
+        gone = np.flatnonzero(~referenced)
+
+        updated, deleted = [], []
+        changed_columns = {}
+        for old_row, key in zip(gone.tolist(), zip(old_store.sifra[gone].tolist(),
+                                                   old_store.serijski[gone].tolist())):
+            new_row = new_keys.pop(key, None)
+            if new_row is None:
+                deleted.append(key)
+                continue
+            updated.append(key)
+            values = self.values[int(np.searchsorted(changed, new_row))]
+            for name, column in old_store.columns.items():
+                if not _same_value(column.value(old_row), values[name]):
+                    changed_columns[name] = changed_columns.get(name, 0) + 1
+        inserted = list(new_keys)
+
+        return {
+            'base': self.base,
+            'meters': len(self),
+            'export_rows': len(self.rows),
+            'parsed_rows': self.parsed_rows,
+            'inserted': len(inserted),
+            'updated': len(updated),
+            'deleted': len(deleted),
+            'changed_columns': dict(sorted(changed_columns.items())),
+            'seconds': round(self.seconds, 3),
+            'examples': {
+                'inserted': [list(key) for key in inserted[:REPORT_EXAMPLES]],
+                'updated': [list(key) for key in updated[:REPORT_EXAMPLES]],
+                'deleted': [list(key) for key in deleted[:REPORT_EXAMPLES]],
+            },
+        }
+
+def _key_number(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    raise DeltaUnsupported(f"non-numeric key {value!r}")
+
+def _new_rows(count, positions):
+    rows = np.full(count, -1, dtype=np.int64)
+    rows[positions] = np.arange(len(positions))
+    return rows
+
+def _same_value(old, new):
+    if new is None:
+        return pd.isna(old)
+    if isinstance(old, pd.Timestamp):
+        return old == pd.Timestamp(new)
+    return old == new
+
+if __name__ == '__main__':
+    import snapshot
+
+    parser = argparse.ArgumentParser(description="Apply a new meter export to the snapshot.")
+    parser.add_argument('--root', default=snapshot.SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument('--verify', action='store_true',
+                        help="check the result against a full build in a scratch directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    updated = snapshot.ensure_snapshot(args.root)
+    print(json.dumps(updated.manifest.get('changes'), ensure_ascii=False, indent=2))
+    if args.verify:
+        snapshot.verify_snapshot(updated)
@@ -0,0 +1,280 @@
+"""Compact, array-backed store for the meter export.
+
+Rows keep the order of the export.  Šifra and Serijski are int64 arrays with
+stable argsort permutations stored in the snapshot, so lookups are a binary
+search instead of a dict of pandas Series.  Text columns stay dictionary
+encoded: an int32 code per row (-1 for missing) and one small table of
+distinct values, so the per-row cost is a few bytes per column.
+"""
+import numpy as np
+import pandas as pd
+
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+EMPTY_ROWS = np.empty(0, dtype=np.int64)
+
+def sorted_index(keys):
+    """Stable sort permutation of keys and the sorted keys, saved with the snapshot."""
+    order = np.argsort(keys, kind='stable').astype(np.int64)
+    return order, np.asarray(keys)[order]
+
+def find_last(sorted_keys, order, key):
+    """Row of the last occurrence of key in export order, or None.
+
+    Later rows win, exactly like the dicts built with ``dict(zip(...))``
+    that this replaces.
+    """
+    if not INT64_MIN <= key <= INT64_MAX:
+        return None
+    i = int(np.searchsorted(sorted_keys, key, side='right')) - 1
+    if i < 0 or sorted_keys[i] != key:
+        return None
+    return int(order[i])
+
+def find_last_many(sorted_keys, order, keys):
+    """``find_last`` for an int64 array of keys; -1 where a key is absent."""
+    keys = np.asarray(keys, dtype=np.int64)
+    rows = np.full(len(keys), -1, dtype=np.int64)
+    if not len(sorted_keys):
+        return rows
+    i = np.searchsorted(sorted_keys, keys, side='right') - 1
+    found = i >= 0
+    found[found] = sorted_keys[i[found]] == keys[found]
+    rows[found] = order[i[found]]
+    return rows
+
+def aligned_coordinates(sifra, points_order, points_sorted, points_coordinates):
+    """[lon, lat] of each meter from the data.json points, NaN where missing."""
+    coordinates = np.full((len(sifra), 2), np.nan)
+    rows = find_last_many(points_sorted, points_order, sifra)
+    found = rows >= 0
+    coordinates[found] = points_coordinates[rows[found]]
+    return coordinates
+
+class PointLookup:
+    """data.json coordinates by SIFRA, binary search over the sorted codes."""
+
+    def __init__(self, order, sorted_sifra, coordinates):
+        self.order = order
+        self.sorted_sifra = sorted_sifra
+        self.coordinates = coordinates
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.array('points_sifra_order'),
+                   snapshot.array('points_sifra_sorted'),
+                   snapshot.array('points_coordinates'))
+
+    def __len__(self):
+        return len(self.sorted_sifra)
+
+    def get(self, sifra):
+        """[lon, lat] for a SIFRA, or None."""
+        row = find_last(self.sorted_sifra, self.order, sifra)
+        if row is None:
+            return None
+        return self.coordinates[row].tolist()
+
+class Column:
+    """One stored column: its kind, the raw array and the dictionary table."""
+
+    def __init__(self, name, kind, array, table=None):
+        self.name = name
+        self.kind = kind
+        self.array = array
+        self.table = table
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.array)
+
+    @property
+    def lookup(self):
+        """Object array of the table with a trailing NaN for code -1."""
+        if self._lookup is None:
+            self._lookup = np.array(list(self.table) + [np.nan], dtype=object)
+        return self._lookup
+
+    def value(self, row):
+        raw = self.array[row]
+        if self.kind == 'category':
+            return self.table[raw] if raw >= 0 else np.nan
+        if self.kind == 'datetime':
+            return pd.NaT if raw == INT64_MIN else pd.Timestamp(int(raw))
+        # Native scalar, as a row of the mixed-type DataFrame used to give
+        return raw.item()
+
+    def take(self, rows):
+        """Decode the values of the given rows into a numpy array."""
+        raw = self.array[rows]
+        if self.kind == 'category':
+            return self.lookup[raw]
+        if self.kind == 'datetime':
+            return np.asarray(raw).view('datetime64[ns]')
+        return np.asarray(raw)
+
+class MeterStore:
+    """Column arrays of the cleaned meter export."""
+
+    def __init__(self, columns, index, coordinates):
+        self.columns = {column.name: column for column in columns}
+        # [lon, lat] per row joined from data.json, NaN where not located
+        self.coordinates = coordinates
+        self.sifra = self.columns['Šifra'].array
+        self.serijski = self.columns['Serijski'].array
+        self._sifra_sorted = index['sifra_sorted']
+        self._sifra_order = index['sifra_order']
+        self._serijski_sorted = index['serijski_sorted']
+        self._serijski_order = index['serijski_order']
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        columns = [
+            Column(column['name'], column['kind'], snapshot.array(column['file']),
+                   snapshot.strings.get(column['file']))
+            for column in snapshot.manifest['meters']['columns']
+        ]
+        index = {name: snapshot.array('meters_' + name)
+                 for name in ('sifra_order', 'sifra_sorted', 'serijski_order', 'serijski_sorted')}
+        return cls(columns, index, snapshot.array('meters_coordinates'))
+
+    def __len__(self):
+        return len(self.sifra)
+
+    @property
+    def nbytes(self):
+        """Approximate size of the row arrays (tables excluded)."""
+        arrays = [column.array for column in self.columns.values()]
+        arrays += [self.coordinates, self._sifra_sorted, self._sifra_order,
+                   self._serijski_sorted, self._serijski_order]
+        return sum(array.nbytes for array in arrays)
+
+    def row_for_sifra(self, sifra):
+        return find_last(self._sifra_sorted, self._sifra_order, sifra)
+
+    def sifra_for_serijski(self, serijski):
+        row = find_last(self._serijski_sorted, self._serijski_order, serijski)
+        if row is None:
+            return None
+        return int(self.sifra[row])
+
+    def rows_for_sifre(self, sifre):
+        """Rows of an int64 array of Šifre, -1 where not found."""
+        return find_last_many(self._sifra_sorted, self._sifra_order, sifre)
+
+    def sifre_for_serijski(self, serijski):
+        """Šifre of an int64 array of serial numbers, -1 where not found."""
+        rows = find_last_many(self._serijski_sorted, self._serijski_order, serijski)
+        return np.where(rows >= 0, self.sifra[rows], -1)
+
+    def value(self, name, row):
+        return self.columns[name].value(row)
+
+    def take(self, name, rows):
+        return self.columns[name].take(rows)
+
+    def group_codes(self, name):
+        """Per-row group codes (-1 for missing) and the value of each code."""
+        column = self.columns[name]
+        if column.kind == 'category':
+            return np.asarray(column.array), column.table
+        values, codes = np.unique(np.asarray(column.array), return_inverse=True)
+        if values.dtype.kind == 'f' and len(values) and np.isnan(values[-1]):
+            codes = np.where(codes == len(values) - 1, -1, codes)
+            values = values[:-1]
+        return codes, values.tolist()
+
+    def groups(self, name, rows=None):
+        """Map each value of a column to its rows (in export order), keys sorted.
+
+        With ``rows`` only those rows are grouped.
+        """
+        codes, values = self.group_codes(name)
+        if rows is None:
+            rows = np.arange(len(codes))
+        return group_rows(rows, codes[rows], values)
+
+def _sort_key(value):
+    # Mixed int/str values would make a plain sort raise
+    return (isinstance(value, str), value)
+
+def group_rows(rows, codes, values):
+    """Split rows by their group code; missing (-1) codes are dropped."""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    present = np.unique(sorted_codes)
+    present = present[present >= 0]
+    starts = np.searchsorted(sorted_codes, present, side='left')
+    ends = np.searchsorted(sorted_codes, present, side='right')
+    groups = {
+        values[code]: rows[order[start:end]]
+        for code, start, end in zip(present.tolist(), starts, ends)
+    }
+    return dict(sorted(groups.items(), key=lambda item: _sort_key(item[0])))
+
+# ============ GROUP INDEX ============
+
+# OJ values the UI offers that stand for several OJ codes in the export
+OJ_ALIASES = {'303': (3031, 3032)}
+
+class GroupIndex:
+    """Row positions by OJ, (OJ, OH) and Naziv TS, built once at load time.
+
+    Every lookup is a dict hit returning a precomputed row array, so the map
+    endpoints pay for the size of the result instead of a scan of the export.
+    """
+
+    def __init__(self, store, oj_aliases=OJ_ALIASES):
+        self.oj_aliases = oj_aliases
+        self.by_oj = store.groups('OJ')
+        for alias, ojs in oj_aliases.items():
+            parts = [self.by_oj[oj] for oj in ojs if oj in self.by_oj]
+            self.by_oj[alias] = np.sort(np.concatenate(parts)) if parts else np.empty(0, np.int64)
+
+        self.by_oj_oh = {}
+        self.oh_by_oj = {}
+        for oj, rows in self.by_oj.items():
+            by_oh = store.groups('OH', rows)
+            self.oh_by_oj[oj] = list(by_oh)
+            for oh, oh_rows in by_oh.items():
+                self.by_oj_oh[(oj, oh)] = oh_rows
+
+        self.by_ts = store.groups('Naziv TS')
+        self.ts_names = sorted(self.by_ts, key=_sort_key)
+        # Lower-cased names for the case-insensitive fallback
+        by_ts_lower = {}
+        for ts, rows in self.by_ts.items():
+            if isinstance(ts, str):
+                by_ts_lower.setdefault(ts.lower(), []).append(rows)
+        self.by_ts_lower = {
+            ts: parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+            for ts, parts in by_ts_lower.items()
+        }
+
+    def oj_key(self, oj_value):
+        """Key for an OJ request value; raises ValueError for non-numeric input."""
+        if oj_value in self.oj_aliases:
+            return oj_value
+        return int(oj_value)
+
+    def rows_for_oj(self, oj_value):
+        return self.by_oj.get(self.oj_key(oj_value), EMPTY_ROWS)
+
+    def oh_values(self, oj_value):
+        return self.oh_by_oj.get(self.oj_key(oj_value), [])
+
+    def rows_for_oj_oh(self, oj_value, oh_value):
+        return self.by_oj_oh.get((self.oj_key(oj_value), oh_value), EMPTY_ROWS)
+
+    def ts_key(self, ts_naziv):
+        """The group rows_for_ts() answers a Naziv TS request from."""
+        if ts_naziv in self.by_ts:
+            return ('exact', ts_naziv)
+        return ('lower', ts_naziv.lower())
+
+    def rows_for_ts(self, ts_naziv):
+        """Rows of a Naziv TS, falling back to a case-insensitive match."""
+        rows = self.by_ts.get(ts_naziv)
+        if rows is None:
+            rows = self.by_ts_lower.get(ts_naziv.lower(), EMPTY_ROWS)
+        return rows
@@ -0,0 +1,172 @@
+"""Process-local counters, gauges and histograms in Prometheus text format.
+
+The app records request latency and response size per route, hits and
+misses of the lookup tables and response cache, and how long each phase
+of a snapshot build and dataset load took.  ``/metrics`` renders the
+registry in the Prometheus text exposition format (version 0.0.4).
+
+Metrics are kept per process: under gunicorn each worker answers
+``/metrics`` with its own numbers, and the ``pid`` label of
+``app_process_info`` tells the scrapes apart.  Updates take a lock, so
+they are safe from the reload thread as well as request threads.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A metric family; one value (or histogram) per label combination."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.label_names)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_labels(self.label_names, key)} {_number(value)}']
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts, the +Inf bucket last, then the sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def _samples(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+            cumulative += count
+            labels = _labels(self.label_names, key, [('le', _number(bound))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _labels(self.label_names, key)
+        lines.append(f'{self.name}_sum{labels} {_number(state[-1])}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+PROCESS_INFO = REGISTRY.register(Gauge(
+    'app_process_info', "Process answering this scrape.", ('pid',)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'app_request_duration_seconds', "Time to build the response, per route.",
+    ('route', 'method', 'status')))
+RESPONSE_BYTES = REGISTRY.register(Histogram(
+    'app_response_size_bytes', "Size of non-streamed response bodies, per route.",
+    ('route',), buckets=SIZE_BUCKETS))
+LOOKUPS = REGISTRY.register(Counter(
+    'app_lookups_total', "Lookups in the in-memory tables and caches by result.",
+    ('table', 'result')))
+SNAPSHOT_PHASE_SECONDS = REGISTRY.register(Gauge(
+    'app_snapshot_build_phase_seconds', "Duration of each phase of the last snapshot build.",
+    ('phase',)))
+DATASET_PHASE_SECONDS = REGISTRY.register(Gauge(
+    'app_dataset_load_phase_seconds', "Duration of each phase of the last dataset load.",
+    ('phase',)))
+DATA_QUALITY_METERS = REGISTRY.register(Gauge(
+    'app_data_quality_meters', "Meters of the current dataset with each data-quality issue.",
+    ('issue',)))
+DATASET_RELOADS = REGISTRY.register(Counter(
+    'app_dataset_reloads_total', "Dataset reloads by result.", ('result',)))
+RESPONSE_CACHE_EVICTIONS = REGISTRY.register(Counter(
+    'app_response_cache_evictions_total', "Cached response bodies evicted to stay within the size limit."))
+
+def lookup(table, found, count=1):
+    """Count count hits, or misses, in a lookup table."""
+    LOOKUPS.inc(count, table=table, result='hit' if found else 'miss')
+
+@contextmanager
+def phase(gauge, name):
+    """Time the block into gauge{phase=name}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        gauge.set(round(time.perf_counter() - started, 6), phase=name)
+
+def render():
+    # A forked worker still holds the pid it inherited from the master
+    PROCESS_INFO.clear()
+    PROCESS_INFO.set(1, pid=os.getpid())
+    return REGISTRY.render()
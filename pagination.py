@@ -0,0 +1,144 @@
+"""Cursor pagination, field selection and streaming for the feature endpoints.
+
+Features are paged in a stable order: meters by Šifra, GeoJSON layers by a
+name or code property, ties broken by position.  The cursor is the sort
+key of the last feature of a page, base64 encoded so clients treat it as
+opaque.  Streaming modes write the features as newline-delimited JSON
+(``ndjson``) or RFC 8142 GeoJSON text sequences (``geojsonseq``), a chunk
+at a time, so neither the server nor the client holds the whole list.
+"""
+import base64
+import binascii
+import json
+
+import numpy as np
+from flask import Response
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK = 500
+
+# format -> (mimetype, record prefix)
+STREAM_FORMATS = {
+    'ndjson': ('application/x-ndjson', ''),
+    'geojsonseq': ('application/geo+json-seq', '\x1e'),
+}
+
+def encode_cursor(key, position):
+    raw = json.dumps([key, position], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(key, position) of a cursor; raises ValueError if it is not one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, position = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(position, int):
+        raise ValueError("Invalid cursor")
+    return key, position
+
+class PageRequest:
+    """limit, cursor, format and fields arguments of a feature request."""
+
+    def __init__(self, limit=None, cursor=None, format=None, fields=None):
+        self.limit = limit
+        self.cursor = cursor
+        self.format = format
+        self.fields = fields
+
+    @classmethod
+    def from_args(cls, args):
+        """Parse the request args; raises ValueError for invalid values."""
+        limit = args.get('limit')
+        if limit is not None:
+            invalid = ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise invalid from None
+            if not 0 < limit <= MAX_PAGE_SIZE:
+                raise invalid
+        cursor = args.get('cursor')
+        if cursor:
+            cursor = decode_cursor(cursor)
+        format = args.get('format')
+        if format is not None and format not in STREAM_FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        fields = args.get('fields')
+        if fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        return cls(limit, cursor or None, format, fields or None)
+
+    @property
+    def active(self):
+        """Whether the request asks for anything but the plain full response."""
+        return any(value is not None for value in (self.limit, self.cursor, self.format, self.fields))
+
+    def check_fields(self, properties):
+        """Raise ValueError if a requested field is not one of properties."""
+        unknown = [field for field in self.fields or () if field not in properties]
+        if unknown:
+            raise ValueError(f"Unknown field: {', '.join(unknown)}")
+
+    def select(self, properties):
+        """The requested subset of a {property: column} mapping."""
+        if self.fields is None:
+            return properties
+        self.check_fields(properties)
+        return {field: properties[field] for field in self.fields}
+
+    def trim(self, feature):
+        """A GeoJSON feature with only the requested properties.
+
+        The fields must have been checked against the layer's properties;
+        a feature without one of them gets null.
+        """
+        if self.fields is None:
+            return feature
+        properties = feature.get('properties') or {}
+        return {**feature, 'properties': {field: properties.get(field) for field in self.fields}}
+
+    def window(self, keys, positions):
+        """Start and end of the page in items sorted by (keys, positions).
+
+        Streaming without a limit runs to the end.  Returns the cursor of
+        the next page as well, or None on the last page.
+        """
+        start = 0
+        if self.cursor is not None:
+            key, position = self.cursor
+            # A cursor from another endpoint would compare as garbage
+            numeric = keys.dtype.kind in 'iuf'
+            if numeric != (isinstance(key, (int, float)) and not isinstance(key, bool)):
+                raise ValueError("Invalid cursor")
+            lo = int(np.searchsorted(keys, key, side='left'))
+            hi = int(np.searchsorted(keys, key, side='right'))
+            start = lo + int(np.searchsorted(positions[lo:hi], position, side='right'))
+        limit = self.limit
+        if limit is None:
+            limit = len(keys) if self.format else DEFAULT_PAGE_SIZE
+        end = min(start + limit, len(keys))
+        next_cursor = None
+        if end < len(keys) and end > start:
+            next_cursor = encode_cursor(keys[end - 1].item(), int(positions[end - 1]))
+        return start, end, next_cursor
+
+    def stream(self, items, build, dumps):
+        """Streaming response of build(chunk) features, chunk by chunk of items."""
+        mimetype, prefix = STREAM_FORMATS[self.format]
+
+        def generate():
+            for start in range(0, len(items), STREAM_CHUNK):
+                yield ''.join(prefix + dumps(feature) + '\n'
+                              for feature in build(items[start:start + STREAM_CHUNK]))
+
+        return Response(generate(), mimetype=mimetype)
+
+def feature_order(features, key):
+    """Sort keys, positions and the permutation ordering GeoJSON features by key."""
+    keys = np.array(['' if key(feature) is None else str(key(feature)) for feature in features])
+    positions = np.arange(len(features))
+    order = np.lexsort((positions, keys)) if len(features) else positions
+    return keys[order], positions[order], order
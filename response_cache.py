@@ -0,0 +1,199 @@
+"""Pre-encoded response bodies, kept while the data does not change.
+
+Payloads such as all trafostanice are built once per dataset version,
+serialized to JSON and served with a strong ETag so repeat requests can be
+answered with ``304 Not Modified``.  Bodies are gzipped when they are kept
+or first asked for gzipped, never for a body too large to keep that only
+goes to a client without gzip.
+
+The same cache holds the results of the parameterized queries users repeat
+all day: (OJ, OH) searches, Naziv TS filters, OH lists and suggestions.
+Those are keyed by the route and the normalized parameters, so "OH Jug"
+asked for under OJ "302" and 302 share one entry.  The cache is bounded by
+``RESPONSE_CACHE_MB`` of encoded bytes and evicts the least recently used
+bodies first.  It belongs to one dataset, so a reload starts with an empty
+one.
+
+A new cache can be filled before it serves anything with the most frequent
+GET queries of an access log (see ``top_queries``).  Suggestions are POSTed
+and their input is not logged, so they are only cached as they are asked.
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from flask import Response, request
+
+from metrics import RESPONSE_CACHE_EVICTIONS, lookup
+
+MAX_BYTES = int(float(os.environ.get('RESPONSE_CACHE_MB', '64')) * 2 ** 20)
+# A single body above this share of the budget is served but not kept
+MAX_ENTRY_SHARE = 4
+# Bookkeeping per entry on top of the encoded bytes: key, ETags, dict slot
+ENTRY_OVERHEAD = 512
+# Query results are compressed while the user waits, so less thoroughly
+QUERY_GZIP_LEVEL = 6
+
+class CachedBody:
+    """One payload encoded as JSON bytes, plus its gzip variant once needed."""
+
+    def __init__(self, body, version, compresslevel=9):
+        self.body = body
+        self.compresslevel = compresslevel
+        self._gzipped = None
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'{version}-{digest}'
+        # Strong ETags must differ per content-coding
+        self.gzip_etag = self.etag + '-gz'
+
+    def compress(self):
+        """The gzip variant, compressed on the first call."""
+        # Two threads may both compress it; either result is the same
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=self.compresslevel, mtime=0)
+        return self._gzipped
+
+    gzipped = property(compress)
+
+    @property
+    def size(self):
+        """Bytes held, the gzip variant included once it exists."""
+        return len(self.body) + len(self._gzipped or b'') + ENTRY_OVERHEAD
+
+class ResponseCache:
+    """Encoded bodies keyed by name or query, valid for one dataset version.
+
+    Least recently used bodies are evicted once they take more than
+    max_bytes.
+    """
+
+    def __init__(self, dumps, version, max_bytes=MAX_BYTES):
+        self.dumps = dumps
+        self.version = version
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def invalidate(self, version):
+        """Drop every cached body, e.g. after the data snapshot is reloaded."""
+        with self._lock:
+            self.version = version
+            self._bodies = OrderedDict()
+            self.bytes = 0
+
+    def encode(self, payload):
+        return (self.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def stats(self):
+        """Size and hit counts, for monitoring."""
+        with self._lock:
+            return {
+                "entries": len(self._bodies),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def get(self, key, build, compresslevel=9):
+        """Cached body for key, calling build() for the payload on a miss.
+
+        build() may also return the JSON bytes of the payload.  Returns
+        None, and caches nothing, when build() returns None.
+        """
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is None:
+                self.misses += 1
+            else:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+        lookup('response_cache', cached is not None)
+        if cached is not None:
+            return cached
+
+        # Built outside the lock so a slow query does not hold up the hits
+        payload = build()
+        if payload is None:
+            return None
+        body = payload if isinstance(payload, bytes) else self.encode(payload)
+        cached = CachedBody(body, self.version, compresslevel)
+        limit = self.max_bytes // MAX_ENTRY_SHARE
+        if cached.size <= limit:
+            # Compressed before it is counted, so its size does not change
+            cached.compress()
+            if cached.size <= limit:
+                self._store(key, cached)
+        return cached
+
+    def _store(self, key, cached):
+        evicted = 0
+        with self._lock:
+            previous = self._bodies.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.size
+            self._bodies[key] = cached
+            self.bytes += cached.size
+            while self.bytes > self.max_bytes:
+                _, oldest = self._bodies.popitem(last=False)
+                self.bytes -= oldest.size
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            RESPONSE_CACHE_EVICTIONS.inc(evicted)
+
+    def response(self, key, build, compresslevel=9):
+        """JSON response for the current request, gzipped and conditional.
+
+        None when build() returns None, for the caller's not-found response.
+        """
+        cached = self.get(key, build, compresslevel)
+        if cached is None:
+            return None
+        use_gzip = request.accept_encodings['gzip'] > 0
+        etag = cached.gzip_etag if use_gzip else cached.etag
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(cached.gzipped if use_gzip else cached.body,
+                                mimetype='application/json')
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def query_response(self, key, build):
+        """response() for a parameterized query result."""
+        return self.response(key, build, QUERY_GZIP_LEVEL)
+
+# ============ WARM-UP ============
+
+# Request line and status of a common or combined log format entry
+_LOG_REQUEST = re.compile(r'"GET (?P<target>\S+) HTTP/[\d.]+" (?P<status>\d{3}) ')
+
+def top_queries(path, limit, prefixes):
+    """The limit most frequent successful GET targets under prefixes in a log.
+
+    Targets are returned as logged, path and query string, most frequent
+    first.
+    """
+    counts = Counter()
+    with open(path, encoding='utf-8', errors='replace') as log:
+        for line in log:
+            match = _LOG_REQUEST.search(line)
+            if (match and match.group('status') == '200'
+                    and match.group('target').startswith(prefixes)):
+                counts[match.group('target')] += 1
+    return [target for target, _ in counts.most_common(limit)]
@@ -0,0 +1,272 @@
+"""Substring search over entity names for the autocomplete endpoints.
+
+Names are normalized once at load time (see ``fold``), so "cazanj"
+finds "ČAŽANJ" and "dzamija" finds "DŽAMIJA".  Substring candidates come from a
+trigram postings index stored as flat numpy arrays (CSR layout: sorted
+trigram codes, offsets, key ids), and prefix matches from bisecting the
+sorted normalized names.  Results are ranked prefix matches first, each
+group in key order, and produced lazily so callers stop at their limit.
+
+A leading "TS"/"DV" designator is optional for prefix matches: the names
+are also kept without it, so "cazanj" ranks "TS ČAŽANJ" as a prefix match,
+and "ts cazanj" ranks "ČAŽANJ" (but not "DV ČAŽANJ") as one.  Substring
+matches always compare the whole name, so "ts" still finds every TS and
+"TS 35" does not find "TS XIII (1035)".
+
+``RastavljacIndex`` combines such indexes with exact and grouping dicts
+for the rastavljač endpoints.
+"""
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+SEPARATOR = '\x00'
+MAX_CHAR = chr(0x10FFFF)
+CANDIDATE_CHUNK = 256
+
+# Letters without a Unicode decomposition into base letter + mark
+_LETTERS = str.maketrans({'đ': 'd'})
+_COMBINING = re.compile('[\u0300-\u036f]')
+_SPACE = re.compile(r'\s+')
+# Object type designators users may or may not type in front of a name
+_PREFIX = re.compile(r'^(?:ts|dv) ')
+
+def fold(text):
+    """Case folded text with č/ć/ž/š and other accents reduced to the base
+    letter, đ and dj both to d and runs of whitespace collapsed."""
+    text = str(text).casefold().translate(_LETTERS)
+    text = _COMBINING.sub('', unicodedata.normalize('NFKD', text))
+    return _SPACE.sub(' ', text.replace('dj', 'd')).strip()
+
+def strip_designator(text):
+    """Folded text without a leading "ts "/"dv " designator."""
+    return _PREFIX.sub('', text)
+
+def _trigram_codes(text):
+    """Codes of every trigram in text, one per starting position."""
+    points = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    if len(points) < 3:
+        return points[:0], points
+    codes = (points[:-2] << 42) | (points[1:-1] << 21) | points[2:]
+    return codes, points
+
+class SubstringIndex:
+    """Trigram and prefix index over a list of keys."""
+
+    def __init__(self, keys, designators=True):
+        self.keys = list(keys)
+        # Queries are folded only; the designator is handled when matching
+        self.normalize = fold
+        self.normalized = [fold(key) for key in self.keys]
+
+        # Prefix lookups: normalized keys in sorted order and their key ids,
+        # and the same for the keys without their designator
+        self.designators = designators
+        self._sorted, self._by_prefix = self._prefix_table(self.normalized)
+        if designators:
+            self.stripped = [strip_designator(key) for key in self.normalized]
+            self._stripped_sorted, self._stripped_by_prefix = self._prefix_table(self.stripped)
+
+        # Trigram postings for all keys at once, over the keys joined by NUL
+        text = SEPARATOR.join(self.normalized)
+        codes, points = _trigram_codes(text)
+        lengths = np.fromiter((len(key) for key in self.normalized), dtype=np.int64,
+                              count=len(self.normalized))
+        key_ids = np.repeat(np.arange(len(lengths)), lengths + 1)[:len(points)]
+        # Trigrams spanning a separator do not belong to any key
+        valid = (points[:-2] != 0) & (points[1:-1] != 0) & (points[2:] != 0)
+        codes, key_ids = codes[valid], key_ids[:len(valid)][valid]
+        order = np.lexsort((key_ids, codes))
+        codes, key_ids = codes[order], key_ids[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (key_ids[1:] != key_ids[:-1])
+        codes, self._postings = codes[keep], key_ids[keep].astype(np.int32)
+        self._grams, starts = np.unique(codes, return_index=True)
+        self._offsets = np.append(starts, len(codes))
+
+    @staticmethod
+    def _prefix_table(forms):
+        order = sorted(range(len(forms)), key=forms.__getitem__)
+        return [forms[i] for i in order], np.array(order, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _posting(self, code):
+        i = np.searchsorted(self._grams, code)
+        if i == len(self._grams) or self._grams[i] != code:
+            return None
+        return self._postings[self._offsets[i]:self._offsets[i + 1]]
+
+    def _iter_candidates(self, postings):
+        """Yield ids present in every posting, in order, a chunk at a time.
+
+        Chunks of the shortest posting are filtered against the others by
+        binary search, so the work stops with the caller instead of
+        intersecting whole postings up front.
+        """
+        postings = sorted(postings, key=len)
+        first, rest = postings[0], postings[1:]
+        for start in range(0, len(first), CANDIDATE_CHUNK):
+            chunk = first[start:start + CANDIDATE_CHUNK]
+            for posting in rest:
+                i = np.minimum(np.searchsorted(posting, chunk), len(posting) - 1)
+                chunk = chunk[posting[i] == chunk]
+                if not len(chunk):
+                    break
+            yield from chunk.tolist()
+
+    def prefix_ids(self, query, limit=None):
+        """Key ids whose normalized form starts with the normalized query, in key order.
+
+        With designators a key without one also matches a query with one
+        dropped, and a key with one matches a query without one.
+        """
+        return self._prefix_ids(self.normalize(query), limit)
+
+    def _prefix_ids(self, query, limit=None):
+        ids = self._prefix_range(self._sorted, self._by_prefix, query, limit)
+        if self.designators:
+            stripped = strip_designator(query)
+            if stripped != query:
+                more = self._prefix_range(self._sorted, self._by_prefix, stripped, limit)
+            else:
+                more = self._prefix_range(self._stripped_sorted, self._stripped_by_prefix, query, limit)
+            ids = np.union1d(ids, more)[:limit]
+        return np.sort(ids).tolist()
+
+    @staticmethod
+    def _prefix_range(sorted_forms, by_prefix, query, limit):
+        """Ids of the limit first keys in key order among those starting with query."""
+        start = bisect_left(sorted_forms, query)
+        end = bisect_left(sorted_forms, query + MAX_CHAR, lo=start)
+        ids = by_prefix[start:end]
+        if limit is not None and len(ids) > limit:
+            ids = np.partition(ids, limit - 1)[:limit]
+        return ids
+
+    def _is_prefix(self, i, query, stripped_query):
+        """Whether key i is among the _prefix_ids of query."""
+        key = self.normalized[i]
+        if key.startswith(query):
+            return True
+        if not self.designators:
+            return False
+        if stripped_query != query:
+            return key.startswith(stripped_query)
+        return self.stripped[i].startswith(query)
+
+    def iter_matches(self, query, limit=None):
+        """Yield ids of keys containing query: prefix matches first, then the rest.
+
+        With ``limit`` at most that many ids are produced.
+        """
+        query = self.normalize(query)
+        if not query:
+            return
+        prefix = self._prefix_ids(query, limit)
+        yield from prefix
+        if limit is not None:
+            limit -= len(prefix)
+            if limit <= 0:
+                return
+
+        codes, _ = _trigram_codes(query)
+        if len(codes):
+            postings = [self._posting(code) for code in np.unique(codes)]
+            if any(posting is None for posting in postings):
+                return
+            candidates = self._iter_candidates(postings)
+            # Each trigram of a 3-character query is the query itself
+            verify = len(query) > 3
+        else:
+            candidates = range(len(self.keys))
+            verify = True
+
+        stripped = strip_designator(query)
+        for i in candidates:
+            if self._is_prefix(i, query, stripped) or (verify and query not in self.normalized[i]):
+                continue
+            yield i
+            if limit is not None:
+                limit -= 1
+                if not limit:
+                    return
+
+    def search(self, query, limit=10):
+        """Keys containing query, ranked prefix matches first."""
+        return [self.keys[i] for i in self.iter_matches(query, limit)]
+
+# ============ RASTAVLJAČ INDEX ============
+
+# Properties offered as autocomplete suggestions
+RASTAVLJAC_NAME_FIELDS = ('NTS_NAZIV', 'SIFRA', 'SNO_NAZIV', 'DSN_NAZIV')
+# Properties searched by the substring fallback of a rastavljač lookup
+RASTAVLJAC_SEARCH_FIELDS = ('SIFRA', 'NTS_NAZIV', 'SNO_NAZIV', 'DSN', 'DSN_NAZIV')
+# Properties a whole feeder can be fetched by
+RASTAVLJAC_GROUP_FIELDS = ('SNO_NAZIV', 'DSN')
+
+def _field_map(features, field):
+    """Map str(value) of a property to the ids of the features having it."""
+    by_value = {}
+    for i, feature in enumerate(features):
+        value = feature.get('properties', {}).get(field)
+        if value is not None:
+            by_value.setdefault(str(value), []).append(i)
+    return by_value
+
+class RastavljacIndex:
+    """Lookups over the rastavljač features, built once at load time.
+
+    Exact SIFRA / NTS_NAZIV matches are dict hits; otherwise the query is
+    searched in one normalized blob of the search fields per feature.
+    Feature ids are positions in ``features`` and results keep that order.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.by_sifra = _field_map(self.features, 'SIFRA')
+        self.by_nts_naziv = _field_map(self.features, 'NTS_NAZIV')
+        self.groups = {field: _field_map(self.features, field) for field in RASTAVLJAC_GROUP_FIELDS}
+
+        blobs = []
+        names = set()
+        # Every property name of the layer, for checking fields= requests
+        self.properties = set()
+        for feature in self.features:
+            props = feature.get('properties', {})
+            self.properties.update(props)
+            blobs.append(' '.join(str(props[field]) for field in RASTAVLJAC_SEARCH_FIELDS
+                                  if props.get(field) is not None))
+            names.update(str(props[field]) for field in RASTAVLJAC_NAME_FIELDS if props.get(field))
+        # Designators inside a blob are content, so they are only folded
+        self.text_index = SubstringIndex(blobs, designators=False)
+        self.name_index = SubstringIndex(sorted(names))
+
+    def __len__(self):
+        return len(self.features)
+
+    def _features(self, ids):
+        return [self.features[i] for i in ids]
+
+    def exact(self, query):
+        """Features whose SIFRA or NTS_NAZIV equals query."""
+        ids = set(self.by_sifra.get(query, ())) | set(self.by_nts_naziv.get(query, ()))
+        return self._features(sorted(ids))
+
+    def search(self, query):
+        """Features whose search fields contain query, normalized."""
+        return self._features(sorted(self.text_index.iter_matches(query)))
+
+    def lookup(self, query):
+        """Exact matches, falling back to the substring search."""
+        return self.exact(query) or self.search(query)
+
+    def group(self, field, value):
+        """All features of one SNO_NAZIV or DSN, e.g. a whole feeder."""
+        return self._features(self.groups[field].get(str(value), ()))
+
+    def suggestions(self, query, limit=10):
+        return self.name_index.search(query, limit)
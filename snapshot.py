@@ -0,0 +1,598 @@
+"""Compiled binary snapshot of the meter export and GeoJSON sources.
+
+Parsing ``EP_Eksport_Uredjaja.xlsx`` and the GeoJSON exports takes tens of
+seconds, so the sources are compiled once into a directory of ``.npy`` column
+arrays (memory-mapped at import) plus a few small JSON files:
+
+    snapshot/
+        CURRENT                 build id of the active snapshot
+        <build_id>/
+            manifest.json       format version, source checksums, column layout
+            strings.json        dictionary tables for the encoded text columns
+            meters.<i>.npy      one array per meter export column
+            meters_*.npy        sorted Šifra/Serijski keys for the meter store
+            meters_coordinates.npy  data.json coordinates joined to each meter
+            points_sifra*.npy   data.json points, columns instead of features
+            points_coordinates.npy
+            trafostanice.json   compact copies of the GeoJSON layers
+            rastavljaci.json
+            export_*.npy        hash, keys and snapshot row of each export row
+
+The build id is derived from the checksums of the source files, so replacing
+any of them makes the snapshot stale and ``ensure_snapshot`` rebuilds it on
+the next start.  A new meter export with the same layout is applied row by
+row (see ingest.py): only its changed rows are parsed and encoded, the
+other columns and sources are carried over.  To compile ahead of a deploy
+run::
+
+    python snapshot.py [--force]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import meter_store
+from metrics import SNAPSHOT_PHASE_SECONDS, phase
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 3
+SNAPSHOT_DIR = 'snapshot'
+MANIFEST = 'manifest.json'
+STRINGS = 'strings.json'
+CHANGES = 'changes.json'
+CURRENT = 'CURRENT'
+KEEP_BUILDS = 2
+
+SOURCE_FILES = {
+    'excel': 'EP_Eksport_Uredjaja.xlsx',
+    'points': 'data.json',
+    'trafostanice': 'trafostanica_data.json',
+    'rastavljaci': 'rastavljac_data.json',
+}
+
+# ============ SOURCE PARSING ============
+
+def read_meter_sheet(path):
+    """The export sheet as read from the workbook, before any cleaning."""
+    with phase(SNAPSHOT_PHASE_SECONDS, 'excel_parse'):
+        return pd.read_excel(path, sheet_name=ingest.SHEET, skiprows=ingest.SKIP_ROWS)
+
+def read_meter_export(path):
+    """Read the meter export workbook and drop duplicate meters."""
+    return clean_meter_export(read_meter_sheet(path))
+
+def clean_meter_export(df):
+    """Strip the column names, drop unnamed columns and duplicate meters."""
+    return _clean_meter_export(df).reset_index(drop=True)
+
+def _clean_meter_export(df):
+    # The index keeps the position of each row in the export
+    with phase(SNAPSHOT_PHASE_SECONDS, 'dedup'):
+        df = df.rename(columns=lambda x: x.strip())
+        df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+        return ingest.drop_duplicate_meters(df)
+
+def read_points(path):
+    """Read data.json into parallel SIFRA and coordinate arrays."""
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+
+    sifre = []
+    coordinates = []
+    for feature in data['features']:
+        if 'geometry' not in feature or 'coordinates' not in feature['geometry']:
+            continue
+        sifra = feature['properties']['SIFRA']
+        # Only integral codes can ever match an Šifra from the meter export
+        if isinstance(sifra, float) and sifra.is_integer():
+            sifra = int(sifra)
+        if not isinstance(sifra, int) or isinstance(sifra, bool):
+            continue
+        sifre.append(sifra)
+        coordinates.append(feature['geometry']['coordinates'][:2])
+
+    return (
+        np.asarray(sifre, dtype=np.int64),
+        np.asarray(coordinates, dtype=np.float64).reshape(-1, 2),
+    )
+
+def read_geojson(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+# ============ COLUMN ENCODING ============
+
+def _json_value(value):
+    """Convert a dictionary value to something json can round-trip."""
+    if isinstance(value, (np.integer, int)) and not isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return float(value)
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+def encode_column(series):
+    """Encode a column as (kind, array, table) for storage in .npy form."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        return 'datetime', values.to_numpy(dtype='datetime64[ns]').view(np.int64), None
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return 'numeric', series.to_numpy(), None
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    table = [_json_value(value) for value in uniques]
+    return 'category', codes.astype(np.int32), table
+
+def decode_column(kind, array, table):
+    """Inverse of encode_column; returns an array pandas can wrap directly."""
+    if kind == 'datetime':
+        return np.asarray(array).view('datetime64[ns]')
+    if kind == 'category':
+        # Code -1 (missing) indexes the trailing NaN
+        lookup = np.array(table + [np.nan], dtype=object)
+        return lookup[array]
+    return array
+
+# ============ FINGERPRINTS ============
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_fingerprint(sources):
+    """Size, mtime and sha256 of each source file."""
+    fingerprint = {}
+    for name, path in sources.items():
+        stat = os.stat(path)
+        fingerprint[name] = {
+            'path': path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_checksum(path),
+        }
+    return fingerprint
+
+def frame_fingerprint(df):
+    """Fingerprint of a meter export passed in as a DataFrame instead of a file."""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(json.dumps(list(df.columns)).encode('utf-8'))
+    return {'path': None, 'size': len(df), 'mtime_ns': None, 'sha256': digest.hexdigest()}
+
+def compute_build_id(fingerprint):
+    key = json.dumps(
+        [SNAPSHOT_VERSION, sorted((name, f['sha256']) for name, f in fingerprint.items())]
+    )
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+# ============ SNAPSHOT ============
+
+class Snapshot:
+    """Read-only view of one compiled snapshot directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), 'r', encoding='utf-8') as file:
+            self.manifest = json.load(file)
+        self.build_id = self.manifest['build_id']
+        self._strings = None
+
+    @property
+    def strings(self):
+        if self._strings is None:
+            with open(os.path.join(self.path, STRINGS), 'r', encoding='utf-8') as file:
+                self._strings = json.load(file)
+        return self._strings
+
+    def array(self, name):
+        """Memory-map a stored array."""
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def column(self, name):
+        """Decode one meter export column."""
+        for column in self.manifest['meters']['columns']:
+            if column['name'] == name:
+                return decode_column(
+                    column['kind'],
+                    self.array(column['file']),
+                    self.strings.get(column['file']),
+                )
+        raise KeyError(name)
+
+    def to_dataframe(self):
+        """Rebuild the cleaned meter export DataFrame."""
+        return pd.DataFrame(
+            {column['name']: self.column(column['name'])
+             for column in self.manifest['meters']['columns']}
+        )
+
+    def export_state(self):
+        """The export rows this snapshot was built from, or None if not recorded."""
+        export = self.manifest.get('export')
+        if export is None:
+            return None
+        return ingest.ExportState({name: self.array('export_' + name)
+                                   for name in ingest.ExportState.ARRAYS},
+                                  export['columns'], export['styles_sha256'])
+
+    def geojson(self, name):
+        with open(os.path.join(self.path, name + '.json'), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def is_fresh(self, sources):
+        """Check the recorded source checksums against the files on disk.
+
+        Sources that are missing are skipped, so a deploy can ship the
+        snapshot alone.  Files whose size and mtime still match are trusted
+        without re-hashing them.
+        """
+        if self.manifest.get('version') != SNAPSHOT_VERSION:
+            return False
+        recorded = self.manifest['sources']
+        for name, path in sources.items():
+            if not os.path.exists(path):
+                continue
+            if name not in recorded:
+                return False
+            stat = os.stat(path)
+            previous = recorded[name]
+            if stat.st_size == previous['size'] and stat.st_mtime_ns == previous['mtime_ns']:
+                continue
+            if file_checksum(path) != previous['sha256']:
+                return False
+        return True
+
+def _save_array(directory, name, array):
+    np.save(os.path.join(directory, name + '.npy'), np.ascontiguousarray(array))
+
+def _write_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(payload, file, ensure_ascii=False, separators=(',', ':'))
+
+def build_snapshot(root=SNAPSHOT_DIR, sources=SOURCE_FILES, meter_export=None):
+    """Compile the sources into a new snapshot directory and make it current.
+
+    ``meter_export`` is a DataFrame laid out like the workbook sheet, used
+    instead of reading ``sources['excel']``; the synthetic benchmark data
+    outgrows what a workbook can hold.
+    """
+    os.makedirs(root, exist_ok=True)
+    started = time.perf_counter()
+    if meter_export is None:
+        fingerprint = source_fingerprint(sources)
+    else:
+        fingerprint = source_fingerprint({name: path for name, path in sources.items() if name != 'excel'})
+        fingerprint['excel'] = frame_fingerprint(meter_export)
+    build_id = compute_build_id(fingerprint)
+
+    raw = read_meter_sheet(sources['excel']) if meter_export is None else meter_export
+    df = _clean_meter_export(raw)
+    # Only a workbook can be applied row by row next time
+    state = _export_state(sources['excel'], raw, df.index) if meter_export is None else None
+    df = df.reset_index(drop=True)
+    with phase(SNAPSHOT_PHASE_SECONDS, 'encode_columns'):
+        meters = [(name,) + encode_column(df[name]) for name in df.columns]
+
+    target = _write_build(root, build_id, fingerprint, sources, meters, state)
+    elapsed = time.perf_counter() - started
+    SNAPSHOT_PHASE_SECONDS.set(round(elapsed, 6), phase='total')
+    logger.info("Built snapshot %s (%d meters) in %.1fs", build_id, len(df), elapsed)
+    return Snapshot(target)
+
+def _export_state(path, raw, positions):
+    """Row hashes of the export just read, or None if they do not line up with it."""
+    with phase(SNAPSHOT_PHASE_SECONDS, 'row_hashes'):
+        rows = ingest.ExportRows(path)
+    raw = raw.rename(columns=lambda x: x.strip())
+    kept = [name for name in raw.columns if not name.startswith('Unnamed')]
+    if len(rows) != len(raw) or list(rows.columns.values()) != kept:
+        logger.warning("Export rows of %s do not match pandas' reading, "
+                       "the next export will be built in full", path)
+        return None
+    return ingest.ExportState.from_export(rows, raw, positions)
+
+def update_snapshot(current, root=SNAPSHOT_DIR, sources=SOURCE_FILES):
+    """Apply a changed meter export to the current snapshot row by row.
+
+    Raises ``ingest.DeltaUnsupported`` when only a full build can reproduce
+    the result.
+    """
+    state = current.export_state()
+    if state is None:
+        raise ingest.DeltaUnsupported(f"snapshot {current.build_id} has no export rows")
+    started = time.perf_counter()
+    fingerprint = source_fingerprint(sources)
+    build_id = compute_build_id(fingerprint)
+    old_store = meter_store.MeterStore.from_snapshot(current)
+
+    with phase(SNAPSHOT_PHASE_SECONDS, 'delta'):
+        delta = ingest.ExportDelta(state, sources['excel'], old_store.columns, current.build_id)
+        meters = [(name, column.kind) + apply_delta_column(column, delta.old_rows,
+                                                           [values[name] for values in delta.values])
+                  for name, column in old_store.columns.items()]
+        changes = delta.report(old_store)
+
+    target = _write_build(root, build_id, fingerprint, sources, meters, delta.state,
+                          previous=current, changes=changes)
+    elapsed = time.perf_counter() - started
+    SNAPSHOT_PHASE_SECONDS.set(round(elapsed, 6), phase='total')
+    logger.info("Updated snapshot %s to %s in %.1fs: %d inserted, %d updated, %d deleted "
+                "(%d of %d export rows parsed)", current.build_id, build_id, elapsed,
+                changes['inserted'], changes['updated'], changes['deleted'],
+                changes['parsed_rows'], changes['export_rows'])
+    return Snapshot(target)
+
+def apply_delta_column(column, old_rows, values):
+    """(array, table) of a stored column for the rows of a delta.
+
+    Rows with an old row copy its stored value, the others, in order, take
+    values parsed from the export.  Raises ``ingest.DeltaUnsupported`` where
+    pandas would have given the column another type than the stored one.
+    """
+    old = np.asarray(column.array)
+    copied = old_rows >= 0
+    present = [value for value in values if value is not None]
+    if column.kind == 'category':
+        table = list(column.table)
+        codes = {value: code for code, value in enumerate(table)}
+        new = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                new[i] = -1
+                continue
+            value = _json_value(value)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(table)
+                table.append(value)
+            new[i] = code
+    elif column.kind == 'datetime':
+        if any(not isinstance(value, datetime.datetime) for value in present):
+            raise ingest.DeltaUnsupported(f"column {column.name} would change type")
+        new = np.array([meter_store.INT64_MIN if value is None else pd.Timestamp(value).value
+                        for value in values], dtype=np.int64)
+        table = None
+    elif old.dtype.kind in 'iu':
+        if any(type(value) is not int for value in values):
+            raise ingest.DeltaUnsupported(f"column {column.name} would change type")
+        new = np.array(values, dtype=old.dtype)
+        table = None
+    elif old.dtype.kind == 'f':
+        if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in present):
+            raise ingest.DeltaUnsupported(f"column {column.name} would change type")
+        new = np.array([np.nan if value is None else value for value in values], dtype=old.dtype)
+        table = None
+    else:
+        raise ingest.DeltaUnsupported(f"column {column.name} has an unsupported type")
+
+    array = np.empty(len(old_rows), dtype=new.dtype)
+    array[copied] = old[old_rows[copied]]
+    array[~copied] = new
+    if column.kind == 'category':
+        table = _used_table(array, table)
+        if not any(isinstance(value, str) for value in table):
+            # Without any text pandas would have read numbers or dates
+            raise ingest.DeltaUnsupported(f"column {column.name} would change type")
+    elif column.kind == 'datetime' and (array == meter_store.INT64_MIN).all():
+        raise ingest.DeltaUnsupported(f"column {column.name} would change type")
+    elif array.dtype.kind == 'f' and len(array) and not np.isnan(array).any() \
+            and (array == np.round(array)).all():
+        # pandas reads a float column without blanks or fractions as integers
+        raise ingest.DeltaUnsupported(f"column {column.name} would change type")
+    return array, table
+
+def _used_table(array, table):
+    """Drop the table values no row uses any more, renumbering the codes in place.
+
+    The table stays in order of first use, as ``pd.factorize`` builds it.
+    """
+    present = array >= 0
+    uniques, first = np.unique(array[present], return_index=True)
+    order = uniques[np.argsort(first, kind='stable')]
+    renumber = np.full(len(table), -1, dtype=np.int32)
+    renumber[order] = np.arange(len(order), dtype=np.int32)
+    array[present] = renumber[array[present]]
+    return [table[code] for code in order.tolist()]
+
+def _reused(previous, fingerprint, name):
+    """Whether a source is unchanged since the previous snapshot."""
+    return (previous is not None
+            and previous.manifest['sources'].get(name, {}).get('sha256') == fingerprint[name]['sha256'])
+
+def _write_build(root, build_id, fingerprint, sources, meters, state=None, previous=None, changes=None):
+    """Write a snapshot of the encoded meter columns and make it current.
+
+    ``meters`` are (name, kind, array, table) tuples.  Sources unchanged
+    since ``previous`` are copied from it instead of parsed again.
+    """
+    tmp = tempfile.mkdtemp(prefix='.build-', dir=root)
+    try:
+        columns = []
+        strings = {}
+        for i, (name, kind, array, table) in enumerate(meters):
+            file = f'meters.{i}'
+            _save_array(tmp, file, array)
+            if table is not None:
+                strings[file] = table
+            columns.append({'name': name, 'kind': kind, 'file': file})
+        keys = {name: array for name, _, array, _ in meters}
+
+        with phase(SNAPSHOT_PHASE_SECONDS, 'points_parse'):
+            if _reused(previous, fingerprint, 'points'):
+                points_sifra = previous.array('points_sifra')
+                points_coordinates = previous.array('points_coordinates')
+            else:
+                points_sifra, points_coordinates = read_points(sources['points'])
+            _save_array(tmp, 'points_sifra', points_sifra)
+            _save_array(tmp, 'points_coordinates', points_coordinates)
+
+        with phase(SNAPSHOT_PHASE_SECONDS, 'key_indexes'):
+            sifra = keys['Šifra']
+            sorted_index = {}
+            for name, key_array in (('meters_sifra', sifra),
+                                    ('meters_serijski', keys['Serijski']),
+                                    ('points_sifra', points_sifra)):
+                order, sorted_keys = sorted_index[name] = meter_store.sorted_index(key_array)
+                _save_array(tmp, name + '_order', order)
+                _save_array(tmp, name + '_sorted', sorted_keys)
+
+            _save_array(tmp, 'meters_coordinates', meter_store.aligned_coordinates(
+                sifra, *sorted_index['points_sifra'], points_coordinates))
+
+        with phase(SNAPSHOT_PHASE_SECONDS, 'geojson_parse'):
+            for name in ('trafostanice', 'rastavljaci'):
+                path = os.path.join(tmp, name + '.json')
+                if _reused(previous, fingerprint, name):
+                    shutil.copyfile(os.path.join(previous.path, name + '.json'), path)
+                else:
+                    _write_json(path, read_geojson(sources[name]))
+
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'build_id': build_id,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'sources': fingerprint,
+            'meters': {'rows': len(sifra), 'columns': columns},
+            'points': {'rows': len(points_sifra)},
+        }
+        if state is not None:
+            for name in ingest.ExportState.ARRAYS:
+                _save_array(tmp, 'export_' + name, getattr(state, name))
+            manifest['export'] = {'columns': state.columns, 'styles_sha256': state.styles_sha256}
+        if changes is not None:
+            # The counts go in the manifest, the keys of the changed meters next to it
+            manifest['changes'] = {name: value for name, value in changes.items() if name != 'examples'}
+            _write_json(os.path.join(tmp, CHANGES), changes)
+        _write_json(os.path.join(tmp, STRINGS), strings)
+        _write_json(os.path.join(tmp, MANIFEST), manifest)
+
+        target = os.path.join(root, build_id)
+        if os.path.exists(target):
+            stale = tempfile.mkdtemp(prefix='.stale-', dir=root)
+            os.replace(target, os.path.join(stale, build_id))
+            shutil.rmtree(stale, ignore_errors=True)
+        os.replace(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    _set_current(root, build_id)
+    _prune_builds(root, build_id)
+    return target
+
+def _set_current(root, build_id):
+    tmp = os.path.join(root, CURRENT + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as file:
+        file.write(build_id)
+    os.replace(tmp, os.path.join(root, CURRENT))
+
+def _prune_builds(root, keep):
+    """Drop old builds, keeping the newest few for processes still mapping them."""
+    builds = [
+        entry for entry in os.scandir(root)
+        if entry.is_dir() and not entry.name.startswith('.') and entry.name != keep
+    ]
+    builds.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in builds[KEEP_BUILDS - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+def read_current_id(root=SNAPSHOT_DIR):
+    """Build id of the current snapshot, or None if there is none."""
+    try:
+        with open(os.path.join(root, CURRENT), 'r', encoding='utf-8') as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+def read_current(root=SNAPSHOT_DIR):
+    """Open the current snapshot, or return None if there is no usable one."""
+    build_id = read_current_id(root)
+    if build_id is None:
+        return None
+    try:
+        return Snapshot(os.path.join(root, build_id))
+    except (OSError, ValueError, KeyError):
+        return None
+
+@contextmanager
+def _build_lock(root):
+    """Serialize builds between workers starting at the same time."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def ensure_snapshot(root=SNAPSHOT_DIR, sources=SOURCE_FILES, force=False):
+    """Return the current snapshot, rebuilding it first if it is missing or stale."""
+    current = read_current(root)
+    if current is not None and not force and current.is_fresh(sources):
+        return current
+
+    with _build_lock(root):
+        # Another worker may have finished the build while we waited
+        current = read_current(root)
+        if current is not None and not force and current.is_fresh(sources):
+            return current
+        if current is not None and not force:
+            try:
+                return update_snapshot(current, root, sources)
+            except ingest.DeltaUnsupported as e:
+                logger.info("Snapshot %s is stale and cannot be updated (%s), rebuilding",
+                            current.build_id, e)
+        return build_snapshot(root, sources)
+
+def verify_snapshot(data_snapshot, sources=SOURCE_FILES):
+    """Check a snapshot against a full build of the same sources.
+
+    Raises AssertionError naming what differs.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        full = build_snapshot(scratch, sources)
+        assert full.build_id == data_snapshot.build_id, "the sources changed since the snapshot"
+        pd.testing.assert_frame_equal(data_snapshot.to_dataframe(), full.to_dataframe())
+        for column in full.manifest['meters']['columns']:
+            assert data_snapshot.strings.get(column['file']) == full.strings.get(column['file']), \
+                f"table of {column['name']} differs"
+        for name in ('meters_sifra_order', 'meters_serijski_order', 'meters_coordinates',
+                     'points_sifra_order', 'points_coordinates'):
+            np.testing.assert_array_equal(data_snapshot.array(name), full.array(name), err_msg=name)
+        for name in ('trafostanice', 'rastavljaci'):
+            assert data_snapshot.geojson(name) == full.geojson(name), f"{name} differs"
+    logger.info("Snapshot %s matches a full build", data_snapshot.build_id)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the data sources into a snapshot.")
+    parser.add_argument('--force', action='store_true', help="rebuild even if the snapshot is fresh")
+    parser.add_argument('--root', default=SNAPSHOT_DIR, help="snapshot directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = ensure_snapshot(args.root, force=args.force)
+    print(f"{snapshot.path}: {snapshot.manifest['meters']['rows']} meters, "
+          f"{snapshot.manifest['points']['rows']} points, built {snapshot.manifest['built_at']}")
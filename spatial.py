@@ -0,0 +1,151 @@
+"""Uniform grid index over point coordinates for viewport and nearest queries.
+
+Points are bucketed into a grid of roughly ``POINTS_PER_CELL`` points per
+cell and stored sorted by cell (row-major), with one
+offset per cell, all as flat numpy arrays.  The cells of one grid row that
+a box covers are contiguous, so a bounding box is one slice per grid row
+followed by an exact filter of the candidates.  Nearest queries take the
+bounding box of their radius and rank the candidates by great-circle
+distance.
+
+The grid spans the central ``1 - 2 * EXTENT_QUANTILE`` of the points on
+each axis rather than their full extent, so a few outliers (meters at 0,0,
+swapped coordinates) cannot stretch it until the service area fits in a
+handful of cells.  Outliers go into the edge cells, where the exact filter
+still finds them.
+"""
+import numpy as np
+
+from features import meter_features
+
+POINTS_PER_CELL = 8
+EXTENT_QUANTILE = 0.001
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS_M / 180
+EMPTY_IDS = np.empty(0, dtype=np.int64)
+
+def haversine_m(lon, lat, lons, lats):
+    """Great-circle distances in meters from (lon, lat) to each of lons/lats."""
+    lon, lat, lons, lats = map(np.radians, (lon, lat, lons, lats))
+    a = (np.sin((lats - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class GridIndex:
+    """Point ids by grid cell; ids are row positions in ``coordinates``.
+
+    Rows whose coordinates are NaN are left out.
+    """
+
+    def __init__(self, coordinates, points_per_cell=POINTS_PER_CELL):
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        ids = np.flatnonzero(~np.isnan(coordinates).any(axis=1))
+        lon, lat = coordinates[ids, 0], coordinates[ids, 1]
+
+        self.size = len(ids)
+        cells = max(1, int(np.sqrt(self.size / points_per_cell)))
+        self.nx = self.ny = cells
+        if self.size:
+            (self.west, east), (self.south, north) = (
+                np.quantile(values, [EXTENT_QUANTILE, 1 - EXTENT_QUANTILE]).tolist()
+                for values in (lon, lat))
+            # Boxes outside these hold no points, not even in the edge cells
+            self.bounds = (float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max()))
+        else:
+            self.west = self.south = east = north = 0.0
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+        # Degenerate extents (one point, one meridian) still get a usable cell
+        self.cell_w = max((east - self.west) / cells, 1e-9)
+        self.cell_h = max((north - self.south) / cells, 1e-9)
+
+        cx, cy = self._cell_x(lon), self._cell_y(lat)
+        cell = cy * self.nx + cx
+        order = np.argsort(cell, kind='stable')
+        self.ids = ids[order]
+        self.lon = lon[order]
+        self.lat = lat[order]
+        self.offsets = np.searchsorted(cell[order], np.arange(self.nx * self.ny + 1))
+
+    def __len__(self):
+        return self.size
+
+    def _cell_x(self, lon):
+        return np.clip(((np.asarray(lon) - self.west) / self.cell_w).astype(np.int64), 0, self.nx - 1)
+
+    def _cell_y(self, lat):
+        return np.clip(((np.asarray(lat) - self.south) / self.cell_h).astype(np.int64), 0, self.ny - 1)
+
+    def _candidates(self, west, south, east, north):
+        """Sorted positions (into self.ids) of the points in the cells the box touches."""
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        if (not self.size or west > east or south > north
+                or east < min_lon or north < min_lat or west > max_lon or south > max_lat):
+            return EMPTY_IDS
+        cx0, cx1 = int(self._cell_x(west)), int(self._cell_x(east))
+        rows = np.arange(int(self._cell_y(south)), int(self._cell_y(north)) + 1) * self.nx
+        starts = self.offsets[rows + cx0]
+        ends = self.offsets[rows + cx1 + 1]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return EMPTY_IDS
+        # Concatenated aranges of [start, end) per grid row
+        shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return np.arange(total) + shifts
+
+    def _in_box(self, west, south, east, north):
+        positions = self._candidates(west, south, east, north)
+        lon, lat = self.lon[positions], self.lat[positions]
+        inside = (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+        return positions[inside]
+
+    def bbox(self, west, south, east, north, limit=None):
+        """Ids of the points inside the box, in id order, and their total count.
+
+        With ``limit`` only the lowest ``limit`` ids are returned.
+        """
+        ids = self.ids[self._in_box(west, south, east, north)]
+        total = len(ids)
+        if limit is not None and total > limit:
+            ids = np.partition(ids, limit - 1)[:limit] if limit > 0 else EMPTY_IDS
+        return np.sort(ids), total
+
+    def nearest(self, lon, lat, k=1, radius_m=1000.0):
+        """Ids of the k points closest to (lon, lat) within radius_m, and their distances."""
+        dlat = radius_m / METERS_PER_DEGREE
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        positions = self._in_box(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        distances = haversine_m(lon, lat, self.lon[positions], self.lat[positions])
+        within = distances <= radius_m
+        positions, distances = positions[within], distances[within]
+        if len(distances) > k:
+            top = np.argpartition(distances, k - 1)[:k] if k > 0 else EMPTY_IDS
+            positions, distances = positions[top], distances[top]
+        order = np.lexsort((self.ids[positions], distances))
+        return self.ids[positions[order]], distances[order]
+
+def _point(feature):
+    coordinates = (feature.get('geometry') or {}).get('coordinates')
+    if coordinates and len(coordinates) >= 2:
+        return coordinates[:2]
+    return None
+
+class FeatureLayer:
+    """Grid index over the point features of a GeoJSON collection."""
+
+    def __init__(self, features):
+        self.features = [feature for feature in features if _point(feature) is not None]
+        self.index = GridIndex([_point(feature) for feature in self.features])
+
+    def take(self, ids):
+        return [self.features[i] for i in ids]
+
+class MeterLayer:
+    """Grid index over the located meters; ids are meter store rows."""
+
+    def __init__(self, store):
+        self.store = store
+        self.index = GridIndex(store.coordinates)
+
+    def take(self, ids):
+        return meter_features(self.store, ids)
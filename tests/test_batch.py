@@ -0,0 +1,8 @@
+import batch
+
+def test_integers_accept_ascii_digits_only():
+    keys, valid = batch._integers(['12', ' 7 ', 5, '²', '١٢', '-3', True, None, '9' * 30])
+    assert valid.tolist() == [True, True, True, False, False, False, False, False, True]
+    assert keys.tolist()[:3] == [12, 7, 5]
+    # Valid but beyond int64, so it cannot be found
+    assert keys.tolist()[-1] == -1
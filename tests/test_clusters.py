@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from clusters import CELL_SHIFT, MAX_CLUSTER_ZOOM, MAX_LEVEL, ClusterIndex
+from features import METER_PROPERTIES
+from meter_store import Column, MeterStore, sorted_index
+
+def meter_store(coordinates):
+    n = len(coordinates)
+    sifra = np.arange(1, n + 1, dtype=np.int64)
+    columns = [Column(name, 'numeric', sifra if name == 'Šifra' else np.zeros(n))
+               for name in set(METER_PROPERTIES.values())]
+    index = {}
+    for name in ('sifra', 'serijski'):
+        index[name + '_order'], index[name + '_sorted'] = sorted_index(sifra)
+    return MeterStore(columns, index, np.asarray(coordinates, dtype=np.float64))
+
+def cluster_index(coordinates):
+    store = meter_store(coordinates)
+    index = ClusterIndex(store, SimpleNamespace(by_oj_oh={}, by_ts={}))
+    return index, index.ordered(np.arange(len(store.coordinates)))
+
+def naive_clusters(index, rows, zoom):
+    """(count, centroid, bbox) of each cell with several rows, by a per-cell loop."""
+    clusters, _ = index.cluster(rows, zoom)
+    expected = []
+    shift = 2 * (MAX_LEVEL - zoom - CELL_SHIFT)
+    keys = index.codes[rows] >> shift
+    for key in dict.fromkeys(keys.tolist()):
+        points = index.store.coordinates[rows[keys == key]]
+        if len(points) > 1:
+            expected.append((len(points), points.mean(axis=0).tolist(),
+                             points.min(axis=0).tolist() + points.max(axis=0).tolist()))
+    return clusters, expected
+
+def test_singles_between_clusters_stay_out_of_them():
+    index, rows = cluster_index([[17.8, 43.3], [17.8001, 43.3001], [18.0, 44.0],
+                                 [19.2, 44.5], [19.2001, 44.5001], [np.nan, np.nan]])
+    # Code order puts the single between the two pairs
+    assert rows.tolist() == [3, 4, 2, 0, 1]
+    clusters, features = index.cluster(rows, 10)
+    assert [cluster['properties']['count'] for cluster in clusters] == [2, 2]
+    assert np.allclose(clusters[0]['geometry']['coordinates'], [19.20005, 44.50005])
+    assert np.allclose(clusters[0]['properties']['bbox'], [19.2, 44.5, 19.2001, 44.5001])
+    assert np.allclose(clusters[1]['geometry']['coordinates'], [17.80005, 43.30005])
+    assert np.allclose(clusters[1]['properties']['bbox'], [17.8, 43.3, 17.8001, 43.3001])
+    assert [feature['properties']['SIFRA'] for feature in features] == [3]
+
+def test_clusters_match_a_naive_aggregation():
+    rng = np.random.default_rng(2)
+    coordinates = np.column_stack([rng.uniform(17.5, 18.5, 3000), rng.uniform(43.0, 44.0, 3000)])
+    coordinates[::7] = coordinates[::7] + rng.normal(0, 0.2, (len(coordinates[::7]), 2))
+    index, rows = cluster_index(coordinates)
+    for zoom in (4, 8, 10, 12, 14, 16):
+        clusters, expected = naive_clusters(index, rows, zoom)
+        _, features = index.cluster(rows, zoom)
+        assert len(clusters) == len(expected)
+        for cluster, (count, center, box) in zip(clusters, expected):
+            assert cluster['properties']['count'] == count
+            assert np.allclose(cluster['geometry']['coordinates'], center)
+            assert np.allclose(cluster['properties']['bbox'], box)
+        assert sum(count for count, _, _ in expected) + len(features) == len(rows)
+
+def test_meters_are_single_features_above_the_cluster_zoom():
+    index, rows = cluster_index([[17.8, 43.3], [17.8, 43.3], [17.9, 43.4]])
+    clusters, features = index.cluster(rows, MAX_CLUSTER_ZOOM)
+    assert [cluster['properties']['count'] for cluster in clusters] == [2]
+    clusters, features = index.cluster(rows, MAX_CLUSTER_ZOOM + 1)
+    assert clusters == [] and len(features) == 3
+
+def test_viewport_limits_the_clusters():
+    index, rows = cluster_index([[17.8, 43.3], [17.8001, 43.3001], [19.2, 44.5], [19.2001, 44.5001]])
+    clusters, features = index.cluster(rows, 10, bbox=(19, 44, 20, 45))
+    assert [cluster['properties']['count'] for cluster in clusters] == [2] and features == []
+    assert np.allclose(clusters[0]['geometry']['coordinates'], [19.20005, 44.50005])
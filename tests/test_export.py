@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+import pytest
+from werkzeug.wrappers import Response
+
+import export
+from meter_store import INT64_MIN, Column, MeterStore, sorted_index
+
+def small_store():
+    sifra = np.array([11, 12, 13], dtype=np.int64)
+    serijski = np.array([21, 22, 23], dtype=np.int64)
+    columns = [
+        Column('Šifra', 'numeric', sifra),
+        Column('Serijski', 'numeric', serijski),
+        # Mixed table as pandas factorizes it: tarifna grupa 1, 2, 3 or 'K'
+        Column('T', 'category', np.array([0, 3, -1], dtype=np.int32), [1, 2, 3, 'K']),
+        Column('Naziv TS', 'category', np.array([0, 0, 1], dtype=np.int32), ['TS A', 'TS B']),
+        Column('Datum žc', 'datetime', np.array([0, INT64_MIN, 86400 * 10**9], dtype=np.int64)),
+        Column('A.sn', 'numeric', np.array([17.25, np.nan, 3.0])),
+        Column('Aktivno', 'numeric', np.array([True, False, True])),
+    ]
+    index = {}
+    for name, keys in (('sifra', sifra), ('serijski', serijski)):
+        index[name + '_order'], index[name + '_sorted'] = sorted_index(keys)
+    coordinates = np.array([[17.8, 43.3], [np.nan, np.nan], [17.9, 43.4]])
+    return MeterStore(columns, index, coordinates)
+
+def test_csv_mimetype_has_one_charset():
+    mimetype, _ = export.FORMATS['csv']
+    response = Response(export.iter_csv(small_store(), np.arange(3)), mimetype=mimetype)
+    assert response.headers['Content-Type'] == 'text/csv; charset=utf-8'
+
+def test_parquet_mixed_and_bool_columns():
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    store = small_store()
+    schema = export.parquet_schema(store)
+    assert str(schema.field('T').type) == 'string'
+    assert str(schema.field('Aktivno').type) == 'bool'
+
+    data = b''.join(export.iter_parquet(store, np.arange(3)))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column('T').to_pylist() == ['1', 'K', None]
+    assert table.column('Aktivno').to_pylist() == [True, False, True]
+    assert table.column('Datum žc').to_pylist() == ['01.01.1970', None, '02.01.1970']
+    assert table.column('A.sn').to_pylist() == [17.25, None, 3.0]
+    assert table.column('lat').to_pylist() == [43.3, None, 43.4]
@@ -0,0 +1,37 @@
+import pandas as pd
+
+import snapshot
+from test_snapshot import meter_export, write_sources, write_workbook
+
+def test_delta_update_matches_a_full_build(tmp_path):
+    df = meter_export()
+    sources = write_sources(tmp_path, df)
+    root = str(tmp_path / 'snapshot')
+    snapshot.build_snapshot(root, sources)
+
+    # One meter updated, one deleted, one inserted; the duplicate stays
+    df.loc[0, 'Kupac'] = 'ANIĆ ANA MARIJA'
+    df = df.drop(index=2)
+    df.loc[len(df) + 1] = [1005, 5005, 'AM550', pd.Timestamp('2022-02-02'), 'ERIĆ EDO', 2, 3.45,
+                           'TS BRIJEG', 303, 'OH Sjever']
+    write_workbook(sources['excel'], df)
+
+    updated = snapshot.ensure_snapshot(root, sources)
+    changes = updated.manifest['changes']
+    assert (changes['inserted'], changes['updated'], changes['deleted']) == (1, 1, 1)
+    assert changes['changed_columns'] == {'Kupac': 1}
+    assert changes['parsed_rows'] == 2
+    snapshot.verify_snapshot(updated, sources)
+
+def test_delta_falls_back_to_a_full_build(tmp_path):
+    df = meter_export()
+    sources = write_sources(tmp_path, df)
+    root = str(tmp_path / 'snapshot')
+    snapshot.build_snapshot(root, sources)
+
+    # Without 'K' pandas reads T as numbers, which a row update cannot reproduce
+    df['T'] = [1, 2, 1, 3, 2]
+    write_workbook(sources['excel'], df)
+    rebuilt = snapshot.ensure_snapshot(root, sources)
+    assert 'changes' not in rebuilt.manifest
+    snapshot.verify_snapshot(rebuilt, sources)
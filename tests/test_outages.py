@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from meter_store import Column, MeterStore, sorted_index
+from outages import OutageRollup
+from topology import Topology
+
+def ts(naziv, napojna, odlaz, snaga=None):
+    return {'type': 'Feature', 'properties': {'NAZIV': naziv, 'NAPOJNA_TS': napojna,
+                                              'ODLAZ_SN_NAZIV': odlaz, 'SNAGA': snaga}}
+
+# TS 110/35 GRAD -> Odlaz 1 -> TS 35/10 POLJE -> Polje A -> TS POLJE 1, TS POLJE 2
+#                                             -> Brijeg  -> TS BRIJEG
+TRAFOSTANICE = [
+    ts('TS 35/10 POLJE', 'TS 110/35 GRAD', 'Odlaz 1', 8000),
+    ts('TS POLJE 1', 'TS 35/10 POLJE', 'Polje A', 400),
+    ts('TS POLJE 2', 'TS 35/10 POLJE', 'Polje  A', 250),
+    ts('TS BRIJEG', 'TS 35/10 POLJE', 'Brijeg', 160),
+]
+RASTAVLJACI = [{'type': 'Feature', 'properties': {'SIFRA': 'R1', 'NTS_NAZIV': 'TS 35/10 POLJE',
+                                                  'SNO_NAZIV': 'Polje A'}}]
+
+def meter_store():
+    sifra = np.arange(1, 6, dtype=np.int64)
+    columns = [
+        Column('Šifra', 'numeric', sifra),
+        Column('Serijski', 'numeric', sifra + 100),
+        # The second meter spells its TS differently, the last is on no TS of the graph
+        Column('Naziv TS', 'category', np.arange(5, dtype=np.int32),
+               ['TS POLJE 1', 'ts polje 1', 'TS POLJE 2', 'TS BRIJEG', 'TS NEPOZNATA']),
+        Column('Kupac', 'category', np.array([0, 0, 1, 2, 3], dtype=np.int32), ['ANA', 'IVO', 'EMA', 'LEA']),
+        Column('T', 'category', np.array([0, 1, 0, -1, 0], dtype=np.int32), [1, 2]),
+        Column('A.sn', 'numeric', np.array([10.0, 5.0, np.nan, 2.5, 7.0])),
+    ]
+    index = {}
+    for name in ('sifra', 'serijski'):
+        index[name + '_order'], index[name + '_sorted'] = sorted_index(columns[0].array)
+    return MeterStore(columns, index, np.full((5, 2), np.nan))
+
+def rollup(trafostanice=TRAFOSTANICE):
+    store = meter_store()
+    topology = Topology(trafostanice, RASTAVLJACI, store, SimpleNamespace(by_ts=store.groups('Naziv TS')))
+    return OutageRollup(topology, store, trafostanice)
+
+def names(topology, ids):
+    return sorted(topology.names[node] for node in ids.tolist())
+
+def test_topology_traversals():
+    topology = rollup().topology
+    assert names(topology, topology.ts_fed_from('TS 35/10 POLJE')) == ['TS BRIJEG', 'TS POLJE 1', 'TS POLJE 2']
+    assert len(topology.ts_downstream_of_ts('ts 110/35 grad')) == 5
+    feeders, rastavljaci = topology.isolating_rastavljaci('TS POLJE 2')
+    assert names(topology, feeders) == ['Polje A']
+    assert rastavljaci == RASTAVLJACI
+    rows, meters, customers = topology.affected([topology.ts_node('TS POLJE 1')])
+    assert rows.tolist() == [0, 1] and (meters, customers) == (2, 1)
+
+def test_rollup_counts():
+    outages = rollup()
+    assert outages.exact
+    nodes, not_found = outages.resolve(feeders=['polje a'], trafostanice=['TS X'])
+    assert not_found == ['TS X']
+    assert outages.combine(nodes) == {
+        "trafostanice": 2, "meters": 3, "angazovana_snaga": 15.0, "instalirana_snaga": 650.0,
+        "tarifne_grupe": {'1': 2, '2': 1},
+    }
+    napojna = {
+        "trafostanice": 4, "meters": 4, "angazovana_snaga": 17.5, "instalirana_snaga": 8810.0,
+        "tarifne_grupe": {'1': 2, '2': 1, 'N/A': 1},
+    }
+    assert outages.combine(outages.resolve(napojne=['TS 35/10 POLJE'])[0]) == napojna
+    # A TS below a selected napojna is not counted twice
+    assert outages.combine(outages.resolve(napojne=['TS 35/10 POLJE'], trafostanice=['TS POLJE 1'])[0]) == napojna
+
+def test_ts_supplied_twice_is_counted_once():
+    outages = rollup(TRAFOSTANICE + [ts('TS BRIJEG', 'TS 35/10 POLJE', 'Polje A', 160)])
+    assert not outages.exact
+    summary = outages.combine(outages.resolve(feeders=['Polje A', 'Brijeg'])[0])
+    assert (summary["trafostanice"], summary["meters"], summary["instalirana_snaga"]) == (3, 4, 810.0)
@@ -0,0 +1,28 @@
+import pytest
+
+from pagination import PageRequest
+from search_index import RastavljacIndex
+
+def test_unknown_fields_are_rejected():
+    page = PageRequest.from_args({'fields': 'naziv, snga'})
+    with pytest.raises(ValueError, match='snga'):
+        page.check_fields(('naziv', 'snaga'))
+    with pytest.raises(ValueError, match='snga'):
+        page.select({'naziv': 0, 'snaga': 1})
+
+def test_layer_fields_are_trimmed():
+    index = RastavljacIndex([
+        {'type': 'Feature', 'properties': {'SIFRA': '1', 'DSN': 'A'}},
+        {'type': 'Feature', 'properties': {'SIFRA': '2', 'NTS_NAZIV': 'TS X'}},
+    ])
+    assert index.properties == {'SIFRA', 'DSN', 'NTS_NAZIV'}
+    page = PageRequest.from_args({'fields': 'SIFRA,NTS_NAZIV'})
+    page.check_fields(index.properties)
+    assert page.trim(index.features[0])['properties'] == {'SIFRA': '1', 'NTS_NAZIV': None}
+    PageRequest().check_fields(())
+
+def test_invalid_limits_get_one_message():
+    for limit in ('x', '1.5', '0', '100000'):
+        with pytest.raises(ValueError, match='^limit must be between 1 and 5000$'):
+            PageRequest.from_args({'limit': limit})
+    assert PageRequest.from_args({'limit': ' 20 '}).limit == 20
@@ -0,0 +1,32 @@
+import json
+
+from flask import Flask
+
+from response_cache import ENTRY_OVERHEAD, MAX_ENTRY_SHARE, ResponseCache
+
+app = Flask(__name__)
+
+def dumps(payload, separators):
+    return json.dumps(payload, separators=separators)
+
+def test_kept_bodies_are_gzipped_and_counted():
+    cache = ResponseCache(dumps, 'v1')
+    cached = cache.get('small', lambda: {"a": list(range(100))})
+    assert cached._gzipped is not None
+    assert cache.bytes == cached.size == len(cached.body) + len(cached.gzipped) + ENTRY_OVERHEAD
+    assert cache.get('small', lambda: None) is cached
+
+def test_bodies_too_large_to_keep_are_gzipped_only_on_request():
+    cache = ResponseCache(dumps, 'v1', max_bytes=4096)
+    build = lambda: b'[' + b'1,' * 4096 + b'1]\n'
+    with app.test_request_context(headers={'Accept-Encoding': 'identity'}):
+        response = cache.response('large', build)
+        assert 'Content-Encoding' not in response.headers
+        assert cache.get('large', build)._gzipped is None
+    assert cache.bytes == 0 and len(build()) > cache.max_bytes // MAX_ENTRY_SHARE
+
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        response = cache.response('large', build)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.get_etag()[0].endswith('-gz')
+    assert cache.bytes == 0
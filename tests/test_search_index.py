@@ -0,0 +1,37 @@
+from search_index import SubstringIndex
+
+NAMES = [
+    'TS 10/0,4 kV XIII (1035)',
+    'TS 35/10/0,4 kV ŽELJUŠA (E3)',
+    'TS 10/0,4 kV ČAŽANJ (3001)',
+    'ČAŽANJ 2',
+    'DV 35 kV Jablanica',
+]
+
+def test_designator_is_content_for_substring_matches():
+    index = SubstringIndex(NAMES)
+    # Every name starting with "TS" contains "ts", as before normalization
+    assert index.search('ts', limit=None) == [name for name in NAMES if name.startswith('TS')]
+    # "TS 35" is not "35", so "(1035)" does not match
+    assert index.search('TS 35', limit=None) == ['TS 35/10/0,4 kV ŽELJUŠA (E3)']
+
+def test_designator_is_optional_for_prefix_matches():
+    index = SubstringIndex(NAMES)
+    assert index.search('35/10', limit=None) == ['TS 35/10/0,4 kV ŽELJUŠA (E3)']
+    assert index.search('ts cazanj', limit=None) == ['ČAŽANJ 2']
+    assert index.search('35 kv', limit=None) == ['DV 35 kV Jablanica']
+
+def test_diacritics_and_case_are_folded():
+    index = SubstringIndex(NAMES)
+    assert index.search('zeljusa') == ['TS 35/10/0,4 kV ŽELJUŠA (E3)']
+    assert index.search('cazanj') == ['ČAŽANJ 2', 'TS 10/0,4 kV ČAŽANJ (3001)']
+
+def test_without_designators_keys_are_only_folded():
+    index = SubstringIndex(NAMES, designators=False)
+    assert index.search('35/10', limit=None) == ['TS 35/10/0,4 kV ŽELJUŠA (E3)']
+    assert index.prefix_ids('35/10') == []
+
+def test_designators_do_not_mix():
+    index = SubstringIndex(NAMES + ['DV ČAŽANJ'])
+    assert index.search('ts cazanj', limit=None) == ['ČAŽANJ 2']
+    assert index.search('TS 35', limit=None) == ['TS 35/10/0,4 kV ŽELJUŠA (E3)']
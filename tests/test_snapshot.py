@@ -0,0 +1,71 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+def meter_export():
+    """A few meters laid out like the export sheet; the last row repeats a meter."""
+    return pd.DataFrame({
+        ' Šifra ': [1001, 1002, 1003, 1004, 1002],
+        'Serijski': [5001, 5002, 5003, 5004, 5002],
+        'Tip': ['AM550', 'ME172', 'AM550', 'MT174', 'ME172'],
+        'Datum žc': pd.to_datetime(['2019-03-01', '2020-05-17', '2018-01-09', '2021-11-30', '2020-05-17']),
+        'Kupac': ['ANIĆ ANA', 'BABIĆ IVO', 'ČOLIĆ EMA', 'ĐURIĆ LEA', 'BABIĆ IVO'],
+        'T': [1, 2, 1, 'K', 2],
+        'A.sn': [17.25, 6.9, None, 11.04, 6.9],
+        'Naziv TS': ['TS POLJE 1', 'TS POLJE 1', 'TS BRIJEG', None, 'TS POLJE 1'],
+        'OJ': [302, 302, 303, 303, 302],
+        'OH': ['OH Jug', 'OH Jug', 'OH Sjever', 'OH Sjever', 'OH Jug'],
+    })
+
+def write_workbook(path, df):
+    # Five title rows and a blank one above the header, like the real export
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        pd.DataFrame({'title': ['x'] * 5}).to_excel(
+            writer, sheet_name='Eksport_uredjaja', index=False, header=False)
+        df.to_excel(writer, sheet_name='Eksport_uredjaja', index=False, startrow=6)
+
+def write_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(payload, file, ensure_ascii=False)
+
+def point(lon, lat, properties):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': properties}
+
+def write_sources(directory, df):
+    sources = {name: os.path.join(directory, path) for name, path in snapshot.SOURCE_FILES.items()}
+    write_workbook(sources['excel'], df)
+    write_json(sources['points'], {'type': 'FeatureCollection', 'features': [
+        point(17.8, 43.3, {'SIFRA': 1001}), point(17.81, 43.31, {'SIFRA': 1002.0}),
+        point(17.9, 43.4, {'SIFRA': 'x'})]})
+    write_json(sources['trafostanice'], {'type': 'FeatureCollection', 'features': [
+        point(17.8, 43.3, {'NAZIV': 'TS POLJE 1', 'SNAGA': 400})]})
+    write_json(sources['rastavljaci'], {'type': 'FeatureCollection', 'features': [
+        point(17.85, 43.35, {'SIFRA': '77', 'NTS_NAZIV': 'TS POLJE 1'})]})
+    return sources
+
+def test_snapshot_round_trip(tmp_path):
+    sources = write_sources(tmp_path, meter_export())
+    root = str(tmp_path / 'snapshot')
+    built = snapshot.build_snapshot(root, sources)
+
+    current = snapshot.read_current(root)
+    assert current.build_id == built.build_id == snapshot.read_current_id(root)
+    assert current.build_id == snapshot.compute_build_id(snapshot.source_fingerprint(sources))
+    assert current.is_fresh(sources)
+    pd.testing.assert_frame_equal(current.to_dataframe(),
+                                  snapshot.read_meter_export(sources['excel']))
+    coordinates = current.array('meters_coordinates')
+    assert coordinates[:2].tolist() == [[17.8, 43.3], [17.81, 43.31]]
+    assert np.isnan(coordinates[2:]).all()
+    assert snapshot.ensure_snapshot(root, sources).path == current.path
+
+    write_json(sources['rastavljaci'], {'type': 'FeatureCollection', 'features': []})
+    assert not current.is_fresh(sources)
+    rebuilt = snapshot.ensure_snapshot(root, sources)
+    assert rebuilt.build_id != current.build_id
+    assert rebuilt.geojson('rastavljaci') == {'type': 'FeatureCollection', 'features': []}
@@ -0,0 +1,33 @@
+import numpy as np
+
+from spatial import GridIndex, haversine_m
+
+def points_with_outliers(n=5000, seed=1):
+    rng = np.random.default_rng(seed)
+    coordinates = np.column_stack([rng.uniform(17.5, 18.5, n), rng.uniform(43.0, 44.0, n)])
+    coordinates[:3] = [[0.0, 0.0], [43.3, 17.8], [np.nan, np.nan]]
+    return coordinates
+
+def brute_bbox(coordinates, west, south, east, north):
+    lon, lat = coordinates[:, 0], coordinates[:, 1]
+    with np.errstate(invalid='ignore'):
+        return np.flatnonzero((lon >= west) & (lon <= east) & (lat >= south) & (lat <= north))
+
+def test_outliers_do_not_stretch_the_grid():
+    index = GridIndex(points_with_outliers())
+    # The service area keeps about POINTS_PER_CELL points per cell
+    assert index.cell_w < 0.1 and index.cell_h < 0.1
+    assert np.diff(index.offsets).max() < 100
+
+def test_bbox_and_nearest_match_a_scan():
+    coordinates = points_with_outliers()
+    index = GridIndex(coordinates)
+    for box in [(17.6, 43.1, 17.7, 43.2), (-1, -1, 1, 1), (43, 17, 44, 18), (-180, -90, 180, 90),
+                (18.45, 43.95, 20, 45), (10, 10, 11, 11)]:
+        ids, total = index.bbox(*box)
+        assert ids.tolist() == brute_bbox(coordinates, *box).tolist()
+        assert total == len(ids)
+
+    ids, distances = index.nearest(0.001, 0.001, k=1, radius_m=1000)
+    assert ids.tolist() == [0]
+    assert np.allclose(distances, haversine_m(0.001, 0.001, 0.0, 0.0))
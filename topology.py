@@ -0,0 +1,221 @@
+"""Supply topology: napojna TS → SN odlaz → trafostanica → meters.
+
+Built once at load time from the trafostanica features (NAPOJNA_TS,
+ODLAZ_SN_NAZIV), the rastavljač features (NTS_NAZIV, SNO_NAZIV) and the
+meters' Naziv TS.  Names are interned to integer node ids through a
+normalized key (whitespace collapsed, case folded, the " - old" suffix
+of archived records dropped), and edges are stored as CSR adjacency
+arrays in both directions, so traversals are breadth-first walks over
+numpy slices.
+
+An SN odlaz is identified by its supplying TS and its name, since the same
+feeder name can occur at two TS.  Rastavljači hang off the odlaz they are
+on; the exports do not record their order along the line.
+"""
+import re
+
+import numpy as np
+
+TS, FEEDER, RASTAVLJAC = 0, 1, 2
+KIND_NAMES = {TS: 'ts', FEEDER: 'feeder', RASTAVLJAC: 'rastavljac'}
+EMPTY_IDS = np.empty(0, dtype=np.int64)
+
+_SPACE = re.compile(r'\s+')
+_ARCHIVED = re.compile(r' - old$')
+
+def node_key(name):
+    """Normalized key of a TS or odlaz name, None for empty names."""
+    if name is None:
+        return None
+    key = _ARCHIVED.sub('', _SPACE.sub(' ', str(name)).strip())
+    return key.casefold() or None
+
+def _csr(sources, targets, size):
+    """Offsets and targets of the edges sorted by source."""
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    order = np.lexsort((targets, sources))
+    offsets = np.searchsorted(sources[order], np.arange(size + 1))
+    return offsets, targets[order]
+
+def _neighbours(offsets, targets, ids):
+    """Concatenated adjacency lists of ids."""
+    starts, ends = offsets[ids], offsets[ids + 1]
+    lengths = ends - starts
+    if not lengths.sum():
+        return EMPTY_IDS
+    shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return targets[np.arange(lengths.sum()) + shifts]
+
+class Topology:
+    """Interned supply graph with downstream and upstream traversals."""
+
+    def __init__(self, trafostanica_features, rastavljac_features, store, meter_groups):
+        self.names = []
+        self.kinds = []
+        # Feature index of each rastavljač node, -1 for other nodes
+        self.feature_index = []
+        self._ids = {}
+        self.feeders_by_name = {}
+        edges = []
+
+        for feature in trafostanica_features:
+            properties = feature.get('properties') or {}
+            ts = self._intern(TS, properties.get('NAZIV'))
+            napojna = self._intern(TS, properties.get('NAPOJNA_TS'))
+            feeder = self._feeder(napojna, properties.get('ODLAZ_SN_NAZIV'))
+            if feeder is not None and ts is not None:
+                edges.append((napojna, feeder))
+                edges.append((feeder, ts))
+
+        self.rastavljac_features = list(rastavljac_features)
+        for i, feature in enumerate(self.rastavljac_features):
+            properties = feature.get('properties') or {}
+            napojna = self._intern(TS, properties.get('NTS_NAZIV'))
+            feeder = self._feeder(napojna, properties.get('SNO_NAZIV'))
+            if feeder is not None:
+                edges.append((napojna, feeder))
+                edges.append((feeder, self._intern(RASTAVLJAC, properties.get('SIFRA') or f'#{i}', i)))
+
+        size = len(self.names)
+        self.kinds = np.array(self.kinds, dtype=np.int8)
+        self.feature_index = np.array(self.feature_index, dtype=np.int64)
+        edges = np.array(sorted(set(edges)), dtype=np.int64).reshape(-1, 2)
+        self.down_offsets, self.down_targets = _csr(edges[:, 0], edges[:, 1], size)
+        self.up_offsets, self.up_targets = _csr(edges[:, 1], edges[:, 0], size)
+
+        # Meters per TS node and the customer of each meter row, for
+        # quick outage estimates
+        self.meter_groups = meter_groups
+        self.customer_codes = store.group_codes('Kupac')[0]
+        self.meter_counts = np.zeros(size, dtype=np.int64)
+        self._ts_names = {}
+        for name, rows in meter_groups.by_ts.items():
+            node = self._ids.get((TS, node_key(name)))
+            if node is not None:
+                self.meter_counts[node] += len(rows)
+                self._ts_names.setdefault(node, []).append(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _intern(self, kind, name, feature_index=-1):
+        key = (kind, node_key(name)) if kind != RASTAVLJAC else (kind, feature_index)
+        if key[1] is None:
+            return None
+        node = self._ids.get(key)
+        if node is None:
+            node = self._ids[key] = len(self.names)
+            self.names.append(str(name).strip())
+            self.kinds.append(kind)
+            self.feature_index.append(feature_index)
+        elif kind == TS and self.names[node].endswith(' - old'):
+            # Prefer the current name over an archived spelling
+            self.names[node] = str(name).strip()
+        return node
+
+    def _feeder(self, napojna, name):
+        if napojna is None or node_key(name) is None:
+            return None
+        key = (FEEDER, (napojna, node_key(name)))
+        node = self._ids.get(key)
+        if node is None:
+            node = self._ids[key] = len(self.names)
+            self.names.append(_SPACE.sub(' ', str(name)).strip())
+            self.kinds.append(FEEDER)
+            self.feature_index.append(-1)
+            self.feeders_by_name.setdefault(node_key(name), []).append(node)
+        return node
+
+    # ============ LOOKUPS ============
+
+    def ts_node(self, name):
+        return self._ids.get((TS, node_key(name)))
+
+    def feeder_nodes(self, name, napojna=None):
+        """Odlaz nodes of a name, optionally only the one of a napojna TS."""
+        nodes = self.feeders_by_name.get(node_key(name), [])
+        if napojna is not None:
+            supplier = self.ts_node(napojna)
+            nodes = [node for node in nodes if supplier in self.upstream_of([node], depth=1)]
+        return nodes
+
+    # ============ TRAVERSALS ============
+
+    def _walk(self, offsets, targets, ids, depth=None):
+        seen = np.zeros(len(self.names), dtype=bool)
+        frontier = np.unique(np.asarray(ids, dtype=np.int64))
+        reached = []
+        level = 0
+        while len(frontier) and (depth is None or level < depth):
+            frontier = np.unique(_neighbours(offsets, targets, frontier))
+            frontier = frontier[~seen[frontier]]
+            seen[frontier] = True
+            reached.append(frontier)
+            level += 1
+        return np.unique(np.concatenate(reached)) if reached else EMPTY_IDS
+
+    def downstream_of(self, ids, depth=None):
+        """Nodes reachable downstream of ids (excluding ids), up to depth edges."""
+        return self._walk(self.down_offsets, self.down_targets, ids, depth)
+
+    def upstream_of(self, ids, depth=None):
+        return self._walk(self.up_offsets, self.up_targets, ids, depth)
+
+    def of_kind(self, ids, kind):
+        ids = np.asarray(ids, dtype=np.int64)
+        return ids[self.kinds[ids] == kind]
+
+    def ts_fed_from(self, napojna, recursive=False):
+        """TS supplied by a napojna TS: through its odlazi, or transitively."""
+        node = self.ts_node(napojna)
+        if node is None:
+            return None
+        reached = self.downstream_of([node], depth=None if recursive else 2)
+        return self.of_kind(reached, TS)
+
+    def ts_downstream_of_ts(self, name):
+        """The TS itself and every TS it supplies, directly or further down."""
+        node = self.ts_node(name)
+        if node is None:
+            return None
+        return np.union1d([node], self.ts_fed_from(name, recursive=True))
+
+    def ts_downstream_of_feeders(self, feeders):
+        """TS on the odlazi and everything they supply further down."""
+        return self.of_kind(self.downstream_of(feeders), TS)
+
+    def meter_rows(self, ts_ids):
+        """Meter rows of the TS nodes, in export order."""
+        parts = [self.meter_groups.by_ts[name]
+                 for node in np.asarray(ts_ids).tolist() for name in self._ts_names.get(node, ())]
+        return np.sort(np.concatenate(parts)) if parts else EMPTY_IDS
+
+    def affected(self, ts_ids):
+        """Meter rows of the TS nodes with their meter and customer counts."""
+        rows = self.meter_rows(ts_ids)
+        customers = np.unique(self.customer_codes[rows])
+        return rows, len(rows), int((customers >= 0).sum())
+
+    def isolating_rastavljaci(self, ts_name, upstream=False):
+        """Feeders supplying a TS and the rastavljači on them.
+
+        With ``upstream`` the odlazi feeding its napojna TS, and so on up,
+        are included.
+        """
+        node = self.ts_node(ts_name)
+        if node is None:
+            return None, None
+        feeders = self.of_kind(self.upstream_of([node], depth=None if upstream else 1), FEEDER)
+        rastavljaci = self.of_kind(self.downstream_of(feeders, depth=1), RASTAVLJAC)
+        return feeders, [self.rastavljac_features[i] for i in self.feature_index[rastavljaci].tolist()]
+
+    def describe(self, ids):
+        """Name and kind of each node, with the meter count of TS nodes."""
+        described = []
+        for node in np.asarray(ids).tolist():
+            item = {"name": self.names[node], "kind": KIND_NAMES[int(self.kinds[node])]}
+            if self.kinds[node] == TS:
+                item["meters"] = int(self.meter_counts[node])
+            described.append(item)
+        return described
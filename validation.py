@@ -0,0 +1,112 @@
+"""Data-quality checks of the meter export, run once per dataset load.
+
+The map endpoints only draw meters that data.json locates, so a group's
+map can silently show fewer meters than the export has.  ``DataQuality``
+finds, at load time, every meter with one of these issues:
+
+    unlocated           Šifra has no coordinates in data.json
+    orphan_ts           Naziv TS matches no trafostanica of the GeoJSON layer
+    duplicate_serijski  the Serijski is shared with another meter
+    outside_area        located outside the service area
+
+Each issue is a boolean mask over the store rows, so the counts of any
+selection of rows (``counts``) cost one indexed sum per issue, and the
+report of the whole export is built from the masks once.  The report lists
+at most ``REPORT_LIMIT`` duplicates and outliers; ``rows`` has them all.
+
+The service area is ``SERVICE_AREA`` ("west,south,east,north" in degrees)
+when set, otherwise the extent of the trafostanice widened by
+``SERVICE_AREA_MARGIN`` degrees on every side.
+"""
+import os
+
+import numpy as np
+
+ISSUES = ('unlocated', 'orphan_ts', 'duplicate_serijski', 'outside_area')
+SERVICE_AREA = os.environ.get('SERVICE_AREA')
+# About 11 km of latitude around the outermost trafostanice
+SERVICE_AREA_MARGIN = float(os.environ.get('SERVICE_AREA_MARGIN', '0.1'))
+REPORT_LIMIT = 100
+
+def service_area(trafostanica_to_info, margin=SERVICE_AREA_MARGIN, setting=SERVICE_AREA):
+    """(west, south, east, north) of the service area, or None if unknown."""
+    if setting:
+        west, south, east, north = (float(value) for value in setting.split(','))
+        return west, south, east, north
+    points = np.array([info['coordinates'][:2] for info in trafostanica_to_info.values()
+                       if len(info['coordinates'] or ()) >= 2], dtype=np.float64).reshape(-1, 2)
+    points = points[~np.isnan(points).any(axis=1)]
+    if not len(points):
+        return None
+    (west, south), (east, north) = points.min(axis=0), points.max(axis=0)
+    return (float(west - margin), float(south - margin),
+            float(east + margin), float(north + margin))
+
+class DataQuality:
+    """Rows of the meter store with each data-quality issue."""
+
+    def __init__(self, store, groups, trafostanica_to_info, area=None):
+        self.store = store
+        self.area = area if area is not None else service_area(trafostanica_to_info)
+        coordinates = np.asarray(store.coordinates)
+        unlocated = np.isnan(coordinates).any(axis=1)
+
+        # Names in the export without a trafostanica, with their meter counts
+        self.orphan_ts = {name: len(rows) for name, rows in groups.by_ts.items()
+                          if name not in trafostanica_to_info}
+        orphan_ts = np.zeros(len(store), dtype=bool)
+        for name in self.orphan_ts:
+            orphan_ts[groups.by_ts[name]] = True
+
+        serijski = np.asarray(store.serijski)
+        _, inverse, counts = np.unique(serijski, return_inverse=True, return_counts=True)
+        duplicate_serijski = counts[inverse] > 1
+
+        outside_area = np.zeros(len(store), dtype=bool)
+        if self.area is not None:
+            west, south, east, north = self.area
+            lon, lat = coordinates[:, 0], coordinates[:, 1]
+            with np.errstate(invalid='ignore'):
+                outside_area = ~unlocated & ((lon < west) | (lon > east) | (lat < south) | (lat > north))
+
+        self.masks = {
+            'unlocated': unlocated,
+            'orphan_ts': orphan_ts,
+            'duplicate_serijski': duplicate_serijski,
+            'outside_area': outside_area,
+        }
+        self.totals = {issue: int(mask.sum()) for issue, mask in self.masks.items()}
+
+    def rows(self, issue):
+        """Store rows with an issue, in export order; KeyError for unknown issues."""
+        return np.flatnonzero(self.masks[issue])
+
+    def counts(self, rows):
+        """Number of the given rows with each issue."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return {issue: int(np.count_nonzero(mask[rows])) for issue, mask in self.masks.items()}
+
+    def report(self, limit=REPORT_LIMIT):
+        """Totals of the whole export, the orphan TS names and the first
+        limit shared Serijski and outliers."""
+        store = self.store
+        duplicates = self.rows('duplicate_serijski')
+        by_serijski = {}
+        for serijski, sifra in zip(store.serijski[duplicates].tolist(), store.sifra[duplicates].tolist()):
+            by_serijski.setdefault(serijski, []).append(sifra)
+        outside = self.rows('outside_area')[:limit]
+        unlocated_by_oj = store.groups('OJ', self.rows('unlocated'))
+        return {
+            "meters": len(store),
+            "totals": self.totals,
+            "service_area": list(self.area) if self.area is not None else None,
+            "unlocated_by_oj": {str(oj): len(rows) for oj, rows in unlocated_by_oj.items()},
+            # Names may be numbers, so they are listed rather than used as keys
+            "orphan_ts": [{"naziv": name, "meters": meters} for name, meters in
+                          sorted(self.orphan_ts.items(), key=lambda item: (-item[1], str(item[0])))],
+            "duplicate_serijski": [{"serijski": serijski, "sifre": sifre}
+                                   for serijski, sifre in sorted(by_serijski.items())[:limit]],
+            "outside_area": [{"sifra": sifra, "coordinates": point}
+                             for sifra, point in zip(store.sifra[outside].tolist(),
+                                                     store.coordinates[outside].tolist())],
+        }